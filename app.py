@@ -1,9 +1,23 @@
-from flask import Flask, request, jsonify, render_template
+import os
+import time
+
+from flask import Flask, Response, g, request, jsonify, render_template
 # Import necessary modules for your application logic
-from modules.dataset_to_graph_from_json import build_graph_from_json
-from modules.graph_utils import dijkstra, get_shortest_path
-from modules.json_writer import write_results_json # This import seems unused in the provided routes
-from modules.product_filter_and_recommender import load_data, filter_products, recommend_products
+from modules.ann_index import IVFIndex, fingerprint
+from modules.catalog_store import CatalogStore
+from modules.dataset_to_graph_from_json import build_graph_from_data
+from modules.facets import FacetIndex
+from modules.filter_index import FilterIndex
+from modules.product import iter_json, load_product_records, product_record, to_json
+from modules.graph_utils import batch_shortest_paths, plan_shortest_path
+from modules.matching import DEFAULT_COMPARE_LIMIT, MatchIndex
+from modules.metrics import begin_request, current_trace, end_request, registry
+from modules.profiler import SamplingProfiler
+from modules.recommender_index import RecommenderIndex
+from modules.responses import (StaleCursor, compress_response, encode_cursor, etag, negotiate, not_modified,
+                               page_bounds, projection, query_key, stream_response)
+from modules.search_index import SearchIndex
+from modules.skyline import DEFAULT_TOP_K, FILTERS, SkylineIndex
 
 # Initialize the Flask app, specifying the templates folder
 # The 'templates' folder must exist in the same directory as this app.py file
@@ -11,7 +25,165 @@ app = Flask(__name__, template_folder="templates")
 
 # Define the path to your dataset.
 # Ensure this file exists at 'data/product_data_with_nodeid.json' relative to app.py
-DATASET_PATH = "data/product_data_with_nodeid.json"
+# (the CARTIQ_DATASET environment variable points the app at another catalog)
+DATASET_PATH = os.environ.get("CARTIQ_DATASET", "data/product_data_with_nodeid.json")
+
+# Upper bound on (start, end) pairs accepted by one /shortest-path/batch request
+MAX_BATCH_PAIRS = 1000
+
+# The catalog is parsed once into compact Product records and shared by every
+# route as an immutable snapshot. It is reloaded automatically when the dataset
+# file's mtime changes. Products added or changed through /products become new
+# versions of the snapshot with their indexes patched rather than rebuilt.
+catalog = CatalogStore(DATASET_PATH, loader=load_product_records, record=product_record)
+
+# Upper bound on products added, updated or removed by one /products request
+MAX_MUTATION_BATCH = 10000
+
+# Upper bound on /search's 'per_page'
+MAX_PER_PAGE = 1000
+
+# Prebuilt ANN index for approximate recommendations
+# (python -m modules.ann_index build <catalog> <index>); built in memory when
+# the file is missing or was built from a different catalog
+ANN_INDEX_PATH = os.environ.get("CARTIQ_ANN_INDEX", "data/recommender.ivf")
+
+# Per-stage timings and counters of each request are returned in a Server-Timing header
+# when enabled (off by default: they expose internals to every client)
+SERVER_TIMING = os.environ.get("CARTIQ_SERVER_TIMING", "0") == "1"
+
+# A request carrying this header is profiled with a sampling profiler and the
+# collapsed stacks (flamegraph.pl / speedscope input) are written to PROFILE_DIR.
+# Only honoured in debug mode or when CARTIQ_PROFILING=1.
+PROFILE_HEADER = "X-Profile"
+PROFILE_DIR = "profiles"
+PROFILING_ENABLED = os.environ.get("CARTIQ_PROFILING") == "1"
+
+# Each derived structure is built once per catalog snapshot. The patch functions
+# carry it over to the next version after a mutation, for the changed rows only.
+def _patch_rows(index, snapshot, delta):
+    return index.patched(snapshot.products, delta)
+
+def product_graph(snapshot):
+    # Implicit complete graph: per-product features are parsed once per snapshot
+    # and edge weights are computed on demand, so no O(n^2) edge list is stored
+    return snapshot.derived("graph", lambda snap: build_graph_from_data(snap.products, mode="implicit"),
+                            patch=_patch_rows)
+
+def filter_index(snapshot):
+    # Columnar filter index
+    return snapshot.derived("filter_index", lambda snap: FilterIndex(snap.products), patch=_patch_rows)
+
+def recommender_index(snapshot):
+    # Parsed recommender features
+    return snapshot.derived("recommender_index", lambda snap: RecommenderIndex(snap.products), patch=_patch_rows)
+
+def ann_index(snapshot):
+    # IVF index over the recommender's item vectors
+    def build(snap):
+        vectors = recommender_index(snap).item_vectors()
+        if os.path.exists(ANN_INDEX_PATH):
+            index = IVFIndex.load(ANN_INDEX_PATH)
+            if index.fingerprint == fingerprint(vectors):
+                return index
+        return IVFIndex.build(vectors)
+
+    def patch(index, snap, delta):
+        # The recommender is patched first (it was built first); when its
+        # normalization changed, every vector moved and the index is rebuilt
+        recommender = recommender_index(snap)
+        if recommender.rescaled:
+            return None
+        return index.patched(recommender.item_vectors(), delta.rows)
+    return snapshot.derived("ann_index", build, patch=patch)
+
+def search_index(snapshot):
+    # Inverted text index
+    return snapshot.derived("search_index", lambda snap: SearchIndex(snap.products), patch=_patch_rows)
+
+def skyline_index(snapshot):
+    # Pareto frontiers per category over the filter index's columns, cached per filter signature
+    return snapshot.derived("skyline_index", lambda snap: SkylineIndex(snap.products, filter_index(snap)),
+                            patch=lambda index, snap, delta: index.patched(snap.products, delta, filter_index(snap)))
+
+def facet_index(snapshot):
+    # Bitmaps per facet value over the filter index's columns
+    return snapshot.derived("facet_index", lambda snap: FacetIndex(snap.products, filter_index(snap)),
+                            patch=lambda index, snap, delta: index.patched(snap.products, delta, filter_index(snap)))
+
+def match_index(snapshot):
+    # Clusters of listings that are probably the same product, for price comparison
+    return snapshot.derived("match_index", lambda snap: MatchIndex(snap.products), patch=_patch_rows)
+
+def warm_up(snapshot):
+    """
+    Builds every derived structure of `snapshot` and fills the caches built
+    lazily on first use (item vectors, the unfiltered Pareto frontiers,
+    product clusters), so no request pays for them. Returns the structures.
+    """
+    structures = [
+        snapshot.positions(),
+        product_graph(snapshot),
+        filter_index(snapshot),
+        recommender_index(snapshot),
+        ann_index(snapshot),
+        search_index(snapshot),
+        skyline_index(snapshot),
+        facet_index(snapshot),
+        match_index(snapshot),
+    ]
+    recommender_index(snapshot).item_vectors()
+    skyline_index(snapshot).frontiers()
+    match_index(snapshot).groups()
+    return structures
+
+@app.before_request
+def start_request_metrics():
+    g.metrics_token = begin_request()
+    if PROFILE_HEADER in request.headers and (PROFILING_ENABLED or app.debug):
+        g.profiler = SamplingProfiler().start()
+
+def _request_route():
+    return request.url_rule.rule if request.url_rule is not None else "unmatched"
+
+def _finish_profile():
+    # Stops the request's profiler, if any, and returns the path its stacks were written to
+    profiler = g.pop("profiler", None)
+    if profiler is None:
+        return None
+    profiler.stop()
+    route = _request_route().strip("/").replace("/", "_") or "root"
+    name = f"{time.strftime('%Y%m%d-%H%M%S')}-{route}-{id(profiler):x}.folded"
+    return profiler.write(os.path.join(PROFILE_DIR, name))
+
+@app.after_request
+def finish_request_metrics(response):
+    profile = _finish_profile()
+    if profile is not None:
+        response.headers["X-Profile-File"] = profile
+    trace = current_trace()
+    if trace is None:
+        return response
+    route = _request_route()
+    registry.observe("request_seconds", trace.elapsed(), method=request.method, route=route,
+                     status=str(response.status_code))
+    if SERVER_TIMING:
+        response.headers["Server-Timing"] = trace.server_timing()
+    return response
+
+@app.after_request
+def compress(response):
+    # Large buffered responses are gzip (or brotli) compressed when the client accepts it
+    return compress_response(response, negotiate(request)[0])
+
+@app.teardown_request
+def reset_request_metrics(exc):
+    # Runs even when an unhandled exception skipped after_request, so the
+    # profiler's sampler thread is always stopped
+    _finish_profile()
+    token = g.pop("metrics_token", None)
+    if token is not None:
+        end_request(token)
 
 # This route serves your main HTML page (the frontend UI)
 @app.route("/")
@@ -22,26 +194,89 @@ def home():
     """
     return render_template("index.html")
 
-@app.route("/filter", methods=["POST"])
+def _positive_int(value, name):
+    # A page number or size from a request; ValueError unless it is a whole number >= 1
+    if isinstance(value, bool) or (isinstance(value, float) and not value.is_integer()):
+        raise ValueError(f"'{name}' must be a positive integer")
+    try:
+        number = int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"'{name}' must be a positive integer")
+    if number < 1:
+        raise ValueError(f"'{name}' must be a positive integer")
+    return number
+
+def _list_query():
+    """
+    Criteria of a /filter or /search request: the JSON body of a POST, or
+    the query string of a GET, where 'fields' is comma-separated
+    (?fields=node_id,price). Only GET requests can be answered 304 Not
+    Modified, so clients caching a query use the GET form.
+    """
+    if request.method == "POST":
+        return request.json
+    query = request.args.to_dict()
+    if "fields" in query:
+        query["fields"] = [f for value in request.args.getlist("fields") for f in value.split(",") if f]
+    return query
+
+def _product_list(route, data, tag, encoding, json_lines, page, total, offset, limit, version):
+    """
+    Response for one page of a product list: a JSON array, or JSON Lines
+    streamed in chunks when the client accepts them. Products are trimmed to
+    the request's 'fields'; X-Total-Count holds the number of results and
+    X-Next-Cursor, when there are more, the cursor of the next page of
+    catalog `version`.
+    """
+    project = projection(data.get("fields"))
+    items = iter_json(page)
+    if project is not None:
+        items = map(project, items)
+    if json_lines:
+        response = stream_response(items, encoding)
+    else:
+        response = jsonify(list(items))
+    response.set_etag(tag)
+    response.vary.add("Accept")
+    response.headers["X-Total-Count"] = str(total)
+    if limit is not None and offset + limit < total:
+        response.headers["X-Next-Cursor"] = encode_cursor(query_key(route, data), offset + limit, version)
+    return response
+
+@app.route("/filter", methods=["GET", "POST"])
 def filter_products_route():
     """
-    Filters products based on criteria received in the POST request.
-    It loads all product data, applies the filters, and returns
-    the filtered list as a JSON response.
+    Filters products based on criteria received in the POST request (or the
+    query string of a GET). It answers the filters from the catalog
+    snapshot's columnar filter index and returns the filtered list as a
+    JSON response.
+    With 'limit', one page is returned and the X-Next-Cursor header holds the
+    'cursor' of the next; 'fields' limits the fields returned per product.
     """
-    data = request.json
+    data = _list_query()
     try:
-        # Assuming load_data, filter_products are defined in modules.product_filter_and_recommender
-        all_data = load_data(DATASET_PATH)
-        filtered = filter_products(
-            all_data,
+        snapshot = catalog.snapshot()
+        encoding, json_lines = negotiate(request)
+        tag = etag("/filter", snapshot.version, data, encoding, json_lines)
+        cached = not_modified(request, tag)
+        if cached is not None:
+            return cached
+        offset, limit = page_bounds(data, query_key("/filter", data), snapshot.version)
+        filtered = filter_index(snapshot).filter(
+            snapshot.products,
             min_price=data.get("min_price"),
             max_price=data.get("max_price"),
             min_rating=data.get("min_rating"),
             min_reviews=data.get("min_reviews"),
             max_delivery_days=data.get("max_delivery_days")
         )
-        return jsonify(filtered)
+        page = filtered[offset:] if limit is None else filtered[offset:offset + limit]
+        return _product_list("/filter", data, tag, encoding, json_lines, page, len(filtered), offset, limit,
+                             snapshot.version)
+    except StaleCursor as e:
+        return jsonify({"error": str(e)}), 410
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         # Catch any exceptions during filtering and return an error message
         return jsonify({"error": f"Error filtering products: {str(e)}"}), 500
@@ -50,25 +285,158 @@ def filter_products_route():
 def recommend_products_route():
     """
     Recommends products based on user preferences received in the POST request.
-    It loads all product data, applies recommendation logic, and returns
-    a list of recommended products as a JSON response.
+    It scores the catalog snapshot's cached recommender features, selects the
+    top matches, and returns a list of recommended products as a JSON response.
+    With "approximate": true, products are ranked catalog-wide through the ANN
+    index instead; an optional "nprobe" trades latency for recall.
     """
     prefs = request.json
     try:
-        # Assuming load_data, recommend_products are defined in modules.product_filter_and_recommender
-        all_data = load_data(DATASET_PATH)
-        recs = recommend_products(all_data, prefs, top_n=5)
-        return jsonify(recs)
+        snapshot = catalog.snapshot()
+        index = recommender_index(snapshot)
+        if prefs.get("approximate"):
+            recs = index.recommend_nearest(snapshot.products, prefs, top_n=5,
+                                           ann=ann_index(snapshot), nprobe=prefs.get("nprobe"))
+        else:
+            recs = index.recommend(snapshot.products, prefs, top_n=5)
+        return jsonify(to_json(recs))
     except Exception as e:
         # Catch any exceptions during recommendation and return an error message
         return jsonify({"error": f"Error recommending products: {str(e)}"}), 500
 
+@app.route("/facets", methods=["POST"])
+def facet_counts():
+    """
+    Counts products per facet value for the current query: per platform,
+    category, brand, RAM, Storage and Processor value and per price and
+    seller_rating bucket. Accepts the /filter criteria, 'selected' facet
+    values ({"brand": ["Apple", "HP"], "price": ["500-1000"]}; values of one
+    facet are alternatives) and optionally the 'facets' to count. Returns
+    the number of matching products and, per facet, its values with counts.
+    """
+    data = request.json or {}
+    selected = data.get("selected") or {}
+    if not (isinstance(selected, dict) and all(isinstance(values, list) for values in selected.values())):
+        return jsonify({"error": "'selected' must map facets to lists of values"}), 400
+    facets = data.get("facets")
+    if facets is not None and not isinstance(facets, list):
+        return jsonify({"error": "'facets' must be a list of facet names"}), 400
+
+    try:
+        snapshot = catalog.snapshot()
+        total, counts = facet_index(snapshot).counts(
+            selected=selected,
+            facets=facets,
+            **{name: data.get(name) for name in FILTERS},
+        )
+        return jsonify({
+            "total": total,
+            "facets": {name: [{"value": value, "count": n} for value, n in pairs] for name, pairs in counts.items()},
+        })
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": f"Error counting facets: {str(e)}"}), 500
+
+@app.route("/best-deals", methods=["POST"])
+def best_deals():
+    """
+    Ranks the Pareto-optimal offers of each category: products no other
+    product beats on price, seller rating and delivery time at once.
+    Accepts the /filter criteria, an optional 'category', 'weights' for
+    "price", "seller_rating" and "delivery" (equal by default) and 'top_k'.
+    Returns, per category, the frontier size and the top_k frontier products
+    by weighted score.
+    """
+    data = request.json or {}
+    try:
+        top_k = int(data.get("top_k", DEFAULT_TOP_K))
+    except (TypeError, ValueError):
+        return jsonify({"error": "'top_k' must be an integer"}), 400
+    weights = data.get("weights")
+    if weights is not None and not (isinstance(weights, dict)
+                                    and all(isinstance(w, (int, float)) for w in weights.values())):
+        return jsonify({"error": "'weights' must map objectives to numbers"}), 400
+
+    try:
+        snapshot = catalog.snapshot()
+        ranked = skyline_index(snapshot).rank(
+            filters={name: data.get(name) for name in FILTERS},
+            weights=weights,
+            top_k=top_k,
+            category=data.get("category"),
+        )
+        return jsonify({
+            category: {
+                "frontier_size": frontier_size,
+                "results": [{"score": score, "product": to_json([snapshot.products[row]])[0]} for row, score in best],
+            }
+            for category, (frontier_size, best) in ranked.items()
+        })
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": f"Error ranking products: {str(e)}"}), 500
+
+def _offers(snapshot, rows):
+    # A cluster's listings as JSON, cheapest first
+    rows = sorted(rows.tolist(), key=lambda row: (snapshot.products[row].get("price", 0), row))
+    return to_json([snapshot.products[row] for row in rows])
+
+@app.route("/compare", methods=["POST"])
+def compare_products():
+    """
+    Groups listings of the same product across platforms.
+    With a 'node_id', returns that product's cluster: every listing judged
+    the same product (same category and brand, matching specs), cheapest
+    first. Otherwise lists the clusters offered on at least two platforms,
+    optionally of one 'category' and / or 'brand', the largest price
+    difference first, paginated with 'offset' and 'limit'.
+    """
+    data = request.json or {}
+    try:
+        offset = int(data.get("offset", 0))
+        limit = int(data.get("limit", DEFAULT_COMPARE_LIMIT))
+    except (TypeError, ValueError):
+        return jsonify({"error": "'offset' and 'limit' must be integers"}), 400
+
+    try:
+        snapshot = catalog.snapshot()
+        index = match_index(snapshot)
+        node_id = data.get("node_id")
+        if node_id is not None:
+            position = snapshot.positions().get(node_id)
+            if position is None:
+                return jsonify({"error": f"Unknown product: {node_id}"}), 404
+            offers = _offers(snapshot, index.cluster(position))
+            return jsonify({
+                "node_id": node_id,
+                "platforms": sorted({offer.get("platform") for offer in offers if offer.get("platform")}),
+                "offers": offers,
+            })
+
+        total, page = index.comparisons(category=data.get("category"), brand=data.get("brand"),
+                                        offset=offset, limit=limit)
+        return jsonify({
+            "total": total,
+            "comparisons": [
+                {"lowest_price": low, "highest_price": high, "offers": _offers(snapshot, rows)}
+                for rows, low, high in page
+            ],
+        })
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": f"Error comparing products: {str(e)}"}), 500
+
 @app.route("/shortest-path", methods=["POST"])
 def shortest_path():
     """
     Calculates the shortest path between two product nodes in a graph.
-    It builds a graph from the dataset, uses Dijkstra's algorithm,
-    and returns the path and total cost as a JSON response.
+    It uses the implicit graph of the current catalog snapshot and lets the
+    query planner pick a strategy (the direct edge, since the catalog weight
+    is a metric), and returns the path, total cost and strategy as a JSON
+    response.
     Assumes 'start' and 'end' node IDs are provided in the request JSON.
     """
     data = request.json
@@ -81,46 +449,215 @@ def shortest_path():
         return jsonify({"error": "Missing 'start' or 'end' node in request"}), 400
 
     try:
-        # Assuming build_graph_from_json, dijkstra, get_shortest_path are defined in respective modules
-        graph = build_graph_from_json(DATASET_PATH)
-        distances, previous = dijkstra(graph, start_node)
-        path = get_shortest_path(previous, start_node, end_node)
-        
+        snapshot = catalog.snapshot()
+        graph = product_graph(snapshot)
+        path, total_cost, strategy = plan_shortest_path(graph, start_node, end_node)
+
         # Check if a path was found
-        total_cost = distances.get(end_node)
-        if path is None or total_cost is None:
+        if not path or total_cost is None:
             return jsonify({"path": [], "total_cost": "N/A", "message": "No path found between specified nodes"}), 404
 
         return jsonify({
             "path": path,
-            "total_cost": total_cost
+            "total_cost": total_cost,
+            "strategy": strategy
         })
     except Exception as e:
         # Catch any exceptions during shortest path calculation and return an error message
         return jsonify({"error": f"Error calculating shortest path: {str(e)}"}), 500
 
-@app.route("/search", methods=["POST"])
-def search_product():
+@app.route("/shortest-path/batch", methods=["POST"])
+def shortest_path_batch():
+    """
+    Answers many shortest-path queries in one request.
+    Expects {"pairs": [{"start": ..., "end": ...}, ...]} and returns one result
+    per pair, in order. Pairs sharing a start node share one search, and
+    searches for different start nodes run in parallel worker processes.
+    """
+    data = request.json
+    pairs = data.get("pairs") if isinstance(data, dict) else None
+    if not isinstance(pairs, list) or not all(isinstance(p, dict) and p.get("start") and p.get("end") for p in pairs):
+        return jsonify({"error": "Expected 'pairs' as a list of {'start', 'end'} objects"}), 400
+    if len(pairs) > MAX_BATCH_PAIRS:
+        return jsonify({"error": f"At most {MAX_BATCH_PAIRS} pairs per request"}), 400
+
     try:
-        data = request.json
-        query = data.get("query", "").lower()
+        graph = product_graph(catalog.snapshot())
+        answers = batch_shortest_paths(graph, [(p["start"], p["end"]) for p in pairs])
+        results = []
+        for pair, (path, total_cost, strategy) in zip(pairs, answers):
+            results.append({
+                "start": pair["start"],
+                "end": pair["end"],
+                "path": path,
+                "total_cost": total_cost if total_cost is not None else "N/A",
+                "strategy": strategy
+            })
+        return jsonify({"results": results})
+    except Exception as e:
+        return jsonify({"error": f"Error calculating shortest paths: {str(e)}"}), 500
 
-        all_data = load_data(DATASET_PATH)
+@app.route("/search", methods=["GET", "POST"])
+def search_product():
+    """
+    Searches the catalog snapshot's inverted index. Products whose name, brand
+    or category contain the query still match; other text fields match by
+    word or word prefix. Results are ranked (BM25) and can be paged with
+    optional 'page' (1-based) and 'per_page' values, or with 'limit' and the
+    'cursor' from the previous page's X-Next-Cursor header; the total number
+    of matches is returned in the X-Total-Count header. 'fields' limits the
+    fields returned per product. A GET takes the same values in its query string.
+    """
+    try:
+        data = _list_query()
+        query = data.get("query", "")
+        page = data.get("page")
+        per_page = data.get("per_page")
 
-        # Match against product name, brand, or category
-        matched = [
-            p for p in all_data
-            if query in p.get("product_name", "").lower()
-            or query in p.get("brand", "").lower()
-            or query in p.get("category", "").lower()
-        ]
+        snapshot = catalog.snapshot()
+        encoding, json_lines = negotiate(request)
+        tag = etag("/search", snapshot.version, data, encoding, json_lines)
+        cached = not_modified(request, tag)
+        if cached is not None:
+            return cached
+        if page is not None and per_page is not None:
+            page, per_page = _positive_int(page, "page"), _positive_int(per_page, "per_page")
+            if per_page > MAX_PER_PAGE:
+                raise ValueError(f"'per_page' must be at most {MAX_PER_PAGE}")
+            offset, limit = (page - 1) * per_page, per_page
+        else:
+            offset, limit = page_bounds(data, query_key("/search", data), snapshot.version)
+        doc_ids, total = search_index(snapshot).search(query, offset=offset, limit=limit)
 
-        return jsonify(matched)
+        return _product_list("/search", data, tag, encoding, json_lines,
+                             [snapshot.products[i] for i in doc_ids], total, offset, limit, snapshot.version)
+    except StaleCursor as e:
+        return jsonify({"error": str(e)}), 410
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": f"Error searching product: {str(e)}"}), 500
 
+def _mutate(**changes):
+    # Applies one batch of product mutations and reports the new catalog version
+    if app.config.get("CATALOG_READ_ONLY"):
+        # Worker processes each hold their own catalog and would diverge
+        return jsonify({"error": "The catalog is read-only in multi-process mode; update the dataset file"}), 409
+    batch = sum(len(value) for value in changes.values())
+    if batch > MAX_MUTATION_BATCH:
+        return jsonify({"error": f"At most {MAX_MUTATION_BATCH} products per request"}), 400
+    try:
+        snapshot = catalog.apply(**changes)
+    except KeyError as e:
+        return jsonify({"error": f"Unknown product: {e.args[0]}"}), 404
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": f"Error updating catalog: {str(e)}"}), 500
+    return jsonify({
+        "version": snapshot.version,
+        "products": len(snapshot.products),
+        **{kind: len(value) for kind, value in changes.items()},
+    }), 201 if "added" in changes else 200
+
+@app.route("/products/<node_id>", methods=["GET"])
+def get_product(node_id):
+    """
+    Returns one product of the current catalog snapshot by node id.
+    """
+    try:
+        snapshot = catalog.snapshot()
+        position = snapshot.positions().get(node_id)
+        if position is None:
+            return jsonify({"error": f"Unknown product: {node_id}"}), 404
+        return jsonify(to_json([snapshot.products[position]])[0])
+    except Exception as e:
+        return jsonify({"error": f"Error reading product: {str(e)}"}), 500
+
+@app.route("/products", methods=["POST"])
+def add_products():
+    """
+    Adds products to the catalog. Expects one product object, or
+    {"products": [...]} to add several in one new catalog version.
+    """
+    data = request.json
+    products = data.get("products", [data]) if isinstance(data, dict) else None
+    if not isinstance(products, list):
+        return jsonify({"error": "Expected a product object or {'products': [...]}"}), 400
+    return _mutate(added=products)
+
+@app.route("/products", methods=["PATCH"])
+def update_products():
+    """
+    Updates many products in one new catalog version. Expects
+    {"updates": {node_id: {field: value, ...}, ...}}; a null value removes the
+    field. Price and stock feeds should batch their changes through this route.
+    """
+    data = request.json
+    updates = data.get("updates") if isinstance(data, dict) else None
+    if not isinstance(updates, dict):
+        return jsonify({"error": "Expected 'updates' as an object of {node_id: fields}"}), 400
+    return _mutate(updated=updates)
+
+@app.route("/products/<node_id>", methods=["PATCH"])
+def update_product(node_id):
+    """
+    Updates the fields of one product given in the request body (JSON merge
+    patch: a null value removes the field).
+    """
+    fields = request.json
+    if not isinstance(fields, dict):
+        return jsonify({"error": "Expected an object of fields"}), 400
+    return _mutate(updated={node_id: fields})
+
+@app.route("/products", methods=["DELETE"])
+def remove_products():
+    """
+    Removes many products in one new catalog version. Expects {"node_ids": [...]}.
+    """
+    data = request.json
+    node_ids = data.get("node_ids") if isinstance(data, dict) else None
+    if not isinstance(node_ids, list):
+        return jsonify({"error": "Expected 'node_ids' as a list"}), 400
+    return _mutate(removed=node_ids)
+
+@app.route("/products/<node_id>", methods=["DELETE"])
+def remove_product(node_id):
+    """
+    Removes one product from the catalog.
+    """
+    return _mutate(removed=[node_id])
+
+@app.route("/catalog", methods=["GET"])
+def catalog_stats():
+    """
+    Reports the loaded catalog version, product count, load time and
+    approximate in-memory size of the current snapshot.
+    """
+    try:
+        return jsonify(catalog.stats())
+    except Exception as e:
+        return jsonify({"error": f"Error reading catalog: {str(e)}"}), 500
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    """
+    Prometheus text exposition of the stage latency histograms, request
+    latency by route, hot-path counters (rows scanned, edges relaxed, heap
+    pushes, cache hits) and catalog gauges.
+    """
+    try:
+        snapshot = catalog.snapshot()
+        registry.set_gauge("catalog_version", snapshot.version)
+        registry.set_gauge("catalog_products", len(snapshot.products))
+        return Response(registry.render(), mimetype="text/plain; version=0.0.4")
+    except Exception as e:
+        return jsonify({"error": f"Error collecting metrics: {str(e)}"}), 500
+
 if __name__ == "__main__":
     try:
+        # Load the catalog once at startup so the first request does not pay for it
+        catalog.snapshot()
         # Run the Flask application in debug mode for development.
         # This automatically reloads the server on code changes and provides a debugger.
         app.run(debug=True)
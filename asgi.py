@@ -0,0 +1,38 @@
+import sys
+
+from app import app, catalog
+from modules.async_gateway import AsyncGateway
+
+# Routes whose work is CPU-heavy (path search, recommender scoring). They get
+# their own bounded pool so they cannot hold up /search and /filter.
+HEAVY_ROUTES = {"/shortest-path", "/shortest-path/batch", "/recommend"}
+
+HEAVY_WORKERS = 4
+LIGHT_WORKERS = 8
+# Requests running or queued per pool before new ones are turned away with 503
+MAX_PENDING = 64
+# Seconds a request may wait for its result before it is answered with 504
+REQUEST_TIMEOUT = 30.0
+
+# ASGI entry point serving the same routes as app.py, e.g.
+#   uvicorn asgi:application
+#   hypercorn asgi:application
+application = AsyncGateway(
+    app,
+    heavy_routes=HEAVY_ROUTES,
+    coalesced_routes=HEAVY_ROUTES,
+    heavy_workers=HEAVY_WORKERS,
+    light_workers=LIGHT_WORKERS,
+    max_pending=MAX_PENDING,
+    timeout=REQUEST_TIMEOUT,
+    startup=catalog.snapshot,
+)
+
+if __name__ == "__main__":
+    try:
+        import uvicorn
+    except ImportError:
+        print("The async serving mode needs an ASGI server: pip install uvicorn")
+        print("(or run it with any other ASGI server, e.g. hypercorn asgi:application)")
+        sys.exit(1)
+    uvicorn.run(application, host="127.0.0.1", port=5000)
@@ -0,0 +1,149 @@
+"""
+Benchmark suite for the catalog hot paths.
+
+    python -m benchmarks generate 100k data/catalog_100k.json
+    python -m benchmarks run --sizes 1k,10k --out bench_results.json
+    python -m benchmarks run --sizes 1k,10k --baseline benchmarks/baseline.json
+    python -m benchmarks compare bench_results.json benchmarks/baseline.json
+
+`run` generates (and caches) a deterministic catalog per size, then runs each
+suite in a fresh process so peak RSS is measured per suite and size:
+  micro - module functions (loading, graph building, paths, filter, recommend, search)
+  e2e   - the Flask routes through the test client
+With --baseline, the run is compared against the stored results and exits
+with status 1 when a benchmark regressed.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.compare import TOLERANCE, compare, format_report, load_results
+from benchmarks.generator import parse_size, write_catalog
+
+SUITES = ("micro", "e2e")
+DEFAULT_SIZES = "1k,10k"
+DEFAULT_REPEAT = 20
+DEFAULT_DATA_DIR = os.path.join(tempfile.gettempdir(), "cartiq-bench")
+
+
+def catalog_path(data_dir, size, seed):
+    # Generated catalogs are reused across runs; the seed is part of the name
+    os.makedirs(data_dir, exist_ok=True)
+    path = os.path.join(data_dir, f"catalog_{size}_seed{seed}.json")
+    if not os.path.exists(path):
+        write_catalog(path + ".tmp", size, seed)
+        os.replace(path + ".tmp", path)
+    return path
+
+
+def run_suite(suite, path, size, repeat, seed):
+    # Runs in the child process; results are printed as JSON on stdout
+    from benchmarks.harness import run_benchmarks
+    from benchmarks.micro import MICRO_BENCHMARKS, BenchContext
+
+    ctx = BenchContext(path, size, seed)
+    if suite == "micro":
+        results = run_benchmarks(MICRO_BENCHMARKS, ctx, size, repeat)
+    else:
+        from benchmarks.e2e import run_e2e
+        results = run_e2e(ctx, repeat)
+    for result in results:
+        result["suite"] = suite
+    return results
+
+
+def run(args):
+    sizes = [parse_size(s) for s in args.sizes.split(",")]
+    suites = args.suites.split(",")
+    document = {
+        "meta": {
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "seed": args.seed,
+            "repeat": args.repeat,
+        },
+        "results": [],
+    }
+    for size in sizes:
+        path = catalog_path(args.data_dir, size, args.seed)
+        for suite in suites:
+            print(f"[{suite}] {size} products ...", file=sys.stderr)
+            env = dict(os.environ, CARTIQ_DATASET=path)
+            output = subprocess.run(
+                [sys.executable, "-m", "benchmarks", "_suite", suite, path, str(size), str(args.repeat), str(args.seed)],
+                env=env, check=True, stdout=subprocess.PIPE, text=True,
+            ).stdout
+            document["results"].extend(json.loads(output))
+
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(document, f, indent=2)
+        print(f"Results written to {args.out}", file=sys.stderr)
+    else:
+        print(json.dumps(document, indent=2))
+
+    if args.baseline:
+        rows = compare(document, load_results(args.baseline), args.tolerance)
+        print(format_report(rows), file=sys.stderr)
+        return 1 if any(row["status"] == "regressed" for row in rows) else 0
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="CartIQ benchmark suite")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    generate = commands.add_parser("generate", help="write a synthetic catalog")
+    generate.add_argument("size", help="product count: 1k, 10k, 100k, 1M or a number")
+    generate.add_argument("out")
+    generate.add_argument("--seed", type=int, default=0)
+    generate.add_argument("--format", choices=("json", "jsonl"), default="json")
+
+    run_parser = commands.add_parser("run", help="run benchmark suites")
+    run_parser.add_argument("--sizes", default=DEFAULT_SIZES, help="comma-separated sizes (default: %(default)s)")
+    run_parser.add_argument("--suites", default=",".join(SUITES), help="comma-separated suites (default: %(default)s)")
+    run_parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT, help="timed calls per benchmark")
+    run_parser.add_argument("--seed", type=int, default=0)
+    run_parser.add_argument("--data-dir", default=DEFAULT_DATA_DIR, help="where generated catalogs are cached")
+    run_parser.add_argument("--out", help="write results JSON here instead of stdout")
+    run_parser.add_argument("--baseline", help="results JSON to compare against")
+    run_parser.add_argument("--tolerance", type=float, default=TOLERANCE)
+
+    compare_parser = commands.add_parser("compare", help="compare two results files")
+    compare_parser.add_argument("results")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("--tolerance", type=float, default=TOLERANCE)
+
+    suite = commands.add_parser("_suite")
+    suite.add_argument("suite", choices=SUITES)
+    suite.add_argument("path")
+    suite.add_argument("size", type=int)
+    suite.add_argument("repeat", type=int)
+    suite.add_argument("seed", type=int)
+
+    args = parser.parse_args(argv)
+    if args.command == "generate":
+        write_catalog(args.out, parse_size(args.size), args.seed, args.format)
+        return 0
+    if args.command == "run":
+        return run(args)
+    if args.command == "compare":
+        rows = compare(load_results(args.results), load_results(args.baseline), args.tolerance)
+        print(format_report(rows))
+        return 1 if any(row["status"] == "regressed" for row in rows) else 0
+    print(json.dumps(run_suite(args.suite, args.path, args.size, args.repeat, args.seed)))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,67 @@
+import json
+
+# Relative slowdown (or RSS growth) tolerated before a result counts as a regression
+TOLERANCE = 0.25
+# Latencies below this are dominated by timer noise and only reported,
+# as are single-run (cold start) timings
+NOISE_FLOOR_MS = 0.05
+
+# Tail percentiles are recorded but too noisy at a few dozen runs to gate on
+COMPARED_METRICS = ("p50_ms", "peak_rss_mb")
+
+
+def load_results(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def _key(result):
+    return (result["suite"], result["size"], result["name"])
+
+
+def compare(results, baseline, tolerance=TOLERANCE):
+    """
+    Compares two result documents benchmark by benchmark and returns one row
+    per current result: {"suite", "size", "name", "status", "changes"}.
+    status is "regressed" when any of COMPARED_METRICS grew by more than
+    `tolerance`, "new" when the baseline has no such benchmark, "skipped"
+    when it did not run, and "ok" otherwise. changes maps each compared
+    metric to (baseline, current, relative change).
+    """
+    base = {_key(r): r for r in baseline["results"]}
+    rows = []
+    for result in results["results"]:
+        row = {"suite": result["suite"], "size": result["size"], "name": result["name"], "changes": {}}
+        previous = base.get(_key(result))
+        if "skipped" in result:
+            row["status"] = "skipped"
+        elif previous is None or "skipped" in previous:
+            row["status"] = "new"
+        else:
+            row["status"] = "ok"
+            for metric in COMPARED_METRICS:
+                old, new = previous.get(metric), result.get(metric)
+                if old is None or new is None or old <= 0:
+                    continue
+                change = (new - old) / old
+                row["changes"][metric] = (old, new, change)
+                if metric.endswith("_ms") and (old < NOISE_FLOOR_MS or result.get("runs", 0) < 2):
+                    # Timer noise, or a single cold-start sample
+                    continue
+                if change > tolerance:
+                    row["status"] = "regressed"
+        rows.append(row)
+    return rows
+
+
+def format_report(rows):
+    lines = [f"{'status':<10} {'suite':<6} {'size':>8}  {'benchmark':<28} {'p50 ms (base -> now)':>26} {'rss MB':>16}"]
+    for row in rows:
+        p50 = row["changes"].get("p50_ms")
+        rss = row["changes"].get("peak_rss_mb")
+        p50_text = f"{p50[0]:.3f} -> {p50[1]:.3f} ({p50[2]:+.0%})" if p50 else ""
+        rss_text = f"{rss[0]:.0f} -> {rss[1]:.0f}" if rss else ""
+        lines.append(f"{row['status']:<10} {row['suite']:<6} {row['size']:>8}  {row['name']:<28} {p50_text:>26} {rss_text:>16}")
+    regressed = sum(row["status"] == "regressed" for row in rows)
+    lines.append(f"{regressed} regression(s) in {len(rows)} benchmark(s)")
+    return "\n".join(lines)
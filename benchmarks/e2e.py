@@ -0,0 +1,86 @@
+import time
+
+from benchmarks.harness import Benchmark, peak_rss_mb, run_benchmarks
+from benchmarks.micro import (QUERY_COUNT, SEARCH_TERMS, _cycle, _queries, random_filters, random_pairs,
+                              random_preferences, random_selection)
+
+
+# Products changed by one PATCH /products request, as a price feed would send them
+PRICE_UPDATES_PER_REQUEST = 10
+
+
+def _send(method, path, payloads, headers=None):
+    def run(client, i):
+        response = client.open(path, method=method, json=_cycle(payloads, i), headers=headers)
+        if response.status_code >= 500:
+            raise RuntimeError(f"{path} answered {response.status_code}: {response.get_data(as_text=True)[:200]}")
+        return response
+    return run
+
+
+def _price_updates(ctx):
+    rng = ctx.rng()
+    return [{"updates": {node: {"price": rng.randint(300, 2000)}
+                         for node in rng.sample(ctx.node_ids, PRICE_UPDATES_PER_REQUEST)}}
+            for _ in range(QUERY_COUNT)]
+
+
+def e2e_benchmarks(ctx):
+    # Request payloads are built once per size so every run sends the same requests
+    pairs = random_pairs(ctx.rng(), ctx.node_ids)
+    batches = [[{"start": s, "end": e} for s, e in pairs[i:i + 16]] for i in range(0, len(pairs), 16)]
+    return [
+        Benchmark("POST /filter", lambda client: client, _send("POST", "/filter", _queries(ctx, random_filters))),
+        Benchmark("POST /filter (page of 20, gzip)", lambda client: client,
+                  _send("POST", "/filter", _queries(ctx, lambda rng: {"limit": 20, "fields": ["node_id", "price"],
+                                                                     **random_filters(rng)}),
+                        headers={"Accept-Encoding": "gzip"})),
+        Benchmark("POST /filter (JSON Lines)", lambda client: client,
+                  _send("POST", "/filter", _queries(ctx, random_filters), headers={"Accept": "application/x-ndjson"})),
+        Benchmark("POST /facets", lambda client: client,
+                  _send("POST", "/facets", _queries(ctx, lambda rng: {"selected": random_selection(rng),
+                                                                     **random_filters(rng)}))),
+        Benchmark("POST /recommend", lambda client: client, _send("POST", "/recommend", _queries(ctx, random_preferences))),
+        Benchmark("POST /search", lambda client: client,
+                  _send("POST", "/search", [{"query": term, "page": 1, "per_page": 20} for term in SEARCH_TERMS])),
+        Benchmark("POST /shortest-path", lambda client: client,
+                  _send("POST", "/shortest-path", [{"start": s, "end": e} for s, e in pairs])),
+        Benchmark("POST /shortest-path/batch", lambda client: client,
+                  _send("POST", "/shortest-path/batch", [{"pairs": batch} for batch in batches])),
+        Benchmark("POST /best-deals", lambda client: client,
+                  _send("POST", "/best-deals", _queries(ctx, random_filters))),
+        Benchmark("POST /compare", lambda client: client,
+                  _send("POST", "/compare", [{"node_id": start} for start, _ in pairs])),
+        Benchmark("GET /catalog", lambda client: client, lambda client, i: client.get("/catalog")),
+        # Last, since every run publishes a new catalog version
+        Benchmark("PATCH /products", lambda client: client, _send("PATCH", "/products", _price_updates(ctx))),
+    ]
+
+
+def _cold(name, size, start):
+    return {"name": f"cold: {name}", "size": size, "runs": 1,
+            "p50_ms": (time.perf_counter() - start) * 1000, "peak_rss_mb": peak_rss_mb()}
+
+
+def run_e2e(ctx, repeat):
+    """
+    Drives the Flask routes through the test client against ctx.path.
+    Cold results time the catalog load and the first request of every route,
+    which includes building that route's per-snapshot index; the warm
+    benchmarks follow.
+    """
+    # app reads CARTIQ_DATASET when it is imported, so import it only here
+    import app as server
+
+    client = server.app.test_client()
+    start = time.perf_counter()
+    # Queries are drawn from the app's own snapshot rather than a second copy of the catalog
+    ctx.products = server.catalog.snapshot().products
+    results = [_cold("load catalog", ctx.size, start)]
+
+    benchmarks = e2e_benchmarks(ctx)
+    for bench in benchmarks:
+        start = time.perf_counter()
+        bench.run(client, 0)
+        results.append(_cold(bench.name, ctx.size, start))
+    return results + run_benchmarks(benchmarks, client, ctx.size, repeat)
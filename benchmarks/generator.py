@@ -0,0 +1,78 @@
+import json
+import random
+import re
+
+PLATFORMS = ("Amazon", "Flipkart")
+CATEGORIES = ("Laptop", "Mobile")
+BRANDS = ("HP", "Samsung", "Asus", "Apple", "Xiaomi", "Dell", "Lenovo")
+RAM_SIZES = ("4GB", "8GB", "16GB", "32GB")
+STORAGE_SIZES = ("128GB", "256GB", "512GB", "1TB")
+PROCESSORS = ("Intel i5", "Intel i7", "Ryzen 5", "Ryzen 7")
+SCREEN_SIZES = ("13.3 inch", "14 inch", "15.6 inch", "17 inch")
+DELIVERY_TIMES = ("2-4 days", "3-5 days", "4-7 days")
+
+SIZES = {"1k": 1_000, "10k": 10_000, "100k": 100_000, "1M": 1_000_000}
+
+
+def parse_size(size):
+    # "10k" -> 10000, "1M" -> 1000000, "2500" -> 2500
+    if size in SIZES:
+        return SIZES[size]
+    match = re.fullmatch(r"(\d+)([kKmM]?)", str(size))
+    if not match:
+        raise ValueError(f"Unknown catalog size: {size}")
+    number, unit = match.groups()
+    return int(number) * {"": 1, "k": 1_000, "m": 1_000_000}[unit.lower()]
+
+
+def iter_products(n, seed=0):
+    """
+    Yields n synthetic products in the schema of product_data_with_nodeid.json
+    (same keys, key order, id format and value ranges). The same n and seed
+    always give the same catalog.
+    """
+    rng = random.Random(seed)
+    model = 0
+    count = 0
+    while count < n:
+        model += 1
+        for category in CATEGORIES:
+            for platform in PLATFORMS:
+                if count == n:
+                    return
+                yield {
+                    "platform": platform,
+                    "category": category,
+                    "product_name": f"{platform} {category} Model {model}",
+                    "price": round(rng.uniform(300, 2000), 2),
+                    "seller_rating": round(rng.uniform(2.5, 5.0), 1),
+                    "delivery_time": rng.choice(DELIVERY_TIMES),
+                    "review_count": rng.randint(10, 2000),
+                    "product_url": f"https://{platform.lower()}.com/product/{category.lower()}/model{model}",
+                    "brand": rng.choice(BRANDS),
+                    "RAM": rng.choice(RAM_SIZES),
+                    "Storage": rng.choice(STORAGE_SIZES),
+                    "Processor": rng.choice(PROCESSORS),
+                    "Screen Size": rng.choice(SCREEN_SIZES),
+                    "node_id": f"{platform}_{platform}_{category}_Model_{model}",
+                }
+                count += 1
+
+
+def generate_products(n, seed=0):
+    return list(iter_products(n, seed))
+
+
+def write_catalog(path, n, seed=0, format="json"):
+    # Streams the catalog to disk, so a 1M product file never sits in memory
+    with open(path, 'w') as f:
+        if format == "jsonl":
+            for product in iter_products(n, seed):
+                f.write(json.dumps(product) + '\n')
+            return path
+        f.write('[')
+        for i, product in enumerate(iter_products(n, seed)):
+            f.write(',\n  ' if i else '\n  ')
+            f.write(json.dumps(product))
+        f.write('\n]')
+    return path
@@ -0,0 +1,70 @@
+import resource
+import sys
+import time
+from collections import namedtuple
+
+
+def peak_rss_mb():
+    # Peak resident set size of this process so far
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes on Linux
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def percentile(sorted_values, q):
+    # Linear interpolation between closest ranks, q in [0, 100]
+    if not sorted_values:
+        return None
+    position = (len(sorted_values) - 1) * q / 100
+    low = int(position)
+    high = min(low + 1, len(sorted_values) - 1)
+    return sorted_values[low] + (sorted_values[high] - sorted_values[low]) * (position - low)
+
+
+def measure(fn, repeat=20, warmup=1):
+    """
+    Calls fn(i) for i in range(warmup + repeat) and returns latency
+    percentiles (milliseconds) and throughput over the timed calls.
+    fn receives the call number so it can vary its input deterministically.
+    """
+    for i in range(warmup):
+        fn(i)
+    samples = []
+    for i in range(warmup, warmup + repeat):
+        start = time.perf_counter()
+        fn(i)
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    total = sum(samples)
+    return {
+        "runs": len(samples),
+        "p50_ms": percentile(samples, 50),
+        "p95_ms": percentile(samples, 95),
+        "p99_ms": percentile(samples, 99),
+        "mean_ms": total / len(samples),
+        "min_ms": samples[0],
+        "max_ms": samples[-1],
+        "throughput_per_s": len(samples) / (total / 1000) if total else None,
+    }
+
+
+# setup(context) -> state, run(state, i) is the timed call.
+# max_size: larger catalogs are skipped (e.g. the O(n^2) full graph at 1M).
+# repeat: timed calls, when the suite default is too many for this benchmark.
+Benchmark = namedtuple("Benchmark", "name setup run max_size repeat", defaults=(None, None))
+
+
+def run_benchmarks(benchmarks, context, size, repeat):
+    results = []
+    for bench in benchmarks:
+        if bench.max_size is not None and size > bench.max_size:
+            results.append({"name": bench.name, "size": size, "skipped": f"only run up to {bench.max_size} products"})
+            continue
+        start = time.perf_counter()
+        state = bench.setup(context)
+        setup_ms = (time.perf_counter() - start) * 1000
+        result = measure(lambda i: bench.run(state, i), repeat=bench.repeat or repeat)
+        result.update({"name": bench.name, "size": size, "setup_ms": setup_ms, "peak_rss_mb": peak_rss_mb()})
+        results.append(result)
+        del state
+    return results
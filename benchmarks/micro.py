@@ -0,0 +1,192 @@
+import random
+from functools import cached_property
+
+from benchmarks.generator import BRANDS, RAM_SIZES
+from benchmarks.harness import Benchmark
+from modules.ann_index import IVFIndex
+from modules.binary_catalog import load_catalog
+from modules.dataset_to_graph_from_json import ImplicitProductGraph, build_graph_from_data
+from modules.facets import FacetIndex
+from modules.filter_index import FilterIndex
+from modules.matching import MatchIndex
+from modules.graph_utils import dijkstra, dijkstra_implicit, plan_shortest_path
+from modules.product import load_product_records
+from modules.product_filter_and_recommender import filter_products, recommend_products
+from modules.recommender_index import RecommenderIndex
+from modules.search_index import SearchIndex
+from modules.skyline import SkylineIndex, pareto_frontier
+from modules.weight_spec import DEFAULT_WEIGHT_SPEC
+
+# Distinct inputs cycled through by each benchmark
+QUERY_COUNT = 64
+
+SEARCH_TERMS = ("laptop", "mobile", "samsung", "model 12", "apple mobile", "ryzen", "lap", "hp", "flipkart", "dell laptop")
+
+
+class BenchContext:
+    # Catalog and derived inputs shared by the benchmarks of one size, loaded on first use
+    def __init__(self, path, size, seed=0):
+        self.path = path
+        self.size = size
+        self.seed = seed
+
+    @cached_property
+    def dicts(self):
+        return load_catalog(self.path)
+
+    @cached_property
+    def products(self):
+        return load_product_records(self.path)
+
+    @cached_property
+    def node_ids(self):
+        return [p["node_id"] for p in self.products]
+
+    def rng(self):
+        return random.Random(self.seed)
+
+
+def random_filters(rng):
+    filters = {}
+    if rng.random() < 0.7:
+        filters["min_price"] = rng.randint(300, 1200)
+    if rng.random() < 0.5:
+        filters["max_price"] = rng.randint(1000, 2000)
+    if rng.random() < 0.5:
+        filters["min_rating"] = rng.choice((3.0, 3.5, 4.0, 4.5))
+    if rng.random() < 0.4:
+        filters["min_reviews"] = rng.randint(10, 1500)
+    if rng.random() < 0.4:
+        filters["max_delivery_days"] = rng.choice((4, 5, 7))
+    return filters
+
+
+def random_preferences(rng):
+    prefs = {"brand": rng.sample(BRANDS, rng.randint(1, 2))}
+    if rng.random() < 0.6:
+        prefs["RAM"] = rng.choice(RAM_SIZES)[:-2]
+    return prefs
+
+
+def random_pairs(rng, node_ids, count=QUERY_COUNT):
+    return [(rng.choice(node_ids), rng.choice(node_ids)) for _ in range(count)]
+
+
+def scan_search(data, query):
+    # The /search route before the inverted index: substring scan of three fields
+    query = query.lower()
+    return [p for p in data
+            if query in p.get("product_name", "").lower()
+            or query in p.get("brand", "").lower()
+            or query in p.get("category", "").lower()]
+
+
+def _queries(ctx, make):
+    rng = ctx.rng()
+    return [make(rng) for _ in range(QUERY_COUNT)]
+
+
+def _full_graph_and_starts(ctx):
+    graph = build_graph_from_data(ctx.dicts)
+    return graph, [start for start, _ in random_pairs(ctx.rng(), ctx.node_ids)]
+
+
+def _implicit_graph_and_pairs(ctx):
+    return ImplicitProductGraph.from_data(ctx.products), random_pairs(ctx.rng(), ctx.node_ids)
+
+
+def _ann_state(ctx):
+    recommender = RecommenderIndex(ctx.products)
+    ann = IVFIndex.build(recommender.item_vectors())
+    return ctx.products, recommender, ann, _queries(ctx, random_preferences)
+
+
+def _skyline_state(ctx):
+    return SkylineIndex(ctx.products, FilterIndex(ctx.products)), _queries(ctx, random_filters)
+
+
+def _facet_state(ctx):
+    index = FacetIndex(ctx.products, FilterIndex(ctx.products))
+    rng = ctx.rng()
+    queries = [(random_selection(rng), random_filters(rng)) for _ in range(QUERY_COUNT)]
+    return index, queries
+
+
+def random_selection(rng):
+    # Selected facet values in the /facets request shape
+    selected = {}
+    if rng.random() < 0.5:
+        selected["brand"] = rng.sample(BRANDS, rng.randint(1, 2))
+    if rng.random() < 0.4:
+        selected["RAM"] = [rng.choice(RAM_SIZES)]
+    return selected
+
+
+def _cycle(items, i):
+    return items[i % len(items)]
+
+
+MICRO_BENCHMARKS = [
+    # Loading
+    Benchmark("load_catalog", lambda ctx: ctx.path, lambda path, i: load_catalog(path), repeat=3),
+    Benchmark("load_product_records", lambda ctx: ctx.path, lambda path, i: load_product_records(path), repeat=3),
+
+    # Graph building
+    Benchmark("build_graph_full", lambda ctx: ctx.dicts,
+              lambda data, i: build_graph_from_data(data), max_size=2_000, repeat=3),
+    Benchmark("build_graph_implicit", lambda ctx: ctx.products,
+              lambda data, i: build_graph_from_data(data, mode="implicit"), repeat=5),
+    Benchmark("build_graph_knn", lambda ctx: ctx.products,
+              lambda data, i: build_graph_from_data(data, mode="knn", k=10), max_size=10_000, repeat=3),
+    Benchmark("weight_kernel_all_blocks", lambda ctx: DEFAULT_WEIGHT_SPEC.compile(ctx.products),
+              lambda kernel, i: sum(block.shape[0] for _, block in kernel.iter_blocks()),
+              max_size=10_000, repeat=3),
+
+    # Shortest paths
+    Benchmark("dijkstra_full_graph", _full_graph_and_starts,
+              lambda state, i: dijkstra(state[0], _cycle(state[1], i)), max_size=2_000, repeat=5),
+    Benchmark("dijkstra_implicit", _implicit_graph_and_pairs,
+              lambda state, i: dijkstra_implicit(state[0], state[0].index[_cycle(state[1], i)[0]]),
+              max_size=10_000, repeat=5),
+    Benchmark("plan_shortest_path", _implicit_graph_and_pairs,
+              lambda state, i: plan_shortest_path(state[0], *_cycle(state[1], i))),
+
+    # Filtering
+    Benchmark("filter_products_scan", lambda ctx: (ctx.products, _queries(ctx, random_filters)),
+              lambda state, i: filter_products(state[0], **_cycle(state[1], i))),
+    Benchmark("filter_index", lambda ctx: (ctx.products, FilterIndex(ctx.products), _queries(ctx, random_filters)),
+              lambda state, i: state[1].filter(state[0], **_cycle(state[2], i))),
+    Benchmark("facet_counts", _facet_state,
+              lambda state, i: state[0].counts(selected=_cycle(state[1], i)[0], **_cycle(state[1], i)[1])),
+
+    # Recommendations
+    Benchmark("recommend_products", lambda ctx: (ctx.products, _queries(ctx, random_preferences)),
+              lambda state, i: recommend_products(state[0], _cycle(state[1], i), top_n=5),
+              max_size=100_000),
+    Benchmark("recommender_index",
+              lambda ctx: (ctx.products, RecommenderIndex(ctx.products), _queries(ctx, random_preferences)),
+              lambda state, i: state[1].recommend(state[0], _cycle(state[2], i), top_n=5)),
+    Benchmark("recommend_nearest_exact",
+              lambda ctx: (ctx.products, RecommenderIndex(ctx.products), _queries(ctx, random_preferences)),
+              lambda state, i: state[1].recommend_nearest(state[0], _cycle(state[2], i), top_n=5)),
+    Benchmark("recommend_nearest_ivf", _ann_state,
+              lambda state, i: state[1].recommend_nearest(state[0], _cycle(state[3], i), top_n=5, ann=state[2])),
+
+    # Pareto ranking (the first pass over the filters computes frontiers, later ones hit the cache)
+    Benchmark("pareto_frontier", lambda ctx: SkylineIndex(ctx.products, FilterIndex(ctx.products)),
+              lambda sky, i: pareto_frontier(sky.price, sky.rating, sky.delivery, range(sky.size)), repeat=5),
+    Benchmark("skyline_rank", _skyline_state,
+              lambda state, i: state[0].rank(_cycle(state[1], i), {"price": 2, "seller_rating": 1, "delivery": 1})),
+
+    # Cross-platform matching
+    Benchmark("match_index_build", lambda ctx: ctx.products, lambda data, i: MatchIndex(data), repeat=3),
+    Benchmark("match_compare", lambda ctx: MatchIndex(ctx.products),
+              lambda index, i: index.comparisons(category=_cycle(("Laptop", "Mobile", None), i),
+                                                 brand=_cycle(BRANDS + (None,), i))),
+
+    # Search
+    Benchmark("search_scan", lambda ctx: ctx.products,
+              lambda data, i: scan_search(data, _cycle(SEARCH_TERMS, i))),
+    Benchmark("search_index", lambda ctx: SearchIndex(ctx.products),
+              lambda index, i: index.search(_cycle(SEARCH_TERMS, i), limit=20)),
+]
@@ -0,0 +1,295 @@
+import hashlib
+import json
+import mmap
+import random
+import struct
+import sys
+import time
+
+import numpy as np
+
+from modules.catalog_delta import resized
+from modules.metrics import count, timed
+
+# File layout (as in binary_catalog):
+#   MAGIC | uint64 header length | JSON header | padding | aligned array blobs
+MAGIC = b"CARTIVF1"
+ALIGN = 64
+
+# Training points sampled for k-means, per list
+TRAIN_POINTS_PER_LIST = 64
+KMEANS_ITERATIONS = 10
+# Rows scored per chunk when assigning points to lists
+ASSIGN_CHUNK = 65536
+
+
+def _align(n):
+    return (n + ALIGN - 1) // ALIGN * ALIGN
+
+
+def normalize_rows(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return np.divide(vectors, norms, out=np.zeros_like(vectors), where=norms > 0)
+
+
+def fingerprint(vectors):
+    # Identifies the vectors an index was built from, so a stale file is not used
+    return hashlib.sha1(np.ascontiguousarray(vectors, dtype=np.float32).tobytes()).hexdigest()
+
+
+def rank(ids, scores, k):
+    # Top k by score, ties to the higher id (the order top_k() uses for the catalog)
+    order = np.lexsort((-ids, -scores))[:k]
+    return ids[order], scores[order]
+
+
+def exact_search(vectors, query, k, mask=None):
+    # Brute-force cosine top k over unit rows; the reference for recall
+    q = normalize_rows(np.atleast_2d(query))[0]
+    ids = np.arange(len(vectors)) if mask is None else np.flatnonzero(mask)
+    return rank(ids, vectors[ids] @ q, k)
+
+
+def _assign(vectors, centroids):
+    labels = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), ASSIGN_CHUNK):
+        labels[start:start + ASSIGN_CHUNK] = np.argmax(vectors[start:start + ASSIGN_CHUNK] @ centroids.T, axis=1)
+    return labels
+
+
+def spherical_kmeans(vectors, n_lists, iterations=KMEANS_ITERATIONS, seed=0):
+    # k-means on unit vectors with cosine similarity, trained on a sample
+    rng = np.random.default_rng(seed)
+    sample_size = min(len(vectors), n_lists * TRAIN_POINTS_PER_LIST)
+    sample = vectors[rng.choice(len(vectors), sample_size, replace=False)]
+    centroids = sample[rng.choice(sample_size, n_lists, replace=False)].copy()
+    for _ in range(iterations):
+        labels = _assign(sample, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, sample)
+        empty = ~np.bincount(labels, minlength=n_lists).astype(bool)
+        # Empty lists are re-seeded from random training points
+        sums[empty] = sample[rng.choice(sample_size, int(empty.sum()))]
+        centroids = normalize_rows(sums)
+    return centroids
+
+
+class IVFIndex:
+    """
+    Inverted-file index for cosine top-k over unit vectors.
+    Vectors are clustered into `n_lists` lists with spherical k-means; a query
+    scores the centroids and then only the vectors of its `nprobe` nearest
+    lists. nprobe is the recall / latency knob: nprobe = n_lists is exact.
+    A candidate `mask` (the recommender's strict brand / RAM filter) is
+    applied per list, and probing continues past nprobe until k candidates
+    pass it.
+    """
+
+    def __init__(self, centroids, offsets, ids, vectors, nprobe=None, fingerprint=None):
+        self.centroids = centroids
+        self.offsets = offsets
+        self.ids = ids
+        self.vectors = vectors
+        self.nprobe = nprobe or max(1, len(centroids) // 16)
+        self.fingerprint = fingerprint
+        self._mmap = None
+
+    @classmethod
+    @timed("ann.build")
+    def build(cls, vectors, n_lists=None, nprobe=None, seed=0):
+        source_fingerprint = fingerprint(vectors)
+        vectors = normalize_rows(vectors)
+        n = len(vectors)
+        if n_lists is None:
+            n_lists = int(np.sqrt(n))
+        n_lists = max(1, min(n_lists, n))
+        centroids = spherical_kmeans(vectors, n_lists, seed=seed) if n else np.zeros((0, vectors.shape[1]), np.float32)
+        labels = _assign(vectors, centroids) if n else np.zeros(0, dtype=np.int64)
+        # CSR lists: ids of list l are ids[offsets[l]:offsets[l + 1]], in catalog order
+        ids = np.argsort(labels, kind="stable").astype(np.int64)
+        offsets = np.zeros(n_lists + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(np.bincount(labels, minlength=n_lists))
+        return cls(centroids, offsets, ids, vectors, nprobe=nprobe, fingerprint=source_fingerprint)
+
+    def __len__(self):
+        return len(self.vectors)
+
+    @timed("ann.patch")
+    def patched(self, vectors, rows):
+        """
+        Index over `vectors` when only `rows` differ from the vectors this index
+        holds (rows past len(vectors) were dropped). The centroids are kept and
+        the changed rows are assigned to their nearest list, so many small
+        updates slowly drift from what a rebuild would give. Returns None when
+        the vector space changed and the index has to be rebuilt.
+        """
+        if self.n_lists == 0 or vectors.shape[1] != self.vectors.shape[1]:
+            return None
+        n = len(vectors)
+        labels = np.empty(len(self.ids), dtype=np.int64)
+        labels[self.ids] = np.repeat(np.arange(self.n_lists), np.diff(self.offsets))
+        labels = resized(labels, n)
+        unit = resized(self.vectors, n)
+        if len(rows):
+            unit[rows] = normalize_rows(vectors[rows])
+            labels[rows] = _assign(unit[rows], self.centroids)
+        ids = np.argsort(labels, kind="stable").astype(np.int64)
+        offsets = np.zeros(self.n_lists + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(np.bincount(labels, minlength=self.n_lists))
+        return IVFIndex(self.centroids, offsets, ids, unit, nprobe=self.nprobe)
+
+    @property
+    def n_lists(self):
+        return len(self.centroids)
+
+    @timed("ann.search")
+    def search(self, query, k, nprobe=None, mask=None):
+        # (ids, scores) of the approximate top k, best first
+        q = normalize_rows(np.atleast_2d(query))[0]
+        nprobe = nprobe or self.nprobe
+        order = np.argsort(-(self.centroids @ q), kind="stable")
+        chosen = []
+        found = 0
+        for probed, list_id in enumerate(order.tolist(), start=1):
+            ids = self.ids[self.offsets[list_id]:self.offsets[list_id + 1]]
+            if mask is not None:
+                ids = ids[mask[ids]]
+            chosen.append(ids)
+            found += len(ids)
+            if probed >= nprobe and found >= k:
+                break
+        candidates = np.concatenate(chosen) if chosen else np.zeros(0, dtype=np.int64)
+        count("rows_scanned", len(candidates))
+        return rank(candidates, self.vectors[candidates] @ q, k)
+
+    def save(self, path):
+        arrays = {"centroids": self.centroids, "offsets": self.offsets, "ids": self.ids, "vectors": self.vectors}
+        header = {"nprobe": self.nprobe, "fingerprint": self.fingerprint, "arrays": {}}
+        offset = 0
+        for name, array in arrays.items():
+            array = np.ascontiguousarray(array)
+            arrays[name] = array
+            header["arrays"][name] = {"dtype": array.dtype.str, "shape": list(array.shape), "offset": offset}
+            offset = _align(offset + array.nbytes)
+        header_bytes = json.dumps(header).encode('utf-8')
+        data_start = _align(len(MAGIC) + 8 + len(header_bytes))
+        with open(path, 'wb') as f:
+            f.write(MAGIC)
+            f.write(struct.pack('<Q', len(header_bytes)))
+            f.write(header_bytes)
+            for name, array in arrays.items():
+                f.write(b'\0' * (data_start + header["arrays"][name]["offset"] - f.tell()))
+                f.write(array.tobytes())
+        return path
+
+    @classmethod
+    def load(cls, path):
+        # Memory-mapped, zero-copy load of a saved index
+        with open(path, 'rb') as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if mapped[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not an IVF index")
+        (header_len,) = struct.unpack_from('<Q', mapped, len(MAGIC))
+        header = json.loads(mapped[len(MAGIC) + 8:len(MAGIC) + 8 + header_len])
+        data_start = _align(len(MAGIC) + 8 + header_len)
+        arrays = {}
+        for name, meta in header["arrays"].items():
+            dtype = np.dtype(meta["dtype"])
+            size = int(np.prod(meta["shape"]))
+            if size == 0:
+                arrays[name] = np.zeros(meta["shape"], dtype=dtype)
+            else:
+                arrays[name] = np.frombuffer(mapped, dtype=dtype, count=size,
+                                             offset=data_start + meta["offset"]).reshape(meta["shape"])
+        index = cls(arrays["centroids"], arrays["offsets"], arrays["ids"], arrays["vectors"],
+                    nprobe=header["nprobe"], fingerprint=header["fingerprint"])
+        index._mmap = mapped
+        return index
+
+    def __repr__(self):
+        return f"IVFIndex(vectors={len(self.vectors)}, lists={self.n_lists}, nprobe={self.nprobe})"
+
+
+def recall_report(index, queries, k=5, nprobes=(1, 2, 4, 8, 16, 32), masks=None):
+    """
+    recall@k of the index against exact_search for each nprobe, with the mean
+    latency of both. A result counts as a hit when it scores at least the
+    exact k-th score, so ties do not count as misses.
+    """
+    masks = masks if masks is not None else [None] * len(queries)
+    started = time.perf_counter()
+    exact = [exact_search(index.vectors, q, k, mask) for q, mask in zip(queries, masks)]
+    exact_ms = (time.perf_counter() - started) * 1000 / max(len(queries), 1)
+
+    report = []
+    for nprobe in nprobes:
+        if nprobe > index.n_lists:
+            continue
+        hits = expected = 0
+        started = time.perf_counter()
+        answers = [index.search(q, k, nprobe=nprobe, mask=mask) for q, mask in zip(queries, masks)]
+        ann_ms = (time.perf_counter() - started) * 1000 / max(len(queries), 1)
+        for (_, ann_scores), (_, exact_scores) in zip(answers, exact):
+            if len(exact_scores) == 0:
+                continue
+            threshold = exact_scores[-1] - 1e-6
+            hits += int(np.sum(ann_scores >= threshold))
+            expected += len(exact_scores)
+        report.append({
+            "nprobe": nprobe,
+            "recall_at_k": hits / expected if expected else 1.0,
+            "ann_ms": ann_ms,
+            "exact_ms": exact_ms,
+        })
+    return report
+
+
+def random_preferences(index, n, seed=0):
+    # Preference dicts in the /recommend request shape, drawn from the catalog's values
+    rng = random.Random(seed)
+    ram_numbers = sorted({int(r) for r in index.ram.tolist() if r > 0}) or [8]
+    prefs = []
+    for _ in range(n):
+        pref = {"brand": rng.sample(index.brand_names, min(len(index.brand_names), rng.randint(1, 2)))}
+        if rng.random() < 0.5:
+            pref["RAM"] = str(rng.choice(ram_numbers))
+        if rng.random() < 0.5:
+            low = rng.uniform(float(index.price_min), float(index.price_max))
+            pref["price_range"] = [low, low + rng.uniform(0, 500)]
+        prefs.append(pref)
+    return prefs
+
+
+if __name__ == "__main__":
+    from modules.product import load_product_records
+    from modules.recommender_index import RecommenderIndex
+
+    usage = ("Usage: python -m modules.ann_index build <catalog> <index.ivf> [n_lists]\n"
+             "       python -m modules.ann_index report <catalog> [index.ivf] [k]")
+    if len(sys.argv) < 3 or sys.argv[1] not in ("build", "report"):
+        print(usage)
+        sys.exit(1)
+
+    recommender = RecommenderIndex(load_product_records(sys.argv[2]))
+    vectors = recommender.item_vectors()
+    if sys.argv[1] == "build":
+        if len(sys.argv) < 4:
+            print(usage)
+            sys.exit(1)
+        n_lists = int(sys.argv[4]) if len(sys.argv) > 4 else None
+        index = IVFIndex.build(vectors, n_lists=n_lists)
+        index.save(sys.argv[3])
+        print(f"Built {index} -> {sys.argv[3]}")
+    else:
+        index = IVFIndex.load(sys.argv[3]) if len(sys.argv) > 3 else IVFIndex.build(vectors)
+        if index.fingerprint != fingerprint(vectors):
+            print(f"Warning: {sys.argv[3]} was built from a different catalog")
+        k = int(sys.argv[4]) if len(sys.argv) > 4 else 5
+        prefs = random_preferences(recommender, 200)
+        queries = [recommender.user_vector(pref) for pref in prefs]
+        masks = [recommender.candidates(pref)[0] for pref in prefs]
+        print(f"{index}, {len(queries)} queries, k={k}")
+        print(f"{'nprobe':>6} {'recall@k':>9} {'ann ms':>8} {'exact ms':>9}")
+        for row in recall_report(index, queries, k=k, masks=masks):
+            print(f"{row['nprobe']:>6} {row['recall_at_k']:>9.3f} {row['ann_ms']:>8.3f} {row['exact_ms']:>9.3f}")
@@ -0,0 +1,225 @@
+import asyncio
+import io
+import json
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+# Request headers that select the representation of a response (content coding,
+# JSON vs JSON Lines, 304): requests differing in them are not coalesced
+REPRESENTATION_HEADERS = (b"accept", b"accept-encoding", b"if-none-match")
+
+
+class ServerBusy(Exception):
+    pass
+
+
+def wsgi_environ(scope, body):
+    # WSGI environ for one ASGI HTTP request whose body has been read
+    server = scope.get("server") or ("localhost", 80)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", ""),
+        "PATH_INFO": scope["path"],
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin1"),
+        "SERVER_NAME": str(server[0]),
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": (scope.get("client") or ("", 0))[0],
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": False,
+        "wsgi.run_once": False,
+    }
+    for name, value in scope.get("headers", []):
+        name = name.decode("latin1").upper().replace("-", "_")
+        value = value.decode("latin1")
+        if name == "CONTENT_TYPE" or name == "CONTENT_LENGTH":
+            environ[name] = value
+            continue
+        key = f"HTTP_{name}"
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    environ.setdefault("CONTENT_LENGTH", str(len(body)))
+    return environ
+
+
+def call_wsgi(wsgi_app, environ):
+    # Runs the WSGI app to completion and returns (status, headers, body)
+    response = {}
+    chunks = []
+
+    def start_response(status, headers, exc_info=None):
+        response["status"] = int(status.split(" ", 1)[0])
+        response["headers"] = headers
+        return chunks.append
+
+    result = wsgi_app(environ, start_response)
+    try:
+        for chunk in result:
+            chunks.append(chunk)
+    finally:
+        if hasattr(result, "close"):
+            result.close()
+    return response["status"], response["headers"], b"".join(chunks)
+
+
+class ComputePool:
+    """
+    Bounded thread pool with admission control for the event loop.
+    - At most `max_pending` calls are running or queued; further calls raise
+      ServerBusy at once instead of growing the queue.
+    - Each caller waits at most `timeout` seconds (asyncio.TimeoutError).
+      The call itself keeps its slot until it finishes.
+    - Calls submitted with the same `key` while one is in flight share its result.
+    Only used from the event loop thread, so the counters need no lock.
+    """
+
+    def __init__(self, name, workers, max_pending, timeout):
+        self.name = name
+        self.workers = workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"cartiq-{name}")
+        self.inflight = {}
+        self.pending = 0
+        self.completed = 0
+        self.coalesced = 0
+        self.rejected = 0
+        self.timeouts = 0
+
+    def _done(self, key, future):
+        self.pending -= 1
+        self.completed += 1
+        if key is not None and self.inflight.get(key) is future:
+            del self.inflight[key]
+        if not future.cancelled():
+            # Mark the outcome as retrieved even when every waiter timed out
+            future.exception()
+
+    async def run(self, fn, *args, key=None):
+        future = self.inflight.get(key) if key is not None else None
+        if future is not None:
+            self.coalesced += 1
+        else:
+            if self.pending >= self.max_pending:
+                self.rejected += 1
+                raise ServerBusy(self.name)
+            self.pending += 1
+            future = asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+            if key is not None:
+                self.inflight[key] = future
+            future.add_done_callback(lambda f: self._done(key, f))
+        try:
+            # shield: one caller timing out must not cancel the shared call
+            return await asyncio.wait_for(asyncio.shield(future), self.timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise
+
+    def stats(self):
+        return {
+            "workers": self.workers,
+            "max_pending": self.max_pending,
+            "timeout": self.timeout,
+            "pending": self.pending,
+            "completed": self.completed,
+            "coalesced": self.coalesced,
+            "rejected": self.rejected,
+            "timeouts": self.timeouts,
+        }
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
+
+
+def _json_response(status, payload, headers=()):
+    body = json.dumps(payload).encode("utf-8")
+    return status, [("Content-Type", "application/json"), ("Content-Length", str(len(body)))] + list(headers), body
+
+
+class AsyncGateway:
+    """
+    ASGI application serving a WSGI (Flask) app without blocking the event loop.
+    Requests for `heavy_routes` run on their own bounded pool, every other
+    route on a separate light pool, so slow path queries cannot starve cheap
+    lookups. A full pool answers 503 with Retry-After, and a request that
+    waits longer than its pool's timeout gets a 504. Identical in-flight
+    requests (same method, path, query string, body and representation
+    headers) to `coalesced_routes` are computed once.
+    `startup` is called on the light pool when the ASGI server starts (lifespan).
+    """
+
+    def __init__(self, wsgi_app, heavy_routes=(), coalesced_routes=(), heavy_workers=4,
+                 light_workers=8, max_pending=64, timeout=30.0, startup=None):
+        self.wsgi_app = wsgi_app
+        self.heavy_routes = set(heavy_routes)
+        self.coalesced_routes = set(coalesced_routes)
+        self.heavy = ComputePool("heavy", heavy_workers, max_pending, timeout)
+        self.light = ComputePool("light", light_workers, max_pending, timeout)
+        self.startup = startup
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+        elif scope["type"] == "http":
+            await self._http(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                try:
+                    if self.startup is not None:
+                        await asyncio.get_running_loop().run_in_executor(self.light.executor, self.startup)
+                except Exception as e:
+                    await send({"type": "lifespan.startup.failed", "message": str(e)})
+                    return
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                self.heavy.shutdown()
+                self.light.shutdown()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    @staticmethod
+    async def _read_body(receive):
+        chunks = []
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return None
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body", False):
+                return b"".join(chunks)
+
+    async def _http(self, scope, receive, send):
+        body = await self._read_body(receive)
+        if body is None:
+            return
+        path = scope["path"]
+        pool = self.heavy if path in self.heavy_routes else self.light
+        key = None
+        if path in self.coalesced_routes:
+            headers = scope.get("headers", [])
+            representation = tuple(tuple(value for name, value in headers if name.lower() == wanted)
+                                   for wanted in REPRESENTATION_HEADERS)
+            key = (scope["method"], path, scope.get("query_string", b""), body, representation)
+
+        try:
+            status, headers, payload = await pool.run(call_wsgi, self.wsgi_app, wsgi_environ(scope, body), key=key)
+        except ServerBusy:
+            status, headers, payload = _json_response(503, {"error": "Server busy, retry later"}, [("Retry-After", "1")])
+        except asyncio.TimeoutError:
+            status, headers, payload = _json_response(504, {"error": "Request timed out"})
+
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(name.lower().encode("latin1"), value.encode("latin1")) for name, value in headers],
+        })
+        await send({"type": "http.response.body", "body": payload})
+
+    def stats(self):
+        return {"heavy": self.heavy.stats(), "light": self.light.stats()}
@@ -0,0 +1,235 @@
+import json
+import mmap
+import struct
+import sys
+from collections.abc import Sequence
+
+import numpy as np
+
+from modules.ingest import iter_products, load_products
+from modules.metrics import timed
+
+# File layout:
+#   MAGIC | uint64 header length | JSON header | padding | aligned array blobs
+# Array offsets in the header are relative to the start of the blob section.
+MAGIC = b"CARTIQ01"
+ALIGN = 64
+
+_MISSING = object()
+
+
+def _align(n):
+    return (n + ALIGN - 1) // ALIGN * ALIGN
+
+
+def _field_kind(values):
+    present = [v for v in values if v is not _MISSING]
+    if len(present) == len(values) and None not in present:
+        if all(isinstance(v, int) and not isinstance(v, bool) for v in present):
+            return "int"
+        if all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in present):
+            return "float"
+    if all(isinstance(v, str) for v in present):
+        return "string"
+    # Anything else (booleans, nulls, nested values) is stored JSON-encoded
+    return "json"
+
+
+def _string_table(values, kind):
+    # Interned offset table: each distinct value stored once, products hold int32 codes
+    table = {}
+    codes = np.empty(len(values), dtype=np.int32)
+    for i, value in enumerate(values):
+        if value is _MISSING:
+            codes[i] = -1
+            continue
+        encoded = value if kind == "string" else json.dumps(value)
+        codes[i] = table.setdefault(encoded, len(table))
+    blobs = [value.encode('utf-8') for value in table]
+    offsets = np.zeros(len(blobs) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(b) for b in blobs])
+    return codes, offsets, np.frombuffer(b''.join(blobs), dtype=np.uint8)
+
+
+def compile_catalog(source_path, out_path):
+    """
+    Compiles a JSON / JSON Lines catalog into a columnar binary snapshot.
+    Numeric fields become NumPy columns; every other field becomes an interned
+    string table (distinct values + offsets) plus one int32 code per product.
+    """
+    products = load_products(source_path)
+    fields = []
+    for product in products:
+        for key in product:
+            if key not in fields:
+                fields.append(key)
+
+    arrays = []
+    header = {"count": len(products), "fields": []}
+    for name in fields:
+        values = [p.get(name, _MISSING) for p in products]
+        kind = _field_kind(values)
+        if kind == "int":
+            columns = {"values": np.array(values, dtype=np.int64)}
+        elif kind == "float":
+            columns = {"values": np.array(values, dtype=np.float64)}
+        else:
+            codes, offsets, blob = _string_table(values, kind)
+            columns = {"codes": codes, "offsets": offsets, "blob": blob}
+        entry = {"name": name, "kind": kind, "arrays": {}}
+        for role, array in columns.items():
+            entry["arrays"][role] = {"dtype": array.dtype.str, "count": int(array.size)}
+            arrays.append((entry["arrays"][role], array))
+        header["fields"].append(entry)
+
+    offset = 0
+    for meta, array in arrays:
+        meta["offset"] = offset
+        offset = _align(offset + array.nbytes)
+
+    header_bytes = json.dumps(header).encode('utf-8')
+    data_start = _align(len(MAGIC) + 8 + len(header_bytes))
+    with open(out_path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(struct.pack('<Q', len(header_bytes)))
+        f.write(header_bytes)
+        for meta, array in arrays:
+            f.write(b'\0' * (data_start + meta["offset"] - f.tell()))
+            f.write(array.tobytes())
+    return out_path
+
+
+def is_binary_catalog(path):
+    with open(path, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+class BinaryCatalog(Sequence):
+    """
+    Read-only, memory-mapped view of a compiled catalog.
+    Columns are zero-copy NumPy views over the mapping, so processes that open
+    the same file share its pages. Indexing returns a product dict in the
+    original JSON shape, built on access.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mmap[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a compiled catalog")
+        (header_len,) = struct.unpack_from('<Q', self._mmap, len(MAGIC))
+        header_start = len(MAGIC) + 8
+        header = json.loads(self._mmap[header_start:header_start + header_len])
+        data_start = _align(header_start + header_len)
+
+        self._count = header["count"]
+        self.fields = [entry["name"] for entry in header["fields"]]
+        self.kinds = {entry["name"]: entry["kind"] for entry in header["fields"]}
+        self._arrays = {}
+        for entry in header["fields"]:
+            self._arrays[entry["name"]] = {
+                role: self._view(meta, data_start) for role, meta in entry["arrays"].items()
+            }
+        self._tables = {}
+
+    def _view(self, meta, data_start):
+        dtype = np.dtype(meta["dtype"])
+        if meta["count"] == 0:
+            return np.empty(0, dtype=dtype)
+        return np.frombuffer(self._mmap, dtype=dtype, count=meta["count"], offset=data_start + meta["offset"])
+
+    @property
+    def nbytes(self):
+        return len(self._mmap)
+
+    def __len__(self):
+        return self._count
+
+    def column(self, name):
+        # Zero-copy NumPy column of a numeric field
+        if self.kinds[name] not in ("int", "float"):
+            raise TypeError(f"Field {name!r} is not numeric")
+        return self._arrays[name]["values"]
+
+    def string_table(self, name):
+        # (distinct decoded values, int32 code per product; -1 when the field is absent)
+        if self.kinds[name] in ("int", "float"):
+            raise TypeError(f"Field {name!r} is numeric")
+        if name not in self._tables:
+            arrays = self._arrays[name]
+            offsets = arrays["offsets"].tolist()
+            blob = arrays["blob"]
+            values = [sys.intern(blob[offsets[i]:offsets[i + 1]].tobytes().decode('utf-8'))
+                      for i in range(len(offsets) - 1)]
+            if self.kinds[name] == "json":
+                values = [json.loads(v) for v in values]
+            self._tables[name] = values
+        return self._tables[name], self._arrays[name]["codes"]
+
+    def strings(self, name):
+        values, codes = self.string_table(name)
+        return [values[c] if c >= 0 else None for c in codes.tolist()]
+
+    def _value(self, name, i):
+        if self.kinds[name] in ("int", "float"):
+            return self._arrays[name]["values"][i].item()
+        values, codes = self.string_table(name)
+        code = codes[i]
+        return values[code] if code >= 0 else _MISSING
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(self._count))]
+        if i < 0:
+            i += self._count
+        if not 0 <= i < self._count:
+            raise IndexError("product index out of range")
+        product = {}
+        for name in self.fields:
+            value = self._value(name, i)
+            if value is not _MISSING:
+                product[name] = value
+        return product
+
+    def __repr__(self):
+        return f"BinaryCatalog({self.path!r}, products={self._count})"
+
+
+def numeric_column(data, name, dtype=np.float64):
+    # Column of a numeric field, zero-copy for a compiled catalog
+    if hasattr(data, "column"):
+        return np.asarray(data.column(name), dtype=dtype)
+    return np.array([p[name] for p in data], dtype=dtype)
+
+
+def mapped_column(data, name, fn, dtype=np.float64):
+    # fn(value) for every product, fn(None) where the field is absent;
+    # a compiled catalog calls fn once per distinct value
+    if hasattr(data, "string_table"):
+        values, codes = data.string_table(name)
+        mapped = [fn(v) for v in values]
+        if len(codes) and codes.min() < 0:
+            # Code -1 picks the last entry
+            mapped.append(fn(None))
+        return np.array(mapped, dtype=dtype)[codes]
+    return np.array([fn(p.get(name)) for p in data], dtype=dtype)
+
+
+@timed("load_catalog")
+def load_catalog(path, record=None):
+    # Compiled snapshots are memory-mapped; JSON / JSON Lines files are streamed,
+    # each product passed through record() as it is parsed when one is given
+    if is_binary_catalog(path):
+        return BinaryCatalog(path)
+    if record is None:
+        return load_products(path)
+    return [record(p) for p in iter_products(path)]
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print("Usage: python -m modules.binary_catalog <catalog.json> <catalog.bin>")
+        sys.exit(1)
+    compile_catalog(sys.argv[1], sys.argv[2])
+    print(f"Compiled {sys.argv[1]} -> {sys.argv[2]}")
@@ -0,0 +1,62 @@
+import numpy as np
+
+
+def resized(array, size):
+    # Copy of `array` with `size` rows: truncated, or padded with zero rows
+    if len(array) >= size:
+        return array[:size].copy()
+    padded = np.zeros((size,) + array.shape[1:], dtype=array.dtype)
+    padded[:len(array)] = array
+    return padded
+
+
+class CatalogDelta:
+    """
+    What one batch of product mutations changed between two catalog versions.
+    Positions are catalog positions: updated products keep theirs, added
+    products are appended, and a removed product's slot is taken by the last
+    product of the catalog, so no other product moves.
+
+    rows     positions in the new catalog holding a different product than
+             before (updated, added, or moved into a removed product's slot),
+             sorted; positions at or past `size` no longer exist
+    moved    {old position: new position} of the products that were moved
+    added / updated / removed
+             node ids of each kind of change
+    removed_rows
+             old positions of the removed products
+    inserted_rows
+             new positions of the updated and added products, sorted
+    """
+
+    def __init__(self, rows, old_size, size, added=(), updated=(), removed=(), moved=None,
+                 removed_rows=(), inserted_rows=()):
+        self.rows = np.asarray(sorted(rows), dtype=np.int64)
+        self.old_size = old_size
+        self.size = size
+        self.added = tuple(added)
+        self.updated = tuple(updated)
+        self.removed = tuple(removed)
+        self.moved = dict(moved or {})
+        self.removed_rows = np.asarray(removed_rows, dtype=np.int64)
+        self.inserted_rows = np.asarray(sorted(inserted_rows), dtype=np.int64)
+
+    def remap(self):
+        # Old position -> new position of every product, -1 for removed products
+        positions = np.arange(self.old_size, dtype=np.int64)
+        positions[self.removed_rows] = -1
+        if self.moved:
+            positions[list(self.moved)] = list(self.moved.values())
+        return positions
+
+    @property
+    def changed(self):
+        # Node ids whose product data differs between the two versions
+        return set(self.added) | set(self.updated) | set(self.removed)
+
+    def __len__(self):
+        return len(self.added) + len(self.updated) + len(self.removed)
+
+    def __repr__(self):
+        return (f"CatalogDelta(added={len(self.added)}, updated={len(self.updated)}, "
+                f"removed={len(self.removed)}, size={self.old_size}->{self.size})")
@@ -0,0 +1,307 @@
+import os
+import sys
+import threading
+import time
+from collections.abc import Mapping
+
+from modules.binary_catalog import load_catalog
+from modules.catalog_delta import CatalogDelta
+from modules.ingest import normalize_product
+from modules.metrics import count, stage, timed
+
+
+def _deep_sizeof(obj, seen=None):
+    # Rough recursive size of the parsed catalog (dicts, lists, strings, numbers)
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        for key, value in obj.items():
+            size += _deep_sizeof(key, seen) + _deep_sizeof(value, seen)
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        for item in obj:
+            size += _deep_sizeof(item, seen)
+    elif hasattr(type(obj), '__slots__'):
+        for cls in type(obj).__mro__:
+            for name in getattr(cls, '__slots__', ()):
+                if hasattr(obj, name):
+                    size += _deep_sizeof(getattr(obj, name), seen)
+    return size
+
+
+class CatalogSnapshot:
+    """
+    One immutable, fully loaded version of the product catalog.
+    Routes read `products` and must treat the dicts as read-only.
+    Indexes built on top of a snapshot are memoized through `derived()`
+    so they are built once per catalog version and dropped with it, unless
+    they were registered with a `patch` function: those are carried over to
+    the next version by patching the rows a mutation changed.
+    """
+
+    def __init__(self, products, version, mtime, load_seconds, size_bytes):
+        # Lists are frozen; a compiled catalog is already a read-only sequence
+        self.products = tuple(products) if isinstance(products, list) else products
+        self.version = version
+        self.mtime = mtime
+        self.load_seconds = load_seconds
+        self.size_bytes = size_bytes
+        self._derived = {}
+        self._patchers = {}
+        self._derived_locks = {}
+        self._locks_lock = threading.Lock()
+
+    def derived(self, key, builder, patch=None):
+        # Build (once) and cache a structure that depends only on this snapshot.
+        # patch(value, next_snapshot, delta) returns the structure for the next
+        # version after a mutation, or None to have it rebuilt on demand.
+        try:
+            return self._derived[key]
+        except KeyError:
+            pass
+        # One lock per key, so a slow build (the graph) does not hold up others
+        with self._locks_lock:
+            lock = self._derived_locks.setdefault(key, threading.RLock())
+        with lock:
+            if key not in self._derived:
+                with stage(f"snapshot.{key}"):
+                    value = builder(self)
+                if patch is not None:
+                    self._patchers[key] = patch
+                self._derived[key] = value
+            return self._derived[key]
+
+    def cached(self, key):
+        # The derived structure if it has been built, without building it
+        return self._derived.get(key)
+
+    def positions(self):
+        # node_id -> catalog position
+        return self.derived("positions", _build_positions, patch=_patch_positions)
+
+    def successor(self, products, delta, version, load_seconds, size_bytes):
+        # The next version after `delta`. Patchable structures are patched in the
+        # order they were built, so one may use another that it was built from.
+        snapshot = CatalogSnapshot(products, version, self.mtime, load_seconds, size_bytes)
+        for key, value in list(self._derived.items()):
+            patch = self._patchers.get(key)
+            if patch is None:
+                continue
+            with stage(f"snapshot.patch.{key}"):
+                value = patch(value, snapshot, delta)
+            if value is not None:
+                snapshot._patchers[key] = patch
+                snapshot._derived[key] = value
+        return snapshot
+
+    def stats(self):
+        return {
+            "version": self.version,
+            "products": len(self.products),
+            "mtime": self.mtime,
+            "load_seconds": self.load_seconds,
+            "size_bytes": self.size_bytes,
+        }
+
+    def __repr__(self):
+        return f"CatalogSnapshot(version={self.version}, products={len(self.products)})"
+
+
+def _node_ids(products):
+    return products.strings("node_id") if hasattr(products, "strings") else [p["node_id"] for p in products]
+
+
+def _build_positions(snapshot):
+    return {node: i for i, node in enumerate(_node_ids(snapshot.products))}
+
+
+def _patch_positions(positions, snapshot, delta):
+    positions = dict(positions)
+    for node in delta.removed:
+        del positions[node]
+    for i in delta.rows.tolist():
+        positions[snapshot.products[i]["node_id"]] = i
+    return positions
+
+
+class CatalogStore:
+    """
+    Process-wide holder of the current CatalogSnapshot.
+    The dataset is parsed once; `snapshot()` re-checks the file's mtime and
+    swaps in a freshly loaded snapshot when the file changed on disk.
+    Readers holding an older snapshot keep a consistent view until they drop it.
+
+    Products can also be added, updated and removed in memory (`apply()`);
+    each batch is published as a new version built from the previous one.
+    Mutations are not written back to the file, and a change of the file on
+    disk replaces them with its contents.
+    """
+
+    def __init__(self, path, loader=None, check_interval=1.0, record=None):
+        self.path = path
+        self.loader = loader or load_catalog
+        self.check_interval = check_interval
+        # Turns a submitted product dict into a catalog record (a normalized dict by default)
+        self.record = record or normalize_product
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._version = 0
+        self._last_check = 0.0
+        self._listeners = []
+
+    def _load(self, mtime):
+        started = time.perf_counter()
+        products = self.loader(self.path)
+        load_seconds = time.perf_counter() - started
+        self._version += 1
+        return CatalogSnapshot(
+            products,
+            version=self._version,
+            mtime=mtime,
+            load_seconds=load_seconds,
+            size_bytes=getattr(products, "nbytes", None) or _deep_sizeof(products),
+        )
+
+    def snapshot(self):
+        current = self._snapshot
+        now = time.monotonic()
+        if current is not None and now - self._last_check < self.check_interval:
+            return current
+
+        with self._lock:
+            self._last_check = now
+            mtime = os.path.getmtime(self.path)
+            if self._snapshot is None or self._snapshot.mtime != mtime:
+                # Build the new snapshot fully before publishing it
+                self._snapshot = self._load(mtime)
+            return self._snapshot
+
+    def reload(self):
+        # Force a reload regardless of mtime
+        with self._lock:
+            self._last_check = time.monotonic()
+            self._snapshot = self._load(os.path.getmtime(self.path))
+            return self._snapshot
+
+    def on_update(self, listener):
+        # listener(old_snapshot, new_snapshot, delta) runs for every mutation,
+        # before the new version is published
+        self._listeners.append(listener)
+        return listener
+
+    @timed("catalog.apply")
+    def apply(self, added=(), updated=None, removed=()):
+        """
+        Applies one batch of product mutations and publishes the result as a
+        new catalog version. `added` are full product dicts with new node ids,
+        `updated` maps node ids to the fields to change (a None value deletes
+        the field) and `removed` lists node ids to delete; removals are applied
+        first, then updates, then additions. The batch is checked and built as
+        a whole before it is published, so either all of it is visible or none.
+        Raises KeyError for unknown node ids and ValueError for invalid products.
+        """
+        added, updated, removed = list(added), dict(updated or {}), list(removed)
+        with self._lock:
+            started = time.perf_counter()
+            current = self._current()
+            products = self._records(current)
+            positions = dict(current.positions())
+            rows = set()
+            origins = {}  # position -> original position, of the products moved so far
+            replaced, inserted = [], []
+            removed_rows, inserted_rows = [], []
+
+            for node in removed:
+                if node not in positions:
+                    raise KeyError(node)
+                i = positions.pop(node)
+                removed_rows.append(origins.pop(i, i))
+                replaced.append(products[i])
+                last = products.pop()
+                if i < len(products):
+                    # The last product takes the removed product's slot
+                    products[i] = last
+                    positions[last["node_id"]] = i
+                    origins[i] = origins.pop(len(products), len(products))
+                    rows.add(i)
+                rows.discard(len(products))
+
+            for node, fields in updated.items():
+                if node not in positions:
+                    raise KeyError(node)
+                if not isinstance(fields, Mapping):
+                    raise ValueError(f"Update of {node} must be an object of fields")
+                if fields.get("node_id", node) != node:
+                    raise ValueError(f"node_id of {node} cannot be changed")
+                i = positions[node]
+                merged = dict(products[i])
+                for key, value in fields.items():
+                    if value is None:
+                        merged.pop(key, None)
+                    else:
+                        merged[key] = value
+                replaced.append(products[i])
+                products[i] = self.record(merged)
+                inserted.append(products[i])
+                inserted_rows.append(i)
+                rows.add(i)
+
+            for product in added:
+                if not isinstance(product, Mapping) or not isinstance(product.get("node_id"), str):
+                    raise ValueError("Added products must be objects with a string 'node_id'")
+                if product["node_id"] in positions:
+                    raise ValueError(f"Product {product['node_id']} already exists")
+                positions[product["node_id"]] = len(products)
+                rows.add(len(products))
+                inserted_rows.append(len(products))
+                products.append(self.record(product))
+                inserted.append(products[-1])
+
+            delta = CatalogDelta(rows, len(current.products), len(products),
+                                 added=[p["node_id"] for p in added], updated=list(updated), removed=removed,
+                                 moved={old: new for new, old in origins.items()},
+                                 removed_rows=removed_rows, inserted_rows=inserted_rows)
+            if isinstance(current.products, tuple):
+                size_bytes = (current.size_bytes + sum(_deep_sizeof(p) for p in inserted)
+                              - sum(_deep_sizeof(p) for p in replaced)
+                              + 8 * (len(products) - len(current.products)))
+            else:
+                size_bytes = _deep_sizeof(products)
+
+            snapshot = current.successor(products, delta, self._version + 1,
+                                         load_seconds=time.perf_counter() - started, size_bytes=size_bytes)
+            for listener in self._listeners:
+                listener(current, snapshot, delta)
+            self._version += 1
+            self._snapshot = snapshot
+            count("products_mutated", len(delta))
+            return snapshot
+
+    def add(self, products):
+        return self.apply(added=products)
+
+    def update(self, changes):
+        return self.apply(updated=changes)
+
+    def remove(self, node_ids):
+        return self.apply(removed=node_ids)
+
+    def _current(self):
+        # Called with the lock held: the published snapshot, loading it if needed
+        if self._snapshot is None:
+            self._last_check = time.monotonic()
+            self._snapshot = self._load(os.path.getmtime(self.path))
+        return self._snapshot
+
+    def _records(self, snapshot):
+        # Mutable copy of the catalog's products; a compiled catalog is
+        # converted to records on its first mutation
+        if isinstance(snapshot.products, tuple):
+            return list(snapshot.products)
+        return [self.record(p) for p in snapshot.products]
+
+    def stats(self):
+        return self.snapshot().stats()
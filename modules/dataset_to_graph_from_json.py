@@ -1,34 +1,230 @@
+from collections.abc import Mapping
+
+import numpy as np
+
+from modules.binary_catalog import load_catalog, mapped_column, numeric_column
+from modules.catalog_delta import resized
+from modules.features import delivery_days
+from modules.metrics import timed
 from modules.product_graph import ProductGraph
+from modules.weight_spec import DEFAULT_WEIGHT_SPEC, DELIVERY_WEIGHT, PRICE_WEIGHT, RATING_WEIGHT
+
 def load_dataset(path):
-    with open(path, 'r') as file:
-        content = file.read()
-        data = eval(content)  # only safe here because you're using your own dataset
-    return data
-
-def delivery_days(delivery_str):
-    try:
-        parts = delivery_str.split('-')
-        return (int(parts[0]) + int(parts[1].split()[0])) / 2
-    except:
-        return 5  # default fallback
+    # JSON / JSON Lines are streamed product by product; compiled catalogs are memory-mapped
+    return load_catalog(path)
+
+def product_delivery_days(product):
+    # Product records carry the parsed value; plain dicts are parsed here
+    days = getattr(product, 'delivery_days', None)
+    return days if days is not None else delivery_days(product['delivery_time'])
 
 def calculate_weight(p1, p2):
     price_diff = abs(p1['price'] - p2['price'])
     rating_diff = abs(p1['seller_rating'] - p2['seller_rating'])
-    delivery_diff = abs(delivery_days(p1['delivery_time']) - delivery_days(p2['delivery_time']))
+    delivery_diff = abs(product_delivery_days(p1) - product_delivery_days(p2))
     return price_diff + rating_diff * 10 + delivery_diff * 2
 
-def build_graph_from_json(path):
-    data = load_dataset(path)
+def node_ids_of(data):
+    return data.strings("node_id") if hasattr(data, "strings") else [p["node_id"] for p in data]
+
+class _ImplicitAdjacency(Mapping):
+    # Read-only { node_id: [(neighbor, weight), ...] } view computed on demand
+    def __init__(self, graph):
+        self._graph = graph
+
+    def __getitem__(self, node):
+        if node not in self._graph.index:
+            raise KeyError(node)
+        return self._graph.get_neighbors(node)
+
+    def __iter__(self):
+        return iter(self._graph.node_ids)
+
+    def __len__(self):
+        return len(self._graph.node_ids)
+
+
+class ImplicitProductGraph:
+    """
+    Complete product graph that never stores its edges.
+    Features used by calculate_weight are parsed once into per-node arrays and
+    edge weights are computed on demand, so memory grows linearly with products.
+
+    By default the weight is the weighted L1 distance of calculate_weight, which
+    is a metric. A custom `weight_fn(graph, i)` returning the weight vector of
+    node i may be supplied instead; `lower_bound` then optionally gives
+    (price, rating, delivery) coefficients of an L1 distance that never exceeds
+    the custom weight, which path search uses as an A* heuristic.
+    A compiled WeightSpec (`kernel`, or `spec` in from_data) replaces the
+    default weight with the spec's vectorized kernel.
+    """
+
+    def __init__(self, node_ids, prices, ratings, deliveries,
+                 coefficients=(PRICE_WEIGHT, RATING_WEIGHT, DELIVERY_WEIGHT),
+                 weight_fn=None, lower_bound=None, kernel=None, index=None):
+        self.node_ids = list(node_ids)
+        self.index = index if index is not None else {node: i for i, node in enumerate(self.node_ids)}
+        self.prices = np.asarray(prices, dtype=np.float64)
+        self.ratings = np.asarray(ratings, dtype=np.float64)
+        self.deliveries = np.asarray(deliveries, dtype=np.float64)
+        self.coefficients = tuple(coefficients)
+        self.weight_fn = weight_fn
+        self.lower_bound = tuple(lower_bound) if lower_bound is not None else None
+        self.kernel = kernel
+        self.graph = _ImplicitAdjacency(self)
+
+    @classmethod
+    def from_data(cls, data, spec=None, **kwargs):
+        # data is a list of products or a compiled (memory-mapped) catalog
+        if spec is not None:
+            kwargs["kernel"] = spec.compile(data)
+        return cls(
+            node_ids_of(data),
+            numeric_column(data, 'price'),
+            numeric_column(data, 'seller_rating'),
+            mapped_column(data, 'delivery_time', delivery_days),
+            **kwargs,
+        )
+
+    def patched(self, data, delta):
+        # Graph of the catalog after `delta`: only the changed nodes' features are parsed.
+        # Edges are computed on demand, so this patches every edge weight they touch.
+        changed = [data[i] for i in delta.rows.tolist()]
+        node_ids = self.node_ids[:delta.size] + [None] * (delta.size - len(self.node_ids))
+        index = dict(self.index)
+        for node in delta.removed:
+            index.pop(node, None)
+        for i, product in zip(delta.rows.tolist(), changed):
+            node_ids[i] = product['node_id']
+            index[product['node_id']] = i
+        features = []
+        for values, column in ((self.prices, numeric_column(changed, 'price')),
+                               (self.ratings, numeric_column(changed, 'seller_rating')),
+                               (self.deliveries, mapped_column(changed, 'delivery_time', delivery_days))):
+            values = resized(values, delta.size)
+            values[delta.rows] = column
+            features.append(values)
+        kernel = self.kernel.patched(data, delta) if self.kernel is not None else None
+        return ImplicitProductGraph(node_ids, *features, coefficients=self.coefficients, weight_fn=self.weight_fn,
+                                    lower_bound=self.lower_bound, kernel=kernel, index=index)
+
+    def __len__(self):
+        return len(self.node_ids)
+
+    @property
+    def is_metric(self):
+        # A weighted L1 distance with non-negative coefficients obeys the triangle inequality
+        if self.weight_fn is not None:
+            return False
+        if self.kernel is not None:
+            return self.kernel.is_metric
+        return all(c >= 0 for c in self.coefficients)
+
+    @property
+    def weight_key(self):
+        # Identifies the weight function, for caches of path results
+        if self.kernel is not None:
+            return (self.kernel.key, self.weight_fn, self.lower_bound)
+        return (self.coefficients, self.weight_fn, self.lower_bound)
+
+    def l1_from(self, i, coefficients):
+        price_w, rating_w, delivery_w = coefficients
+        price_diff = np.abs(self.prices - self.prices[i])
+        rating_diff = np.abs(self.ratings - self.ratings[i])
+        delivery_diff = np.abs(self.deliveries - self.deliveries[i])
+        return price_diff * price_w + rating_diff * rating_w + delivery_diff * delivery_w
+
+    def weights_from(self, i):
+        # Weights of every edge (i, j) as one vector; entry i is 0
+        if self.weight_fn is not None:
+            weights = np.asarray(self.weight_fn(self, i), dtype=np.float64)
+            weights[i] = 0
+            return weights
+        if self.kernel is not None:
+            return self.kernel.weights_from(i)
+        return self.l1_from(i, self.coefficients)
+
+    def weight(self, node1, node2):
+        i, j = self.index[node1], self.index[node2]
+        if self.weight_fn is not None:
+            return float(self.weights_from(i)[j])
+        if self.kernel is not None:
+            return self.kernel.weight(i, j)
+        price_w, rating_w, delivery_w = self.coefficients
+        return float(abs(self.prices[i] - self.prices[j]) * price_w
+                     + abs(self.ratings[i] - self.ratings[j]) * rating_w
+                     + abs(self.deliveries[i] - self.deliveries[j]) * delivery_w)
+
+    def get_neighbors(self, node):
+        i = self.index.get(node)
+        if i is None:
+            return []
+        weights = self.weights_from(i).tolist()
+        return [(other, weights[j]) for j, other in enumerate(self.node_ids) if j != i]
+
+    def __repr__(self):
+        return f"ImplicitProductGraph(nodes={len(self.node_ids)})"
+
+
+def build_knn_graph(implicit, k):
+    # Sparsified graph keeping only the k lightest edges of each node (symmetrized)
+    n = len(implicit)
+    k = min(k, n - 1)
     graph = ProductGraph()
+    seen = set()
+    for i in range(n):
+        weights = implicit.weights_from(i)
+        weights[i] = np.inf
+        if k <= 0:
+            continue
+        nearest = np.argpartition(weights, k - 1)[:k]
+        for j in nearest.tolist():
+            key = (i, j) if i < j else (j, i)
+            if key in seen:
+                continue
+            seen.add(key)
+            graph.add_connection(implicit.node_ids[i], implicit.node_ids[j], float(weights[j]))
+    return graph
+
+
+def build_graph_from_json(path, mode="full", k=10, spec=None):
+    return build_graph_from_data(load_dataset(path), mode=mode, k=k, spec=spec)
+
+@timed("build_graph")
+def build_graph_from_data(data, mode="full", k=10, spec=None):
+    # mode="full": every pair stored as an edge (original behaviour, O(n^2) memory)
+    # mode="implicit": ImplicitProductGraph, weights computed on demand
+    # mode="knn": ProductGraph holding only each node's k nearest neighbours
+    # spec: WeightSpec for the edge weights, calculate_weight when omitted
+    if mode == "implicit":
+        return ImplicitProductGraph.from_data(data, spec=spec)
+    if mode == "knn":
+        return build_knn_graph(ImplicitProductGraph.from_data(data, spec=spec), k)
+    if mode != "full":
+        raise ValueError(f"Unknown graph mode: {mode}")
+
+    graph = ProductGraph()
+    node_ids = node_ids_of(data)
+    if len(node_ids) < 2:
+        return graph
+    kernel = (spec or DEFAULT_WEIGHT_SPEC).compile(data)
+
+    if len(set(node_ids)) < len(node_ids):
+        # Repeated node ids merge adjacency lists; keep add_connection's pair order
+        for start, block in kernel.iter_blocks():
+            for r, row in enumerate(block.tolist()):
+                i = start + r
+                for j in range(i + 1, len(node_ids)):
+                    graph.add_connection(node_ids[i], node_ids[j], row[j])
+        return graph
 
-    for i in range(len(data)):
-        for j in range(i + 1, len(data)):
-            p1 = data[i]
-            p2 = data[j]
-            node1 = p1["node_id"]
-            node2 = p2["node_id"]
-            weight = calculate_weight(p1, p2)
-            graph.add_connection(node1, node2, weight)
+    # Node i's adjacency list is every other node in catalog order, which is
+    # one row of the weight matrix without its diagonal entry
+    for start, block in kernel.iter_blocks():
+        for r, row in enumerate(block.tolist()):
+            i = start + r
+            neighbors = list(zip(node_ids, row))
+            del neighbors[i]
+            graph.graph[node_ids[i]] = neighbors
 
     return graph
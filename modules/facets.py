@@ -0,0 +1,199 @@
+import numpy as np
+
+from modules.catalog_delta import resized
+from modules.metrics import timed
+
+# Facets counted per distinct field value
+VALUE_FACETS = ("platform", "category", "brand", "RAM", "Storage", "Processor")
+
+# Facets counted per range of a FilterIndex column: facet -> (column, bucket lower bounds).
+# Each bucket runs up to the next bound, the last one is open-ended.
+BUCKET_FACETS = {
+    "price": ("price", (0, 500, 1000, 1500, 2000)),
+    "seller_rating": ("seller_rating", (0, 3, 3.5, 4, 4.5)),
+}
+
+# Byte -> number of set bits, for NumPy versions without np.bitwise_count
+_BIT_COUNTS = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def _words(size):
+    # Bytes per bitmap of `size` rows, padded to whole 64-bit words
+    return (size + 63) // 64 * 8
+
+
+def popcount(bitmaps):
+    # Set bits per row of a 2-D uint8 bitmap array (or in one 1-D bitmap)
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(bitmaps.view(np.uint64)).sum(axis=-1, dtype=np.int64)
+    return _BIT_COUNTS[bitmaps].sum(axis=-1, dtype=np.int64)
+
+
+def to_bitmap(rows, size):
+    # Bitmap with the bits of `rows` (indices or a boolean mask) set; bit i is bit i % 8 of byte i // 8
+    mask = np.zeros(_words(size) * 8, dtype=bool)
+    if rows.dtype == bool:
+        mask[:size] = rows
+    else:
+        mask[rows] = True
+    return np.packbits(mask, bitorder="little")
+
+
+def _bucket_labels(bounds):
+    # (0, 500, 1000) -> ["0-500", "500-1000", "1000+"]
+    text = [f"{bound:g}" for bound in bounds]
+    return [f"{low}-{high}" for low, high in zip(text, text[1:])] + [f"{text[-1]}+"]
+
+
+def _bucket_codes(column, bounds):
+    # Bucket of each value; -1 below the first bound or NaN
+    codes = np.searchsorted(np.asarray(bounds, dtype=np.float64), column, side="right").astype(np.int32) - 1
+    codes[np.isnan(column)] = -1
+    return codes
+
+
+class Facet:
+    """
+    One bitmap per value of a facet: bit i of bitmaps[v] is set when product
+    i has value v. codes holds each product's value (-1 for none), so a
+    changed product's bit can be moved without scanning the bitmaps, and
+    totals the number of products per value.
+    """
+
+    def __init__(self, values, codes, size):
+        self.values = list(values)
+        self.codes = codes
+        self.bitmaps = np.empty((len(self.values), _words(size)), dtype=np.uint8)
+        for code in range(len(self.values)):
+            self.bitmaps[code] = to_bitmap(codes == code, size)
+        self.totals = popcount(self.bitmaps)
+
+    def _set(self, rows):
+        np.bitwise_or.at(self.bitmaps, (self.codes[rows], rows >> 3), (1 << (rows & 7)).astype(np.uint8))
+
+    def patched(self, rows, codes, size, values=None):
+        # Facet after `rows` got new `codes` (and `values` new entries); rows at or past `size` are dropped
+        facet = Facet.__new__(Facet)
+        facet.values = list(self.values if values is None else values)
+        facet.bitmaps = np.zeros((len(facet.values), _words(size)), dtype=np.uint8)
+        width = min(self.bitmaps.shape[1], facet.bitmaps.shape[1])
+        facet.bitmaps[:len(self.values), :width] = self.bitmaps[:, :width]
+
+        stale = np.union1d(rows[rows < len(self.codes)], np.arange(size, len(self.codes)))
+        stale = stale[(self.codes[stale] >= 0) & (stale >> 3 < width)]
+        np.bitwise_and.at(facet.bitmaps, (self.codes[stale], stale >> 3), ~(1 << (stale & 7)).astype(np.uint8))
+
+        facet.codes = resized(self.codes, size)
+        facet.codes[rows] = codes
+        facet._set(rows[codes >= 0])
+        facet.totals = popcount(facet.bitmaps)
+        return facet
+
+    def union(self, values):
+        # Bitmap of the products having any of `values`
+        code = {value: i for i, value in enumerate(self.values)}
+        chosen = [code[value] for value in values if value in code]
+        if not chosen:
+            return np.zeros(self.bitmaps.shape[1], dtype=np.uint8)
+        return np.bitwise_or.reduce(self.bitmaps[chosen], axis=0)
+
+
+class FacetIndex:
+    """
+    Bitmap index answering facet counts: how many products matching a query
+    have each brand, RAM, Storage, Processor, platform or category value, or
+    fall into each price and seller_rating bucket. The /filter criteria are
+    turned into one bitmap through the FilterIndex; selected facet values are
+    unions of precomputed bitmaps, and every count is an AND plus popcount
+    over n / 64 words, with no pass over the products.
+    """
+
+    def __init__(self, data, filter_index):
+        self.size = len(data)
+        self.filter_index = filter_index
+        self.facets = {}
+        for name in VALUE_FACETS:
+            values = [p.get(name) for p in data]
+            names = sorted(value for value in set(values) if isinstance(value, str))
+            code = {value: i for i, value in enumerate(names)}
+            codes = np.array([code.get(value, -1) for value in values], dtype=np.int32)
+            self.facets[name] = Facet(names, codes, self.size)
+        for name, (column, bounds) in BUCKET_FACETS.items():
+            codes = _bucket_codes(getattr(filter_index, column), bounds)
+            self.facets[name] = Facet(_bucket_labels(bounds), codes, self.size)
+
+    def patched(self, data, delta, filter_index):
+        # Index of the catalog after `delta`: only the changed rows' bits are moved
+        index = FacetIndex.__new__(FacetIndex)
+        index.size = delta.size
+        index.filter_index = filter_index
+        index.facets = {}
+        rows = delta.rows
+        changed = [data[i] for i in rows.tolist()]
+        for name in VALUE_FACETS:
+            facet = self.facets[name]
+            values = [p.get(name) for p in changed]
+            names = list(facet.values)
+            code = {value: i for i, value in enumerate(names)}
+            for value in values:
+                if isinstance(value, str) and value not in code:
+                    code[value] = len(names)
+                    names.append(value)
+            codes = np.array([code[value] if isinstance(value, str) else -1 for value in values], dtype=np.int32)
+            # A value no product has any more keeps an empty bitmap, and is not listed, until the next full build
+            index.facets[name] = facet.patched(rows, codes, delta.size, names)
+        for name, (column, bounds) in BUCKET_FACETS.items():
+            codes = _bucket_codes(getattr(filter_index, column)[rows], bounds)
+            index.facets[name] = self.facets[name].patched(rows, codes, delta.size)
+        return index
+
+    def _selection(self, selected, exclude=None):
+        # AND of the selected facets' unions, except the `exclude` facet; None when nothing is selected
+        bitmap = None
+        for name, values in selected.items():
+            if name == exclude:
+                continue
+            union = self.facets[name].union(values)
+            bitmap = union if bitmap is None else bitmap & union
+        return bitmap
+
+    @timed("facets")
+    def counts(self, selected=None, facets=None, **filters):
+        """
+        (total, {facet: [(value, count), ...]}) for the products passing the
+        /filter `filters` and having, for every facet in `selected`, one of
+        its selected values. As usual for multi-select facets, a facet's own
+        selection does not narrow its counts, so its other values show how
+        many products selecting them as well would add. Values are listed
+        most frequent first (buckets in range order) and zero counts are kept.
+        """
+        selected = {name: list(values) for name, values in (selected or {}).items()}
+        facets = list(self.facets) if facets is None else list(facets)
+        unknown = (set(selected) | set(facets)) - set(self.facets)
+        if unknown:
+            raise ValueError(f"Unknown facets: {', '.join(sorted(unknown))}")
+
+        base = None
+        if any(value is not None for value in filters.values()):
+            base = to_bitmap(self.filter_index.select(**filters), self.size)
+        everything = self._selection(selected)
+        if base is not None:
+            everything = base if everything is None else everything & base
+        total = self.size if everything is None else int(popcount(everything))
+
+        results = {}
+        for name in facets:
+            facet = self.facets[name]
+            if name in selected:
+                within = self._selection(selected, exclude=name)
+                if base is not None:
+                    within = base if within is None else within & base
+            else:
+                within = everything
+            counts = popcount(facet.bitmaps if within is None else facet.bitmaps & within)
+            pairs = [(value, n) for value, n, total in zip(facet.values, counts.tolist(), facet.totals.tolist())
+                     if total or name in BUCKET_FACETS]
+            if name in VALUE_FACETS:
+                pairs.sort(key=lambda pair: (-pair[1], pair[0]))
+            results[name] = pairs
+        return total, results
@@ -0,0 +1,69 @@
+import re
+
+import numpy as np
+
+from modules.binary_catalog import mapped_column, numeric_column
+
+SIZE_RE = re.compile(r"(\d+(?:\.\d+)?)\s*(mb|gb|tb)?", re.IGNORECASE)
+SIZE_UNITS_GB = {"mb": 1 / 1024, "gb": 1, "tb": 1024}
+NUMBER_RE = re.compile(r"\d+(?:\.\d+)?")
+
+
+def delivery_days(delivery_str):
+    try:
+        parts = delivery_str.split('-')
+        return (int(parts[0]) + int(parts[1].split()[0])) / 2
+    except:
+        return 5  # default fallback
+
+
+def parse_size_gb(value):
+    # "32GB" -> 32, "1TB" -> 1024, "512 MB" -> 0.5; None when there is no number
+    match = SIZE_RE.search(value) if isinstance(value, str) else None
+    if not match:
+        return None
+    number = float(match.group(1)) * SIZE_UNITS_GB[(match.group(2) or "gb").lower()]
+    return int(number) if number.is_integer() else number
+
+
+def parse_screen_inches(value):
+    match = NUMBER_RE.search(value) if isinstance(value, str) else None
+    return float(match.group(0)) if match else None
+
+
+def _or_zero(parse):
+    # Missing or unparseable values count as 0, like RAM in build_feature_matrix
+    def parse_or_zero(value):
+        number = parse(value)
+        return 0 if number is None else number
+    return parse_or_zero
+
+
+# Feature name -> (source field, parser) for features derived from a string field.
+# Any other feature name is read as a numeric field of the same name.
+DERIVED_FEATURES = {
+    "delivery_days": ("delivery_time", delivery_days),
+    "ram_gb": ("RAM", _or_zero(parse_size_gb)),
+    "storage_gb": ("Storage", _or_zero(parse_size_gb)),
+    "screen_inches": ("Screen Size", _or_zero(parse_screen_inches)),
+}
+
+
+def feature_column(data, name):
+    # float64 column of one numeric feature, for a list of products or a compiled catalog
+    if name in DERIVED_FEATURES:
+        field, parse = DERIVED_FEATURES[name]
+        return mapped_column(data, field, parse)
+    return numeric_column(data, name)
+
+
+def category_codes(data, field):
+    # int32 code per product, equal codes for equal values; -1 when the field is absent
+    if hasattr(data, "string_table"):
+        return np.asarray(data.string_table(field)[1], dtype=np.int32)
+    table = {}
+    codes = np.empty(len(data), dtype=np.int32)
+    for i, p in enumerate(data):
+        value = p.get(field)
+        codes[i] = -1 if value is None else table.setdefault(value, len(table))
+    return codes
@@ -0,0 +1,152 @@
+import numpy as np
+
+from modules.binary_catalog import mapped_column, numeric_column
+from modules.catalog_delta import resized
+from modules.metrics import count, timed
+from modules.product_filter_and_recommender import parse_delivery_time
+
+
+# Columns kept sorted for range lookups
+SORTED_COLUMNS = ("price", "seller_rating", "review_count", "delivery_max")
+
+
+def _or_nan(value):
+    return np.nan if value is None else value
+
+
+def _bound(name, value):
+    # A filter bound as a float ("4" and 4 are the same bound); None when not given
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        raise ValueError(f"'{name}' must be a number")
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"'{name}' must be a number")
+    if np.isnan(value):
+        raise ValueError(f"'{name}' must be a number")
+    return value
+
+
+def _columns(data):
+    # Delivery strings are parsed once; unparseable values become NaN
+    return {
+        "price": numeric_column(data, 'price'),
+        "seller_rating": numeric_column(data, 'seller_rating'),
+        "review_count": numeric_column(data, 'review_count'),
+        "delivery_min": mapped_column(data, 'delivery_time', lambda d: _or_nan(parse_delivery_time(d)[0])),
+        "delivery_max": mapped_column(data, 'delivery_time', lambda d: _or_nan(parse_delivery_time(d)[1])),
+    }
+
+
+class FilterIndex:
+    """
+    Columnar index answering filter_products() queries without touching the dicts.
+    It can be built from a list of products or straight from a compiled catalog.
+    Numeric fields are held as NumPy columns together with a sorted permutation
+    per column, so each range condition is two binary searches. The most selective
+    condition picks the candidates; the others are applied as vectorized masks.
+    """
+
+    def __init__(self, data):
+        self.size = len(data)
+        for name, column in _columns(data).items():
+            setattr(self, name, column)
+        self._delivery_unknown = np.flatnonzero(np.isnan(self.delivery_max))
+
+        self._sorted = {}
+        for name in SORTED_COLUMNS:
+            column = getattr(self, name)
+            order = np.argsort(column, kind="stable")  # NaN sorts last
+            self._sorted[name] = (order, column[order])
+
+    def patched(self, data, delta):
+        # Index of the catalog after `delta`: only the changed rows are parsed,
+        # and they are taken out of and merged back into each sorted column
+        index = FilterIndex.__new__(FilterIndex)
+        index.size = delta.size
+        rows = delta.rows
+        for name, values in _columns([data[i] for i in rows.tolist()]).items():
+            column = resized(getattr(self, name), delta.size)
+            column[rows] = values
+            setattr(index, name, column)
+        index._delivery_unknown = np.flatnonzero(np.isnan(index.delivery_max))
+
+        stale = np.zeros(max(self.size, delta.size), dtype=bool)
+        stale[rows] = True
+        stale[delta.size:] = True
+        index._sorted = {}
+        for name, (order, values) in self._sorted.items():
+            keep = ~stale[order]
+            order, values = order[keep], values[keep]
+            column = getattr(index, name)
+            new_order = rows[np.argsort(column[rows], kind="stable")]
+            at = np.searchsorted(values, column[new_order], side='right')
+            index._sorted[name] = (np.insert(order, at, new_order), np.insert(values, at, column[new_order]))
+        return index
+
+    def _candidates(self, name, low, high):
+        # Indices with low <= value <= high, found by binary search on the sorted column
+        order, values = self._sorted[name]
+        lo = 0 if low is None else int(np.searchsorted(values, low, side='left'))
+        hi = self.size if high is None else int(np.searchsorted(values, high, side='right'))
+        selected = order[lo:max(lo, hi)]
+        if name == "delivery_max":
+            # Products whose delivery time cannot be parsed are never filtered out
+            selected = np.concatenate((selected, self._delivery_unknown))
+        return selected
+
+    def _mask(self, name, low, high, candidates):
+        column = getattr(self, name)[candidates]
+        mask = np.ones(len(candidates), dtype=bool)
+        if low is not None:
+            mask &= column >= low
+        if high is not None:
+            mask &= column <= high
+        if name == "delivery_max":
+            mask |= np.isnan(column)
+        return mask
+
+    @staticmethod
+    def _conditions(min_price=None, max_price=None, min_rating=None, min_reviews=None, max_delivery_days=None):
+        # (column, low, high) range per given filter; ValueError for a bound that is not a number
+        min_price, max_price = _bound("min_price", min_price), _bound("max_price", max_price)
+        min_rating, min_reviews = _bound("min_rating", min_rating), _bound("min_reviews", min_reviews)
+        max_delivery_days = _bound("max_delivery_days", max_delivery_days)
+        conditions = []
+        if min_price is not None or max_price is not None:
+            conditions.append(("price", min_price, max_price))
+        if min_rating is not None:
+            conditions.append(("seller_rating", min_rating, None))
+        if min_reviews is not None:
+            conditions.append(("review_count", min_reviews, None))
+        if max_delivery_days is not None:
+            conditions.append(("delivery_max", None, max_delivery_days))
+        return conditions
+
+    def matches(self, rows, **filters):
+        # Boolean mask of the given rows passing the same checks as select()
+        mask = np.ones(len(rows), dtype=bool)
+        for name, low, high in self._conditions(**filters):
+            mask &= self._mask(name, low, high, rows)
+        return mask
+
+    def select(self, **filters):
+        # Indices (in catalog order) of products passing the same checks as filter_products
+        conditions = self._conditions(**filters)
+        if not conditions:
+            return np.arange(self.size)
+
+        # Start from the narrowest sorted range, then mask the remaining conditions
+        ranges = sorted(((self._candidates(*condition), condition) for condition in conditions),
+                        key=lambda item: len(item[0]))
+        candidates = ranges[0][0]
+        count("rows_scanned", len(candidates) * (len(ranges) - 1))
+        for _, (name, low, high) in ranges[1:]:
+            candidates = candidates[self._mask(name, low, high, candidates)]
+        return np.sort(candidates)
+
+    @timed("filter")
+    def filter(self, data, **filters):
+        return [data[i] for i in self.select(**filters).tolist()]
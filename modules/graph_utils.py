@@ -1,27 +1,417 @@
-def dijkstra(graph, start):
-    unvisited = set(graph.graph.keys())
-    distances = {node: float('inf') for node in unvisited}
-    previous = {node: None for node in unvisited}
-    distances[start] = 0
+import heapq
+import multiprocessing
+import os
+import threading
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from modules.metrics import count, stage, timed
+
+
+class CompactGraph:
+    """
+    Integer-indexed copy of a ProductGraph stored in CSR form:
+    the neighbours of node i are targets[offsets[i]:offsets[i + 1]]
+    with matching weights[offsets[i]:offsets[i + 1]].
+    """
+
+    def __init__(self, node_ids, offsets, targets, weights):
+        self.node_ids = list(node_ids)
+        self.index = {node: i for i, node in enumerate(self.node_ids)}
+        self.offsets = offsets
+        self.targets = targets
+        self.weights = weights
+
+    @classmethod
+    def from_product_graph(cls, graph):
+        node_ids = list(graph.graph.keys())
+        index = {node: i for i, node in enumerate(node_ids)}
+        offsets = array('q', [0])
+        targets = array('q')
+        weights = array('d')
+        for node in node_ids:
+            for neighbor, weight in graph.get_neighbors(node):
+                targets.append(index[neighbor])
+                weights.append(weight)
+            offsets.append(len(targets))
+        return cls(node_ids, offsets, targets, weights)
+
+    def __len__(self):
+        return len(self.node_ids)
+
+    def __repr__(self):
+        return f"CompactGraph(nodes={len(self.node_ids)}, edges={len(self.targets)})"
+
+
+def _stop_set(target):
+    # Nodes whose settlement ends a search: none, one node, or a collection of nodes
+    if target is None:
+        return None
+    if isinstance(target, int):
+        return {target}
+    return set(target)
+
+
+@timed("dijkstra")
+def dijkstra_compact(compact, source, target=None):
+    # Heap-based Dijkstra over integer node ids.
+    # Stops as soon as `target` (a node or a collection of nodes) is settled.
+    # Returns (dist, prev) lists indexed by node; unreachable nodes keep inf / -1.
+    n = len(compact)
+    offsets, targets, weights = compact.offsets, compact.targets, compact.weights
+    dist = [float('inf')] * n
+    prev = [-1] * n
+    settled = [False] * n
+    dist[source] = 0
+    heap = [(0, source)]
+    remaining = _stop_set(target)
+    pushes = 1
+    settled_count = 0
+    relaxed = 0
+
+    while heap:
+        d, u = heapq.heappop(heap)
+        if settled[u]:
+            continue
+        settled[u] = True
+        settled_count += 1
+        if remaining is not None:
+            remaining.discard(u)
+            if not remaining:
+                break
+        relaxed += offsets[u + 1] - offsets[u]
+        for k in range(offsets[u], offsets[u + 1]):
+            v = targets[k]
+            if settled[v]:
+                continue
+            new_distance = d + weights[k]
+            if new_distance < dist[v]:
+                dist[v] = new_distance
+                prev[v] = u
+                heapq.heappush(heap, (new_distance, v))
+                pushes += 1
+
+    count("heap_pushes", pushes)
+    count("nodes_settled", settled_count)
+    count("edges_relaxed", relaxed)
+    return dist, prev
+
+
+@timed("dijkstra")
+def dijkstra_implicit(graph, source, target=None):
+    # Dense Dijkstra for graphs that compute edge weights on demand
+    # (ImplicitProductGraph). Each step relaxes all edges of the settled node
+    # with one vectorized weights_from() call; memory stays O(V).
+    # `target` works as in dijkstra_compact.
+    n = len(graph)
+    dist = np.full(n, np.inf)
+    prev = np.full(n, -1, dtype=np.int64)
+    settled = np.zeros(n, dtype=bool)
+    dist[source] = 0
+    remaining = _stop_set(target)
+    settled_count = 0
+
+    for _ in range(n):
+        candidates = np.where(settled, np.inf, dist)
+        u = int(np.argmin(candidates))
+        if candidates[u] == np.inf:
+            break
+        settled[u] = True
+        settled_count += 1
+        if remaining is not None:
+            remaining.discard(u)
+            if not remaining:
+                break
+        new_distance = dist[u] + graph.weights_from(u)
+        improved = (new_distance < dist) & ~settled
+        dist[improved] = new_distance[improved]
+        prev[improved] = u
+
+    # Every settled node relaxes its n - 1 edges in one vector step
+    count("nodes_settled", settled_count)
+    count("edges_relaxed", settled_count * (n - 1))
+    return dist.tolist(), prev.tolist()
+
+
+def build_path(prev, source, target):
+    # Walk predecessors back from target, then reverse once (no insert(0, ...))
+    path = [target]
+    current = target
+    while current != source:
+        current = prev[current]
+        if current == -1:
+            return []
+        path.append(current)
+    path.reverse()
+    return path
+
+
+def shortest_path(graph, start, end):
+    # Accepts a CompactGraph or an implicit graph exposing weights_from().
+    # Returns (path as node ids, total cost); ([], None) when unreachable
+    if start not in graph.index or end not in graph.index:
+        return [], None
+    source = graph.index[start]
+    target = graph.index[end]
+    if hasattr(graph, "weights_from"):
+        dist, prev = dijkstra_implicit(graph, source, target)
+    else:
+        dist, prev = dijkstra_compact(graph, source, target)
+    if dist[target] == float('inf'):
+        return [], None
+    path = build_path(prev, source, target)
+    return [graph.node_ids[i] for i in path], dist[target]
+
+
+@timed("astar")
+def astar_implicit(graph, source, target, coefficients):
+    # A* over an implicit complete graph. The heuristic is the weighted L1
+    # distance to the target with `coefficients`, which must never exceed the
+    # edge weights; it is then consistent, so each node is settled once.
+    n = len(graph)
+    heuristic = graph.l1_from(target, coefficients)
+    dist = np.full(n, np.inf)
+    prev = np.full(n, -1, dtype=np.int64)
+    settled = np.zeros(n, dtype=bool)
+    dist[source] = 0
+    settled_count = 0
+
+    for _ in range(n):
+        candidates = np.where(settled, np.inf, dist + heuristic)
+        u = int(np.argmin(candidates))
+        if candidates[u] == np.inf:
+            break
+        settled[u] = True
+        settled_count += 1
+        if u == target:
+            break
+        new_distance = dist[u] + graph.weights_from(u)
+        improved = (new_distance < dist) & ~settled
+        dist[improved] = new_distance[improved]
+        prev[improved] = u
+
+    count("nodes_settled", settled_count)
+    count("edges_relaxed", max(settled_count - 1, 0) * (n - 1))
+    return dist.tolist(), prev.tolist()
+
 
-    while unvisited:
-        current = min((node for node in unvisited), key=lambda node: distances[node])
-        unvisited.remove(current)
+def plan_shortest_path(graph, start, end, cache=None, version=None):
+    """
+    Picks the cheapest correct strategy for a single (start, end) query and
+    returns (path, total_cost, strategy):
+      "direct"   - complete graph with a metric weight: the direct edge is optimal
+      "cached"   - answered from a cached shortest-path tree of `start`
+      "astar"    - complete graph with a custom weight and a declared L1 lower bound
+      "dijkstra" - anything else (custom weight without a bound, or a stored graph)
+    With a ShortestPathCache, non-direct queries go through the cached full tree
+    of `start` for catalog `version`.
+    """
+    if start not in graph.index or end not in graph.index:
+        return [], None, "none"
 
-        for neighbor, weight in graph.get_neighbors(current):
-            new_distance = distances[current] + weight
-            if new_distance < distances[neighbor]:
-                distances[neighbor] = new_distance
-                previous[neighbor] = current
+    implicit = hasattr(graph, "weights_from")
+    if implicit and start == end:
+        return [start], 0, "direct"
+    if implicit and graph.is_metric:
+        return [start, end], graph.weight(start, end), "direct"
 
+    if cache is not None:
+        path, cost, hit = cache.shortest_path(graph, start, end, version)
+        return path, cost, "cached" if hit else "dijkstra"
+
+    if not implicit:
+        path, cost = shortest_path(graph, start, end)
+        return path, cost, "dijkstra"
+
+    source = graph.index[start]
+    target = graph.index[end]
+    if graph.lower_bound is not None:
+        dist, prev = astar_implicit(graph, source, target, graph.lower_bound)
+        strategy = "astar"
+    else:
+        dist, prev = dijkstra_implicit(graph, source, target)
+        strategy = "dijkstra"
+    if dist[target] == float('inf'):
+        return [], None, strategy
+    path = build_path(prev, source, target)
+    return [graph.node_ids[i] for i in path], dist[target], strategy
+
+
+def dijkstra(graph, start):
+    # Compatibility wrapper: full single-source run returning node-id keyed dicts
+    # Implicit graphs are searched directly; adjacency-list graphs are compacted first
+    if not hasattr(graph, "weights_from"):
+        with stage("compact_graph"):
+            graph = CompactGraph.from_product_graph(graph)
+    if start not in graph.index:
+        distances = {node: float('inf') for node in graph.node_ids}
+        previous = {node: None for node in graph.node_ids}
+        distances[start] = 0
+        return distances, previous
+
+    if hasattr(graph, "weights_from"):
+        dist, prev = dijkstra_implicit(graph, graph.index[start])
+    else:
+        dist, prev = dijkstra_compact(graph, graph.index[start])
+    node_ids = graph.node_ids
+    distances = dict(zip(node_ids, dist))
+    previous = {node: (node_ids[p] if p != -1 else None) for node, p in zip(node_ids, prev)}
     return distances, previous
 
+
 def get_shortest_path(previous, start, end):
     path = []
     current = end
     while current and current != start:
-        path.insert(0, current)
+        path.append(current)
         current = previous[current]
     if current == start:
-        path.insert(0, start)
+        path.append(start)
+    path.reverse()
     return path
+
+
+# Below this many distinct sources a process pool costs more than it saves
+POOL_MIN_SOURCES = 8
+
+# Pool workers are started by a fork server (spawned where there is none): forking
+# a threaded server process can leave the child stuck on a lock another thread held
+_POOL_CONTEXT = multiprocessing.get_context(
+    "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn")
+
+# Process pools by worker count, started on first use and reused by every batch.
+# Tasks carry their graph by value, so a pool never keeps a catalog version alive.
+_pools = {}
+_pool_lock = threading.Lock()
+
+
+def _submit(graph, workers, fn, items):
+    """
+    Futures of fn(graph, chunk) for about four chunks of `items` per worker,
+    run on the shared pool of `workers` processes. Each chunk is sent with
+    its own copy of the graph, so one pool serves every graph and catalog
+    version and is never shut down under running tasks.
+    """
+    with _pool_lock:
+        executor = _pools.get(workers)
+        if executor is None:
+            executor = _pools[workers] = ProcessPoolExecutor(max_workers=workers, mp_context=_POOL_CONTEXT)
+    size = max(1, -(-len(items) // (workers * 4)))
+    return [executor.submit(fn, graph, items[i:i + size]) for i in range(0, len(items), size)]
+
+
+def _solve_source(graph, source, targets):
+    # One single-source search answering every target of this source
+    source_index = graph.index[source]
+    target_indexes = {graph.index[t] for t in targets}
+    if hasattr(graph, "weights_from"):
+        dist, prev = dijkstra_implicit(graph, source_index, target_indexes)
+    else:
+        dist, prev = dijkstra_compact(graph, source_index, target_indexes)
+    results = {}
+    for end in targets:
+        target = graph.index[end]
+        if dist[target] == float('inf'):
+            results[end] = ([], None)
+        else:
+            results[end] = ([graph.node_ids[i] for i in build_path(prev, source_index, target)], dist[target])
+    return results
+
+
+def _solve_sources(graph, tasks):
+    return [_solve_source(graph, source, targets) for source, targets in tasks]
+
+
+def _distances(graph, sources):
+    return [dijkstra_compact(graph, source)[0] for source in sources]
+
+
+@timed("shortest_path.batch")
+def batch_shortest_paths(graph, pairs, workers=None):
+    """
+    Answers many (start, end) pairs and returns [(path, total_cost, strategy), ...]
+    in the order of `pairs`. Metric implicit graphs are answered directly.
+    Otherwise pairs are grouped by start node so each start runs one
+    single-source search; with workers > 1 the searches are spread over a
+    process pool in chunks, each sent with a copy of the graph.
+    """
+    results = [None] * len(pairs)
+    by_source = {}
+    for position, (start, end) in enumerate(pairs):
+        if start not in graph.index or end not in graph.index:
+            results[position] = ([], None, "none")
+        elif hasattr(graph, "weights_from") and (graph.is_metric or start == end):
+            results[position] = plan_shortest_path(graph, start, end)
+        else:
+            by_source.setdefault(start, {}).setdefault(end, []).append(position)
+
+    if not by_source:
+        return results
+
+    strategy = "dijkstra"
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers > 1 and len(by_source) >= POOL_MIN_SOURCES:
+        futures = _submit(graph, workers, _solve_sources, [(source, list(ends)) for source, ends in by_source.items()])
+        answers = dict(zip(by_source, (result for future in futures for result in future.result())))
+    else:
+        answers = {source: _solve_source(graph, source, list(ends)) for source, ends in by_source.items()}
+
+    for source, ends in by_source.items():
+        for end, positions in ends.items():
+            path, cost = answers[source][end]
+            for position in positions:
+                results[position] = (path, cost, strategy)
+    return results
+
+
+def all_pairs_matrix(graph, method="auto", workers=1):
+    """
+    Returns (node_ids, distance matrix) over every pair of nodes.
+    "direct":         metric implicit graph only, the matrix is the pairwise weights
+    "floyd-warshall": vectorized Floyd-Warshall on the dense weight matrix, O(V^3)
+    "dijkstra":       one heap Dijkstra per source on the compact graph
+    "auto" picks direct for metric implicit graphs, Floyd-Warshall for other
+    implicit graphs and Dijkstra for stored graphs.
+    """
+    implicit = hasattr(graph, "weights_from")
+    if method == "auto":
+        if implicit:
+            method = "direct" if graph.is_metric else "floyd-warshall"
+        else:
+            method = "dijkstra"
+    if method == "direct" and not (implicit and graph.is_metric):
+        # Edge weights are only shortest distances when the triangle inequality holds
+        raise ValueError("The direct method needs a metric implicit graph")
+    if not implicit and not hasattr(graph, "offsets"):
+        graph = CompactGraph.from_product_graph(graph)
+    n = len(graph)
+
+    if method in ("direct", "floyd-warshall"):
+        if implicit:
+            matrix = np.vstack([graph.weights_from(i) for i in range(n)]) if n else np.zeros((0, 0))
+        else:
+            matrix = np.full((n, n), np.inf)
+            np.fill_diagonal(matrix, 0)
+            for i in range(n):
+                for k in range(graph.offsets[i], graph.offsets[i + 1]):
+                    j = graph.targets[k]
+                    matrix[i, j] = min(matrix[i, j], graph.weights[k])
+        if method == "floyd-warshall":
+            for k in range(n):
+                np.minimum(matrix, matrix[:, k, None] + matrix[None, k, :], out=matrix)
+        return list(graph.node_ids), matrix
+
+    if method != "dijkstra":
+        raise ValueError(f"Unknown all-pairs method: {method}")
+    node_ids = list(graph.node_ids)
+    if implicit:
+        rows = [dijkstra_implicit(graph, i)[0] for i in range(n)]
+    elif workers > 1:
+        futures = _submit(graph, workers, _distances, range(n))
+        rows = [row for future in futures for row in future.result()]
+    else:
+        rows = [dijkstra_compact(graph, i)[0] for i in range(n)]
+    return node_ids, np.array(rows, dtype=np.float64).reshape(n, n)
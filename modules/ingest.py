@@ -0,0 +1,151 @@
+import json
+import re
+import sys
+
+CHUNK_SIZE = 1 << 16
+
+REQUIRED_FIELDS = ("node_id", "price", "seller_rating", "review_count", "delivery_time")
+
+DELIVERY_RE = re.compile(r"^\s*(\d+)\s*(?:-\s*(\d+))?\s*days?\s*$", re.IGNORECASE)
+SIZE_RE = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*(mb|gb|tb)\s*$", re.IGNORECASE)
+
+
+def _iter_json_array(f, chunk_size=CHUNK_SIZE):
+    # Yields the elements of a top-level JSON array while reading it chunk by chunk.
+    # Only the current element and one chunk are held in memory.
+    decoder = json.JSONDecoder()
+    buffer, pos, eof = '', 0, False
+    state = "start"
+    while True:
+        while pos < len(buffer) and buffer[pos] in ' \t\r\n':
+            pos += 1
+        if pos >= len(buffer):
+            if eof:
+                raise ValueError("Unexpected end of JSON array")
+            chunk = f.read(chunk_size)
+            eof = not chunk
+            buffer, pos = buffer[pos:] + chunk, 0
+            continue
+
+        char = buffer[pos]
+        if state == "start":
+            if char != '[':
+                raise ValueError("Expected a JSON array of products")
+            pos += 1
+            state = "first"
+            continue
+        if char == ']' and state in ("first", "separator"):
+            return
+        if state == "separator":
+            if char != ',':
+                raise ValueError(f"Expected ',' or ']' in JSON array, got {char!r}")
+            pos += 1
+            state = "value"
+            continue
+
+        try:
+            value, end = decoder.raw_decode(buffer, pos)
+            complete = end < len(buffer) or eof
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            complete = False
+        if not complete:
+            # The element runs past the buffered text: read more and decode again
+            chunk = f.read(chunk_size)
+            eof = not chunk
+            buffer, pos = buffer[pos:] + chunk, 0
+            continue
+        yield value
+        pos = end
+        state = "separator"
+
+
+def _iter_json_lines(f):
+    for line_number, line in enumerate(f, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Invalid JSON on line {line_number}: {e}")
+
+
+def iter_raw_products(path, chunk_size=CHUNK_SIZE):
+    # Yields raw product dicts from a JSON array file or a JSON Lines file
+    with open(path, 'r') as f:
+        head = f.read(chunk_size)
+        f.seek(0)
+        if head.lstrip().startswith('['):
+            yield from _iter_json_array(f, chunk_size)
+        else:
+            yield from _iter_json_lines(f)
+
+
+def _normalize_delivery(value):
+    match = DELIVERY_RE.match(value)
+    if not match:
+        return value.strip()
+    low, high = match.groups()
+    return sys.intern(f"{low}-{high} days" if high else f"{low} days")
+
+
+def _normalize_size(value):
+    match = SIZE_RE.match(value)
+    if not match:
+        return value.strip()
+    number, unit = match.groups()
+    return sys.intern(f"{number}{unit.upper()}")
+
+
+def normalize_product(product):
+    """
+    Validates one raw product and returns a normalized copy in the dataset's shape.
+    Numeric fields are coerced, delivery ranges are written as "3-5 days" and
+    RAM / Storage sizes as "32GB". Raises ValueError for unusable records.
+    Products loaded from a file and products submitted through the API both
+    pass through here.
+    """
+    if not isinstance(product, dict):
+        raise ValueError(f"Product must be a JSON object, got {type(product).__name__}")
+    missing = [field for field in REQUIRED_FIELDS if product.get(field) in (None, "")]
+    if missing:
+        raise ValueError(f"Product {product.get('node_id')!r} is missing {', '.join(missing)}")
+
+    # Each streamed record is decoded on its own, so keys are interned to share
+    # one copy across the catalog (json.load does this for a whole document)
+    normalized = {sys.intern(key): value for key, value in product.items()}
+    if any(isinstance(product[field], bool) for field in ("price", "seller_rating", "review_count")):
+        raise ValueError(f"Product {product['node_id']!r} has a non-numeric price, rating or review count")
+    try:
+        normalized["price"] = float(product["price"])
+        normalized["seller_rating"] = float(product["seller_rating"])
+        normalized["review_count"] = int(product["review_count"])
+    except (TypeError, ValueError):
+        raise ValueError(f"Product {product['node_id']!r} has a non-numeric price, rating or review count")
+    normalized["node_id"] = str(product["node_id"])
+    normalized["delivery_time"] = _normalize_delivery(str(product["delivery_time"]))
+    for field in ("RAM", "Storage"):
+        if isinstance(product.get(field), str):
+            normalized[field] = _normalize_size(product[field])
+    return normalized
+
+
+def iter_products(path, errors="raise", chunk_size=CHUNK_SIZE):
+    """
+    Streams validated, normalized products one at a time from a JSON array or
+    JSON Lines file. With errors="skip", invalid records are dropped instead of
+    raising.
+    """
+    for raw in iter_raw_products(path, chunk_size):
+        try:
+            yield normalize_product(raw)
+        except ValueError:
+            if errors != "skip":
+                raise
+
+
+def load_products(path, errors="raise"):
+    # Collects streamed products into a list
+    return list(iter_products(path, errors=errors))
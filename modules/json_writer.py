@@ -1,30 +1,178 @@
+import heapq
+import json
+import struct
+
+import numpy as np
+
+# Lines buffered before each write
+CHUNK_LINES = 4096
+
+BINARY_MAGIC = b"CQEDGES1"
+EDGE_STRUCT = struct.Struct('<IId')
+
+
+def _node_ids(graph):
+    if hasattr(graph, "node_ids"):
+        return graph.node_ids
+    return list(graph.graph.keys())
+
+
+def _iter_edges(graph, node_ids):
+    # Yields every undirected edge once as (i, j, weight) with i < j, in canonical order.
+    # Works on ProductGraph, CompactGraph and ImplicitProductGraph without a dedup set.
+    if hasattr(graph, "weights_from"):
+        for i in range(len(node_ids)):
+            weights = graph.weights_from(i)[i + 1:].tolist()
+            for offset, weight in enumerate(weights):
+                yield i, i + 1 + offset, weight
+    elif hasattr(graph, "offsets"):
+        for i in range(len(node_ids)):
+            for k in range(graph.offsets[i], graph.offsets[i + 1]):
+                if graph.targets[k] > i:
+                    yield i, graph.targets[k], graph.weights[k]
+    else:
+        index = {node: i for i, node in enumerate(node_ids)}
+        for i, node in enumerate(node_ids):
+            for neighbor, weight in graph.get_neighbors(node):
+                j = index[neighbor]
+                if j > i:
+                    yield i, j, weight
+
+
+def _lightest_neighbors(graph, node, k):
+    # The k lightest (neighbor, weight) pairs of one node
+    if hasattr(graph, "weights_from"):
+        i = graph.index[node]
+        weights = graph.weights_from(i)
+        weights[i] = np.inf
+        k = min(k, len(weights) - 1)
+        if k <= 0:
+            return []
+        nearest = np.argpartition(weights, k - 1)[:k]
+        return [(graph.node_ids[j], float(weights[j])) for j in nearest.tolist()]
+    return heapq.nsmallest(k, graph.get_neighbors(node), key=lambda item: item[1])
+
+
+def _path_neighbourhood(graph, path, neighbours):
+    # Nodes and edges of the optimal path plus each path node's lightest neighbours
+    node_ids = list(dict.fromkeys(path))
+    edges = {}
+    for a, b in zip(path, path[1:]):
+        edges[(a, b)] = graph.weight(a, b) if hasattr(graph, "weight") else dict(graph.get_neighbors(a))[b]
+    for node in path:
+        for neighbor, weight in _lightest_neighbors(graph, node, neighbours):
+            if neighbor not in node_ids:
+                node_ids.append(neighbor)
+            if (neighbor, node) not in edges:
+                edges[(node, neighbor)] = weight
+    index = {node: i for i, node in enumerate(node_ids)}
+    edge_list = [(index[a], index[b], w) for (a, b), w in edges.items()]
+    return node_ids, [(i, j, w) if i < j else (j, i, w) for i, j, w in edge_list]
+
+
+class _ChunkedWriter:
+    def __init__(self, f):
+        self.f = f
+        self.lines = []
+
+    def write(self, text):
+        self.lines.append(text)
+        if len(self.lines) >= CHUNK_LINES:
+            self.flush()
+
+    def flush(self):
+        if self.lines:
+            self.f.write(''.join(self.lines))
+            self.lines = []
+
+
+def _write_json(f, node_ids, edges, path, total_cost):
+    out = _ChunkedWriter(f)
+    out.write("{\n")
+    out.write('  "nodes": [\n')
+    out.write(',\n'.join(f'    {json.dumps(n)}' for n in node_ids))
+    out.write('\n  ],\n')
+    out.write('  "edges": [\n')
+    first = True
+    for i, j, weight in edges:
+        prefix = '    ' if first else ',\n    '
+        first = False
+        out.write(f'{prefix}{{"from": {json.dumps(node_ids[i])}, "to": {json.dumps(node_ids[j])}, "weight": {json.dumps(weight)}}}')
+    out.write('\n  ],\n')
+    out.write('  "optimal_path": [\n')
+    out.write(',\n'.join(f'    {json.dumps(n)}' for n in path))
+    out.write('\n  ],\n')
+    out.write(f'  "total_cost": {json.dumps(total_cost)}\n')
+    out.write("}")
+    out.flush()
+
+
+def _write_jsonl(f, node_ids, edges, path, total_cost):
+    out = _ChunkedWriter(f)
+    for node in node_ids:
+        out.write(json.dumps({"type": "node", "id": node}) + '\n')
+    for i, j, weight in edges:
+        out.write(json.dumps({"type": "edge", "from": node_ids[i], "to": node_ids[j], "weight": float(weight)}) + '\n')
+    out.write(json.dumps({"type": "path", "nodes": list(path), "total_cost": total_cost}) + '\n')
+    out.flush()
+
+
+def _write_binary(f, node_ids, edges, path, total_cost):
+    # MAGIC | u32 node count | u64 edge count | nodes (u32 length + utf-8)
+    # | edges (u32 from, u32 to, f64 weight) | u32 path length | u32 path nodes | f64 total cost
+    index = {node: i for i, node in enumerate(node_ids)}
+    f.write(BINARY_MAGIC)
+    f.write(struct.pack('<I', len(node_ids)))
+    count_position = f.tell()
+    f.write(struct.pack('<Q', 0))
+    for node in node_ids:
+        encoded = node.encode('utf-8')
+        f.write(struct.pack('<I', len(encoded)))
+        f.write(encoded)
+
+    count = 0
+    chunk = bytearray()
+    for i, j, weight in edges:
+        chunk += EDGE_STRUCT.pack(i, j, weight)
+        count += 1
+        if len(chunk) >= CHUNK_LINES * EDGE_STRUCT.size:
+            f.write(chunk)
+            chunk = bytearray()
+    f.write(chunk)
+
+    f.write(struct.pack('<I', len(path)))
+    f.write(struct.pack(f'<{len(path)}I', *[index[node] for node in path]))
+    f.write(struct.pack('<d', float('nan') if total_cost is None else total_cost))
+    f.seek(count_position)
+    f.write(struct.pack('<Q', count))
+
+
+def export_graph(graph, path, total_cost, filename, format="json", neighbours=None):
+    """
+    Streams the graph and the optimal path to `filename` without holding the
+    edge list in memory. Edges are written once each, in canonical (i < j) order.
+    format: "json" (same layout as write_results_json), "jsonl" or "binary".
+    neighbours: when set, only the optimal path and each path node's
+    `neighbours` lightest neighbours are exported.
+    """
+    if neighbours is not None:
+        node_ids, edges = _path_neighbourhood(graph, path, neighbours)
+    else:
+        node_ids = _node_ids(graph)
+        edges = _iter_edges(graph, node_ids)
+
+    if format == "json":
+        with open(filename, 'w') as f:
+            _write_json(f, node_ids, edges, path, total_cost)
+    elif format == "jsonl":
+        with open(filename, 'w') as f:
+            _write_jsonl(f, node_ids, edges, path, total_cost)
+    elif format == "binary":
+        with open(filename, 'wb') as f:
+            _write_binary(f, node_ids, edges, path, total_cost)
+    else:
+        raise ValueError(f"Unknown export format: {format}")
+
+
 def write_results_json(graph, path, total_cost, filename):
-    with open(filename, 'w') as file:
-        file.write("{\n")
-
-        # Nodes
-        file.write('  "nodes": [\n')
-        nodes = list(graph.graph.keys())
-        file.write(',\n'.join([f'    "{n}"' for n in nodes]))
-        file.write('\n  ],\n')
-
-        # Edges
-        file.write('  "edges": [\n')
-        seen = set()
-        edge_lines = []
-        for from_node in graph.graph:
-            for to_node, weight in graph.graph[from_node]:
-                key = tuple(sorted((from_node, to_node)))
-                if key not in seen:
-                    seen.add(key)
-                    edge_lines.append(f'    {{"from": "{from_node}", "to": "{to_node}", "weight": {weight}}}')
-        file.write(',\n'.join(edge_lines))
-        file.write('\n  ],\n')
-
-        # Optimal path
-        file.write('  "optimal_path": [\n')
-        file.write(',\n'.join([f'    "{n}"' for n in path]))
-        file.write('\n  ],\n')
-
-        file.write(f'  "total_cost": {total_cost}\n')
-        file.write("}")
+    export_graph(graph, path, total_cost, filename, format="json")
@@ -0,0 +1,290 @@
+import numpy as np
+
+from modules.catalog_delta import resized
+from modules.features import parse_screen_inches, parse_size_gb
+from modules.metrics import count, stage, timed
+
+# Fields two listings must share (case-insensitively) to be compared at all
+BLOCK_FIELDS = ("category", "brand")
+
+# Spec field -> (parser, weight) of the fields compared between candidates.
+# Numeric specs agree fully when equal and not at all when they differ by
+# SPEC_TOLERANCE or more (relative), so "15.6 inch" and "16 inch" mostly
+# agree; processors are normalized strings and must be equal.
+SPEC_FIELDS = {
+    "RAM": (parse_size_gb, 1.0),
+    "Storage": (parse_size_gb, 1.0),
+    "Processor": (None, 1.0),
+    "Screen Size": (parse_screen_inches, 1.0),
+}
+
+# Sorted-neighbourhood passes: each sorts every block by these specs and
+# compares each listing with the next MATCH_WINDOW - 1. Every spec comes last
+# in one pass, where listings missing it (sorted last) sit next to listings
+# that agree on the other three.
+SORT_PASSES = (
+    ("RAM", "Storage", "Processor", "Screen Size"),
+    ("Screen Size", "RAM", "Storage", "Processor"),
+    ("Processor", "Screen Size", "RAM", "Storage"),
+    ("Storage", "Processor", "Screen Size", "RAM"),
+)
+MATCH_WINDOW = 8
+SPEC_TOLERANCE = 0.1
+
+# Weighted mean spec similarity at which two listings are the same product,
+# and the specs both must state for the score to count
+MATCH_THRESHOLD = 0.9
+MIN_COMPARED_FIELDS = 3
+
+DEFAULT_COMPARE_LIMIT = 20
+
+
+def _normalized(value):
+    return " ".join(value.casefold().split()) if isinstance(value, str) and value.strip() else None
+
+
+def _code(table, value):
+    # Code of a normalized value, adding it to `table`; -1 when absent
+    if value is None:
+        return -1
+    return table.setdefault(value, len(table))
+
+
+def _components(labels, a, b):
+    """
+    Connected components of the pairs (a, b) over `labels` (modified in
+    place), which maps each row to a row of its component no larger than
+    itself. Rows end up labelled with the smallest row of their component.
+    """
+    while True:
+        # Compress every label to its root, then hook the larger root of each pair onto the smaller
+        while True:
+            parents = labels[labels]
+            if np.array_equal(parents, labels):
+                break
+            labels[:] = parents
+        la, lb = labels[a], labels[b]
+        differ = la != lb
+        if not differ.any():
+            return labels
+        la, lb = la[differ], lb[differ]
+        np.minimum.at(labels, np.maximum(la, lb), np.minimum(la, lb))
+
+
+class MatchIndex:
+    """
+    Groups listings that are probably the same product, across platforms.
+    Listings are only compared within a block of equal BLOCK_FIELDS, and
+    within a block only with their neighbours in SORT_PASSES orders of the
+    specs, so matching costs O(n log n) rather than all pairs. Candidate
+    pairs are scored in one vectorized pass and matching pairs are merged
+    into clusters, labelled by their first catalog position.
+
+    Unlike the other indexes, specs are parsed with missing values kept
+    missing (NaN) rather than zero, so a listing that omits a spec can
+    still match on the others.
+    """
+
+    def __init__(self, data):
+        self.size = len(data)
+        self.block_table = {}
+        self.processor_table = {}
+        self.platform_table = {}
+        self.block = np.empty(self.size, dtype=np.int32)
+        self.platform = np.empty(self.size, dtype=np.int32)
+        self.price = np.empty(self.size, dtype=np.float64)
+        self.specs = {field: np.empty(self.size, dtype=np.float64) for field in SPEC_FIELDS}
+        self._parse(data, np.arange(self.size))
+        self.labels = np.arange(self.size, dtype=np.int64)
+        with stage("match.build"):
+            self._match(np.arange(self.size))
+        self._groups = None
+
+    def _parse(self, data, rows):
+        # Spec strings repeat across listings, so each distinct value is parsed once
+        products = [data[i] for i in rows.tolist()]
+        blocks = {}
+        for i, p in zip(rows.tolist(), products):
+            key = tuple(p.get(field) for field in BLOCK_FIELDS)
+            if key not in blocks:
+                normalized = tuple(_normalized(value) for value in key)
+                blocks[key] = -1 if None in normalized else _code(self.block_table, normalized)
+            self.block[i] = blocks[key]
+        self.platform[rows] = self._column(products, "platform", lambda v: _code(self.platform_table, _normalized(v)))
+        self.price[rows] = [p.get("price") if isinstance(p.get("price"), (int, float)) else np.nan for p in products]
+        for field, (parse, _) in SPEC_FIELDS.items():
+            if parse is None:
+                codes = np.array(self._column(products, field, lambda v: _code(self.processor_table, _normalized(v))))
+                self.specs[field][rows] = np.where(codes < 0, np.nan, codes)
+            else:
+                values = self._column(products, field, parse)
+                self.specs[field][rows] = [np.nan if value is None else value for value in values]
+
+    @staticmethod
+    def _column(products, field, parse):
+        # parse() of each product's field value, once per distinct value
+        values = [p.get(field) for p in products]
+        parsed = {value: parse(value) for value in set(values)}
+        return [parsed[value] for value in values]
+
+    def _candidates(self, rows):
+        # Distinct (a, b) pairs, a < b, of rows that share a block and sort near each other
+        rows = rows[self.block[rows] >= 0]
+        pairs = []
+        for fields in SORT_PASSES:
+            # lexsort sorts by its last key first: block, then the specs in order, then position
+            keys = [rows] + [self.specs[field][rows] for field in reversed(fields)] + [self.block[rows]]
+            order = rows[np.lexsort(keys)]
+            for offset in range(1, MATCH_WINDOW):
+                left, right = order[:-offset], order[offset:]
+                same = self.block[left] == self.block[right]
+                pairs.append(np.minimum(left[same], right[same]) * self.size + np.maximum(left[same], right[same]))
+        if not pairs:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        # Sorting and dropping repeats is much faster than np.unique's hash table here
+        pairs = np.sort(np.concatenate(pairs))
+        pairs = pairs[np.r_[True, pairs[1:] != pairs[:-1]]] if len(pairs) else pairs
+        return pairs // self.size, pairs % self.size
+
+    def similarity(self, a, b):
+        # (score in [0, 1], number of specs both state) of each pair (a[i], b[i])
+        total = np.zeros(len(a))
+        weights = np.zeros(len(a))
+        compared = np.zeros(len(a), dtype=np.int64)
+        for field, (parse, weight) in SPEC_FIELDS.items():
+            x, y = self.specs[field][a], self.specs[field][b]
+            known = ~np.isnan(x) & ~np.isnan(y)
+            if parse is None:
+                agree = (x == y).astype(np.float64)
+            else:
+                high = np.fmax(np.abs(x), np.abs(y))
+                difference = np.divide(np.abs(x - y), high, out=np.zeros(len(a)), where=high > 0)
+                agree = np.clip(1 - difference / SPEC_TOLERANCE, 0, 1)
+            total += weight * np.where(known, agree, 0.0)
+            weights += weight * known
+            compared += known
+        return np.divide(total, weights, out=np.zeros(len(a)), where=weights > 0), compared
+
+    def _match(self, rows):
+        """
+        Clusters the given rows (whole blocks, labelled by themselves) among
+        each other. Listings stating every spec are merged with all their
+        matches; a listing missing a spec only joins the cluster of its best
+        match, so it never bridges two variants (8GB and 16GB) of a model.
+        """
+        a, b = self._candidates(rows)
+        count("match_candidate_pairs", len(a))
+        score, compared = self.similarity(a, b)
+        matched = (score >= MATCH_THRESHOLD) & (compared >= MIN_COMPARED_FIELDS)
+        complete = np.ones(self.size, dtype=bool)
+        for column in self.specs.values():
+            complete &= ~np.isnan(column)
+        full = matched & complete[a] & complete[b]
+        _components(self.labels, a[full], b[full])
+
+        # (incomplete listing, complete match) pairs, best score first per listing, ties to the first match
+        partial = matched & (complete[a] != complete[b])
+        listing = np.where(complete[a[partial]], b[partial], a[partial])
+        match = np.where(complete[a[partial]], a[partial], b[partial])
+        order = np.lexsort((match, -score[partial], listing))
+        first = np.r_[True, listing[order][1:] != listing[order][:-1]] if len(order) else np.zeros(0, dtype=bool)
+        best = order[first]
+        self.labels[listing[best]] = self.labels[match[best]]
+
+        # Relabel the rows' clusters by their first catalog position again
+        labels = self.labels[rows]
+        first_row = np.full(self.size, self.size, dtype=np.int64)
+        np.minimum.at(first_row, labels, rows)
+        self.labels[rows] = first_row[labels]
+
+    def patched(self, data, delta):
+        """
+        Index of the catalog after `delta`. Matching never crosses blocks, so
+        only the blocks a changed, added, removed or moved listing belonged to
+        (before or after) are matched again; every other cluster is kept.
+        """
+        index = MatchIndex.__new__(MatchIndex)
+        index.size = delta.size
+        index.block_table = dict(self.block_table)
+        index.processor_table = dict(self.processor_table)
+        index.platform_table = dict(self.platform_table)
+        index.block = resized(self.block, delta.size)
+        index.platform = resized(self.platform, delta.size)
+        index.price = resized(self.price, delta.size)
+        index.specs = {field: resized(column, delta.size) for field, column in self.specs.items()}
+        rows = delta.rows[delta.rows < delta.size]
+        index._parse(data, rows)
+
+        old_rows = np.concatenate((delta.removed_rows, delta.rows[delta.rows < self.size]))
+        touched = np.union1d(self.block[old_rows], index.block[rows])
+        rematched = np.flatnonzero(np.isin(index.block, touched[touched >= 0]))
+        index.labels = resized(self.labels, delta.size)
+        index.labels[rows] = rows
+        index.labels[rematched] = rematched
+        with stage("match.patch"):
+            index._match(rematched)
+        index._groups = None
+        return index
+
+    def groups(self):
+        """
+        (members, starts, labels) of the clusters: members holds the rows of
+        every cluster in turn, cluster i being members[starts[i]:starts[i + 1]],
+        labelled labels[i]. Built on first use, together with the price range
+        and platform count of each cluster.
+        """
+        if self._groups is None:
+            members = np.argsort(self.labels, kind="stable")
+            sorted_labels = self.labels[members]
+            first = np.ones(self.size, dtype=bool)
+            first[1:] = sorted_labels[1:] != sorted_labels[:-1]
+            starts = np.flatnonzero(first)
+            labels = sorted_labels[starts]
+            sizes = np.diff(np.append(starts, self.size))
+
+            # Distinct platforms per cluster; listings without a platform count as one more
+            stride = len(self.platform_table) + 1
+            cluster_of = np.repeat(np.arange(len(labels)), sizes)
+            platform_keys = np.unique(cluster_of * stride + self.platform[members] + 1)
+            self.platforms = np.bincount(platform_keys // stride, minlength=len(labels))
+            if len(labels):
+                self.low = np.fmin.reduceat(self.price[members], starts)
+                self.high = np.fmax.reduceat(self.price[members], starts)
+            else:
+                self.low = self.high = np.zeros(0)
+            # Clusters to compare, the largest price difference first
+            compared = np.flatnonzero(self.platforms > 1)
+            self.compared = compared[np.lexsort((compared, -(self.high - self.low)[compared]))]
+            self._groups = (members, np.append(starts, self.size), labels)
+        return self._groups
+
+    def cluster(self, row):
+        # Rows of the cluster holding `row`, in catalog order
+        members, starts, labels = self.groups()
+        i = np.searchsorted(labels, self.labels[row])
+        return members[starts[i]:starts[i + 1]]
+
+    @timed("match.compare")
+    def comparisons(self, category=None, brand=None, offset=0, limit=DEFAULT_COMPARE_LIMIT):
+        """
+        (total, page) of the clusters listed on at least two platforms,
+        optionally of one category and / or brand, the largest price
+        difference first. The page holds (rows, lowest price, highest price)
+        of clusters offset to offset + limit.
+        """
+        if offset < 0 or limit < 0:
+            raise ValueError("'offset' and 'limit' must not be negative")
+        members, starts, labels = self.groups()
+        chosen = self.compared
+        if category is not None or brand is not None:
+            wanted = (_normalized(category), _normalized(brand))
+            codes = [code for key, code in self.block_table.items()
+                     if all(w is None or w == k for w, k in zip(wanted, key))]
+            chosen = chosen[np.isin(self.block[labels[chosen]], codes)]
+        count("rows_scanned", len(chosen))
+        page = chosen[offset:offset + limit].tolist()
+        return len(chosen), [(members[starts[i]:starts[i + 1]], float(self.low[i]), float(self.high[i])) for i in page]
+
+    def __repr__(self):
+        members, starts, labels = self.groups()
+        return f"MatchIndex(listings={self.size}, clusters={len(labels)}, compared={len(self.compared)})"
@@ -0,0 +1,196 @@
+import functools
+import re
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+PREFIX = "cartiq"
+
+# Upper bounds (seconds) of the latency histogram buckets, as in the Prometheus client defaults
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+HELP = {
+    "stage_seconds": "Time spent in instrumented hot-path stages",
+    "request_seconds": "Request latency by route",
+    "rows_scanned_total": "Catalog rows examined by filter, recommend and search",
+    "edges_relaxed_total": "Edges examined by shortest-path searches",
+    "heap_pushes_total": "Priority queue pushes by heap-based Dijkstra",
+    "nodes_settled_total": "Nodes settled by shortest-path searches",
+    "path_cache_hits_total": "Shortest-path tree cache hits",
+    "path_cache_misses_total": "Shortest-path tree cache misses",
+    "skyline_cache_hits_total": "Pareto frontier cache hits",
+    "skyline_cache_misses_total": "Pareto frontier cache misses",
+    "match_candidate_pairs_total": "Listing pairs scored by the product matcher",
+    "responses_not_modified_total": "Requests answered 304 Not Modified from their If-None-Match ETag",
+    "responses_precondition_failed_total": "Requests answered 412 Precondition Failed from their If-None-Match ETag",
+    "products_mutated_total": "Products added, updated or removed through the mutation API",
+}
+
+_TOKEN_RE = re.compile(r"[^A-Za-z0-9_.\-]")
+
+
+class Histogram:
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+class MetricsRegistry:
+    """
+    Process-wide histograms, counters and gauges, rendered in the Prometheus
+    text exposition format. Series are keyed by (name, sorted labels).
+    """
+
+    def __init__(self, prefix=PREFIX):
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self.histograms = {}
+        self.counters = {}
+        self.gauges = {}
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def inc(self, name, amount=1, **labels):
+        key = (f"{name}_total", tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def set_gauge(self, name, value, **labels):
+        with self._lock:
+            self.gauges[(name, tuple(sorted(labels.items())))] = value
+
+    def _family(self, lines, name, kind):
+        full = f"{self.prefix}_{name}"
+        if name in HELP:
+            lines.append(f"# HELP {full} {HELP[name]}")
+        lines.append(f"# TYPE {full} {kind}")
+        return full
+
+    def render(self):
+        with self._lock:
+            histograms = {key: (list(h.counts), h.sum, h.count, h.buckets) for key, h in self.histograms.items()}
+            counters = dict(self.counters)
+            gauges = dict(self.gauges)
+
+        lines = []
+        for kind, series in (("counter", counters), ("gauge", gauges)):
+            for name in sorted({name for name, _ in series}):
+                full = self._family(lines, name, kind)
+                for (series_name, labels), value in sorted(series.items()):
+                    if series_name == name:
+                        lines.append(f"{full}{_labels(labels)} {value}")
+
+        for name in sorted({name for name, _ in histograms}):
+            full = self._family(lines, name, "histogram")
+            for (series_name, labels), (counts, total, count, buckets) in sorted(histograms.items()):
+                if series_name != name:
+                    continue
+                cumulative = 0
+                for bound, bucket_count in zip(buckets + (float("inf"),), counts):
+                    cumulative += bucket_count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f"{full}_bucket{_labels(labels, [('le', le)])} {cumulative}")
+                lines.append(f"{full}_sum{_labels(labels)} {total}")
+                lines.append(f"{full}_count{_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+
+class RequestTrace:
+    # Stage durations and counters of the current request, for the Server-Timing header
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = {}
+        self.counters = {}
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def server_timing(self):
+        # "name;dur=ms" per stage (summed when a stage repeats), "name;desc=N" per counter
+        entries = [f"{_TOKEN_RE.sub('_', name)};dur={seconds * 1000:.3f}" for name, seconds in self.stages.items()]
+        entries += [f'{_TOKEN_RE.sub("_", name)};desc="{value}"' for name, value in self.counters.items()]
+        entries.append(f"total;dur={self.elapsed() * 1000:.3f}")
+        return ", ".join(entries)
+
+
+registry = MetricsRegistry()
+_current_trace = ContextVar("cartiq_request_trace", default=None)
+
+
+def begin_request():
+    # Starts collecting stages for the calling context; returns a token for end_request
+    return _current_trace.set(RequestTrace())
+
+
+def end_request(token):
+    _current_trace.reset(token)
+
+
+def current_trace():
+    return _current_trace.get()
+
+
+class stage:
+    # Times a block into the stage histogram and the current request's trace.
+    # A plain class rather than @contextmanager keeps the per-use cost low.
+    __slots__ = ("name", "started")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.started
+        registry.observe("stage_seconds", elapsed, stage=self.name)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.stages[self.name] = trace.stages.get(self.name, 0.0) + elapsed
+
+
+def timed(name):
+    # Decorator form of stage()
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def count(name, amount=1):
+    # Adds to a counter; hot loops count locally and call this once
+    if not amount:
+        return
+    registry.inc(name, amount)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.counters[name] = trace.counters.get(name, 0) + amount
@@ -0,0 +1,183 @@
+import sys
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from modules.graph_utils import build_path, dijkstra_compact, dijkstra_implicit
+from modules.metrics import count
+
+# Bookkeeping per cached tree on top of its arrays (key tuple, OrderedDict slot)
+ENTRY_OVERHEAD = 200
+
+# Above this many changed products a catalog mutation drops every tree instead
+# of checking which ones it left intact (each check costs two weight rows per change)
+CARRY_OVER_MAX_CHANGES = 32
+
+
+class ShortestPathCache:
+    """
+    LRU cache of complete single-source shortest-path trees.
+    A tree is keyed by (catalog version, weight function, start node), so once a
+    start node has been searched every end node from it is a lookup. Entries are
+    evicted least-recently-used first to stay under `max_bytes`, and every entry
+    of an older catalog version is dropped as soon as a newer version is seen,
+    except for the trees carry_over() proves a mutation did not change. A
+    request still holding an older snapshot is answered without touching the
+    cache, so it cannot evict the newer version's trees.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._version = None
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _weight_key(graph):
+        return getattr(graph, "weight_key", None) or ("graph", id(graph))
+
+    def _current(self, version):
+        # Whether `version` is the cached one; a newer version first drops every entry
+        if self._version is None or version > self._version:
+            self._entries.clear()
+            self.bytes = 0
+            self._version = version
+        return version == self._version
+
+    def invalidate(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def _lookup(self, graph, start, version):
+        # ((dist, prev), hit) for the full tree from `start`; computed on a miss
+        key = (self._weight_key(graph), start)
+        with self._lock:
+            current = self._current(version)
+            cached = self._entries.get(key) if current else None
+            if cached is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                count("path_cache_hits")
+                return cached[0], True
+            self.misses += 1
+        count("path_cache_misses")
+
+        # Search outside the lock so other queries are not held up
+        source = graph.index[start]
+        if hasattr(graph, "weights_from"):
+            dist, prev = dijkstra_implicit(graph, source)
+        else:
+            dist, prev = dijkstra_compact(graph, source)
+        tree = (np.asarray(dist, dtype=np.float64), np.asarray(prev, dtype=np.int32))
+        size = tree[0].nbytes + tree[1].nbytes + ENTRY_OVERHEAD + sys.getsizeof(start)
+
+        with self._lock:
+            if version == self._version and size <= self.max_bytes and key not in self._entries:
+                self._entries[key] = (tree, size)
+                self.bytes += size
+                while self.bytes > self.max_bytes:
+                    _, (_, evicted_size) = self._entries.popitem(last=False)
+                    self.bytes -= evicted_size
+                    self.evictions += 1
+        return tree, False
+
+    def carry_over(self, old_graph, graph, delta, old_version, version):
+        """
+        Moves the trees of `old_version` that the mutation `delta` left intact
+        to `version`; the others are dropped and recomputed when next needed.
+        A tree is kept when its start node is unchanged and no shortest path in
+        it passes through an updated or removed node (they are all leaves).
+        The updated and added nodes are then re-attached from one weight row
+        each, and the tree is kept only if none of them gives another node a
+        shorter path. Only the symmetric weights of an ImplicitProductGraph
+        without a custom weight_fn are checked this way.
+        """
+        with self._lock:
+            entries = list(self._entries.items()) if self._version == old_version else []
+        checkable = (hasattr(graph, "weights_from") and getattr(graph, "weight_fn", None) is None
+                     and len(delta) <= CARRY_OVER_MAX_CHANGES)
+        weight_key = self._weight_key(graph)
+
+        kept = []
+        for (key_weight, start), (tree, _) in entries if checkable else ():
+            if key_weight != weight_key:
+                continue
+            repaired = self._repair(tree, start, old_graph, graph, delta)
+            if repaired is not None:
+                size = repaired[0].nbytes + repaired[1].nbytes + ENTRY_OVERHEAD + sys.getsizeof(start)
+                kept.append(((key_weight, start), (repaired, size)))
+
+        with self._lock:
+            if self._version == old_version:
+                self._entries = OrderedDict(kept)
+                self.bytes = sum(size for _, (_, size) in kept)
+                self._version = version
+        return len(kept)
+
+    @staticmethod
+    def _repair(tree, start, old_graph, graph, delta):
+        # (dist, prev) of the tree in the new catalog, or None when it may have changed
+        dist, prev = tree
+        changed = set(delta.updated) | set(delta.removed)
+        if start in changed:
+            return None
+        old_positions = np.array([old_graph.index[node] for node in changed], dtype=np.int64)
+        if np.isin(old_positions, prev).any():
+            return None
+
+        # Old position -> new position of every product still in the catalog
+        remap = np.arange(len(dist))
+        remap[[old_graph.index[node] for node in delta.removed]] = -1
+        for old, new in delta.moved.items():
+            remap[old] = new
+        kept = remap >= 0
+        new_dist = np.full(len(graph), np.inf)
+        new_prev = np.full(len(graph), -1, dtype=np.int32)
+        new_dist[remap[kept]] = dist[kept]
+        new_prev[remap[kept]] = np.where(prev[kept] >= 0, remap[prev[kept]], -1)
+
+        attached = [graph.index[node] for node in (*delta.updated, *delta.added)]
+        new_dist[attached] = np.inf
+        new_prev[attached] = -1
+        for x in attached:
+            reach = new_dist + graph.weights_from(x)
+            reach[x] = np.inf
+            u = int(np.argmin(reach))
+            if reach[u] < np.inf:
+                new_dist[x] = reach[u]
+                new_prev[x] = u
+        for x in attached:
+            if (new_dist[x] + graph.weights_from(x) < new_dist).any():
+                return None
+        return new_dist, new_prev
+
+    def tree(self, graph, start, version):
+        # (dist, prev) arrays of the full shortest-path tree from `start`
+        return self._lookup(graph, start, version)[0]
+
+    def shortest_path(self, graph, start, end, version):
+        # Returns (path, total_cost, hit); ([], None, hit) when unreachable
+        (dist, prev), hit = self._lookup(graph, start, version)
+        target = graph.index[end]
+        if dist[target] == np.inf:
+            return [], None, hit
+        path = build_path(prev.tolist(), graph.index[start], target)
+        return [graph.node_ids[i] for i in path], float(dist[target]), hit
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "version": self._version,
+            }
@@ -0,0 +1,127 @@
+import sys
+from collections.abc import Mapping
+
+from modules.binary_catalog import load_catalog
+from modules.features import delivery_days, parse_screen_inches, parse_size_gb
+from modules.ingest import normalize_product
+from modules.product_filter_and_recommender import parse_delivery_time
+
+# JSON key -> attribute name for the fields every catalog record carries
+FIELDS = {
+    "platform": "platform",
+    "category": "category",
+    "product_name": "product_name",
+    "price": "price",
+    "seller_rating": "seller_rating",
+    "delivery_time": "delivery_time",
+    "review_count": "review_count",
+    "product_url": "product_url",
+    "brand": "brand",
+    "RAM": "ram",
+    "Storage": "storage",
+    "Processor": "processor",
+    "Screen Size": "screen_size",
+    "node_id": "node_id",
+}
+
+# Low-cardinality strings shared by many products
+INTERNED_FIELDS = {"platform", "category", "brand", "RAM", "Storage", "Processor", "Screen Size", "delivery_time"}
+
+_ABSENT = object()
+_layouts = {}
+
+
+class Product(Mapping):
+    """
+    Compact catalog record. Known fields live in __slots__, numeric-looking
+    strings are parsed once (ram_gb, storage_gb, delivery_min / delivery_max,
+    delivery_days, screen_inches) and repeated strings are interned.
+    Reads like the original dict (p['price'], p.get('brand')) and
+    to_dict() returns the original JSON shape for API responses.
+    """
+
+    __slots__ = tuple(FIELDS.values()) + (
+        "ram_gb", "storage_gb", "delivery_min", "delivery_max", "delivery_days", "screen_inches",
+        "_keys", "_extra",
+    )
+
+    @classmethod
+    def from_dict(cls, data):
+        product = cls.__new__(cls)
+        extra = None
+        for attr in FIELDS.values():
+            object.__setattr__(product, attr, _ABSENT)
+        for key, value in data.items():
+            if isinstance(value, str) and key in INTERNED_FIELDS:
+                value = sys.intern(value)
+            attr = FIELDS.get(key)
+            if attr is None:
+                if extra is None:
+                    extra = {}
+                extra[key] = value
+            else:
+                object.__setattr__(product, attr, value)
+        # Products with the same key order share one layout tuple
+        keys = tuple(data)
+        object.__setattr__(product, "_keys", _layouts.setdefault(keys, keys))
+        object.__setattr__(product, "_extra", extra)
+
+        delivery = data.get("delivery_time")
+        if isinstance(delivery, str):
+            delivery_min, delivery_max = parse_delivery_time(delivery)
+            days = delivery_days(delivery)
+        else:
+            delivery_min = delivery_max = days = None
+        object.__setattr__(product, "ram_gb", parse_size_gb(data.get("RAM")))
+        object.__setattr__(product, "storage_gb", parse_size_gb(data.get("Storage")))
+        object.__setattr__(product, "delivery_min", delivery_min)
+        object.__setattr__(product, "delivery_max", delivery_max)
+        object.__setattr__(product, "delivery_days", days)
+        object.__setattr__(product, "screen_inches", parse_screen_inches(data.get("Screen Size")))
+        return product
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Product records are read-only")
+
+    def __getitem__(self, key):
+        attr = FIELDS.get(key)
+        if attr is not None:
+            value = getattr(self, attr)
+            if value is not _ABSENT:
+                return value
+        elif self._extra is not None and key in self._extra:
+            return self._extra[key]
+        raise KeyError(key)
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def to_dict(self):
+        return {key: self[key] for key in self._keys}
+
+    def __repr__(self):
+        return f"Product({self.node_id!r})"
+
+
+def product_record(data):
+    # Product record for a product submitted through the mutation API,
+    # normalized like the products loaded from the dataset file
+    return Product.from_dict(normalize_product(data))
+
+
+def load_product_records(path):
+    # JSON catalogs become Product records as they are streamed, so the parsed
+    # dicts are never all alive at once; compiled catalogs are already columnar
+    return load_catalog(path, record=Product.from_dict)
+
+
+def iter_json(products):
+    # Response-ready dicts for Product records (plain dicts pass through), one at a time
+    return (p.to_dict() if isinstance(p, Product) else p for p in products)
+
+
+def to_json(products):
+    return list(iter_json(products))
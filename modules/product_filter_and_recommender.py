@@ -1,11 +1,13 @@
-import json
 import numpy as np
 from sklearn.metrics.pairwise import cosine_similarity
 
+from modules.binary_catalog import load_catalog
+from modules.metrics import count, stage, timed
+
 
 def load_data(file_path):
-    with open(file_path, 'r') as f:
-        return json.load(f)
+    # JSON / JSON Lines are streamed product by product; compiled catalogs are memory-mapped
+    return load_catalog(file_path)
 
 
 def parse_delivery_time(delivery_str):
@@ -27,7 +29,9 @@ def parse_delivery_time(delivery_str):
     return None, None
 
 
+@timed("filter")
 def filter_products(data, min_price=None, max_price=None, min_rating=None, min_reviews=None, max_delivery_days=None):
+    count("rows_scanned", len(data))
     filtered = []
     for p in data:
         if min_price is not None and p['price'] < min_price:
@@ -39,35 +43,40 @@ def filter_products(data, min_price=None, max_price=None, min_rating=None, min_r
         if min_reviews is not None and p['review_count'] < min_reviews:
             continue
         if max_delivery_days is not None:
-            min_d, max_d = parse_delivery_time(p['delivery_time'])
+            if isinstance(p, dict):
+                min_d, max_d = parse_delivery_time(p['delivery_time'])
+            else:
+                # Product records are parsed once at load
+                min_d, max_d = p.delivery_min, p.delivery_max
             if max_d is not None and max_d > max_delivery_days:
                 continue
         filtered.append(p)
     return filtered
 
 
+def ram_number(p):
+    # Product records carry the parsed value; plain dicts are parsed here
+    if not isinstance(p, dict):
+        return p.ram_gb or 0
+    try:
+        return int(''.join(filter(str.isdigit, p.get('RAM', ''))))
+    except:
+        return 0
+
+
+@timed("build_feature_matrix")
 def build_feature_matrix(data):
     brands = sorted({p.get('brand', '') for p in data if p.get('brand')})
-    ram_vals = []
-    prices = []
-    for p in data:
-        try:
-            ram_num = int(''.join(filter(str.isdigit, p.get('RAM', ''))))
-        except:
-            ram_num = 0
-        ram_vals.append(ram_num)
-        prices.append(p.get('price', 0))
+    brand_index = {b: i for i, b in enumerate(brands)}
+    ram_vals = [ram_number(p) for p in data]
+    prices = [p.get('price', 0) for p in data]
     ram_min, ram_max = min(ram_vals), max(ram_vals)
     price_min, price_max = min(prices), max(prices)
     X = []
-    for p in data:
+    for p, ram in zip(data, ram_vals):
         brand_vec = [0] * len(brands)
-        if p['brand'] in brands:
-            brand_vec[brands.index(p['brand'])] = 1
-        try:
-            ram = int(''.join(filter(str.isdigit, p.get('RAM', ''))))
-        except:
-            ram = 0
+        if p['brand'] in brand_index:
+            brand_vec[brand_index[p['brand']]] = 1
         ram_norm = (ram - ram_min) / (ram_max - ram_min) if ram_max > ram_min else 0
         price = p.get('price', 0)
         price_norm = (price - price_min) / (price_max - price_min) if price_max > price_min else 0
@@ -79,6 +88,7 @@ def build_feature_matrix(data):
 def recommend_products(data, user_pref, top_n=5):
     # Step 1: Strict filter
     filtered = data
+    count("rows_scanned", len(data))
 
     if 'brand' in user_pref:
         preferred_brands = [b.lower() for b in user_pref['brand']] if isinstance(user_pref['brand'], list) else [user_pref['brand'].lower()]
@@ -109,6 +119,7 @@ def recommend_products(data, user_pref, top_n=5):
     if np.count_nonzero(user_vec) == 0:
         return filtered[:top_n]
 
-    sims = cosine_similarity(user_vec, X).flatten()
+    with stage("cosine_similarity"):
+        sims = cosine_similarity(user_vec, X).flatten()
     top_indices = sims.argsort()[::-1][:top_n]
     return [filtered[i] for i in top_indices]
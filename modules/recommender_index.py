@@ -0,0 +1,269 @@
+import numpy as np
+
+from modules.ann_index import exact_search, normalize_rows
+from modules.catalog_delta import resized
+from modules.metrics import count, stage
+
+
+def _ram_number(ram_str):
+    try:
+        return int(''.join(filter(str.isdigit, ram_str)))
+    except:
+        return 0
+
+
+def _patch_codes(values, codes, rows, new_values, coded=lambda v: True):
+    # (values, codes) of a sorted code table after rows get new values. The table
+    # is only renumbered when a value is introduced or is no longer used.
+    values = list(values)
+    code = {v: i for i, v in enumerate(values)}
+    for i, value in zip(rows.tolist(), new_values):
+        if not coded(value):
+            codes[i] = -1
+            continue
+        if value not in code:
+            code[value] = len(values)
+            values.append(value)
+        codes[i] = code[value]
+    used = np.bincount(codes[codes >= 0], minlength=len(values)).astype(bool)
+    if used.all() and values == sorted(values):
+        return values, codes
+    kept = sorted(v for v, in_use in zip(values, used) if in_use)
+    position = {v: i for i, v in enumerate(kept)}
+    # The trailing -1 maps uncoded rows (-1) to themselves
+    renumber = np.array([position.get(v, -1) for v in values] + [-1], dtype=np.int32)
+    return kept, renumber[codes]
+
+
+def top_k(scores, k):
+    # Indices of the k highest scores, best first, without sorting the whole array.
+    # Ties go to the higher index, like scores.argsort()[::-1].
+    n = len(scores)
+    if k <= 0 or n == 0:
+        return np.empty(0, dtype=np.int64)
+    if k < n:
+        part = np.argpartition(-scores, k - 1)[:k]
+    else:
+        part = np.arange(n)
+    return part[np.lexsort((-part, -scores[part]))]
+
+
+class RecommenderIndex:
+    """
+    Per-snapshot cache of everything recommend_products() derives from the catalog.
+    RAM is parsed once, brands are stored as integer codes (the one-hot brand
+    columns are never materialized) and a catalog-wide pre-normalized float32
+    matrix [ram_norm, price_norm] backs the batch scoring API.
+    """
+
+    def __init__(self, data):
+        self.size = len(data)
+        self.brand_names = sorted({p.get('brand', '') for p in data if p.get('brand')})
+        brand_code = {b: i for i, b in enumerate(self.brand_names)}
+        self.brand_codes = np.array([brand_code.get(p.get('brand', ''), -1) for p in data], dtype=np.int32)
+        self.brand_lower = np.array([p.get('brand', '').lower() for p in data], dtype=object)
+
+        # RAM strings are kept as codes so the substring match runs once per distinct value
+        ram_strings = [p.get('RAM', '') for p in data]
+        self.ram_values = sorted(set(ram_strings))
+        ram_code = {r: i for i, r in enumerate(self.ram_values)}
+        self.ram_codes = np.array([ram_code[r] for r in ram_strings], dtype=np.int32)
+
+        self.ram = np.array([_ram_number(r) for r in ram_strings], dtype=np.float64)
+        self.price = np.array([p.get('price', 0) for p in data], dtype=np.float64)
+
+        self.ram_min, self.ram_max = (self.ram.min(), self.ram.max()) if self.size else (0, 0)
+        self.price_min, self.price_max = (self.price.min(), self.price.max()) if self.size else (0, 0)
+        self.features = self._features(slice(None))
+        self.has_brand = (self.brand_codes >= 0).astype(np.float32)
+        self._item_vectors = None
+        # Set by patched() when every item vector changed (new normalization or brands)
+        self.rescaled = False
+
+    def _features(self, rows):
+        return np.column_stack((
+            self._normalize(self.ram[rows], self.ram_min, self.ram_max),
+            self._normalize(self.price[rows], self.price_min, self.price_max),
+        )).astype(np.float32)
+
+    def patched(self, data, delta):
+        """
+        Index of the catalog after `delta`. Only the changed rows are parsed;
+        the catalog-wide normalization (and with it every feature row) is
+        recomputed only when the RAM or price range changed, and brand / RAM
+        codes are renumbered only when a value appeared or disappeared.
+        """
+        index = RecommenderIndex.__new__(RecommenderIndex)
+        index.size = delta.size
+        rows = delta.rows
+        changed = [data[i] for i in rows.tolist()]
+        brands = [p.get('brand', '') for p in changed]
+        ram_strings = [p.get('RAM', '') for p in changed]
+
+        index.brand_names, index.brand_codes = _patch_codes(
+            self.brand_names, resized(self.brand_codes, delta.size), rows, brands, coded=bool)
+        index.brand_lower = resized(self.brand_lower, delta.size)
+        index.brand_lower[rows] = [(b or '').lower() for b in brands]
+        index.ram_values, index.ram_codes = _patch_codes(
+            self.ram_values, resized(self.ram_codes, delta.size), rows, ram_strings)
+        index.ram = resized(self.ram, delta.size)
+        index.ram[rows] = [_ram_number(r) for r in ram_strings]
+        index.price = resized(self.price, delta.size)
+        index.price[rows] = [p.get('price', 0) for p in changed]
+
+        index.ram_min, index.ram_max = (index.ram.min(), index.ram.max()) if index.size else (0, 0)
+        index.price_min, index.price_max = (index.price.min(), index.price.max()) if index.size else (0, 0)
+        index.rescaled = ((index.ram_min, index.ram_max, index.price_min, index.price_max)
+                          != (self.ram_min, self.ram_max, self.price_min, self.price_max)
+                          or index.brand_names != self.brand_names)
+        if index.rescaled:
+            index.features = index._features(slice(None))
+        else:
+            index.features = resized(self.features, delta.size)
+            index.features[rows] = index._features(rows)
+        index.has_brand = (index.brand_codes >= 0).astype(np.float32)
+
+        index._item_vectors = None
+        if self._item_vectors is not None and not index.rescaled:
+            index._item_vectors = resized(self._item_vectors, delta.size)
+            index._item_vectors[rows] = index._vectors(rows)
+        return index
+
+    @staticmethod
+    def _normalize(values, low, high):
+        if high > low:
+            return (values - low) / (high - low)
+        return np.zeros_like(values, dtype=np.float64)
+
+    def candidates(self, user_pref):
+        # Same strict brand / RAM filter as recommend_products, as a boolean mask
+        mask = np.ones(self.size, dtype=bool)
+        preferred_brands = None
+        if 'brand' in user_pref:
+            brands = user_pref['brand'] if isinstance(user_pref['brand'], list) else [user_pref['brand']]
+            preferred_brands = {b.lower() for b in brands}
+            mask &= np.isin(self.brand_lower, list(preferred_brands))
+        if 'RAM' in user_pref:
+            target_ram = str(user_pref['RAM'])
+            matching = [i for i, r in enumerate(self.ram_values) if target_ram in r]
+            mask &= np.isin(self.ram_codes, matching)
+        return mask, preferred_brands
+
+    def recommend(self, data, user_pref, top_n=5):
+        # Same results as recommend_products(data, user_pref, top_n) on this index's catalog
+        with stage("recommend.candidates"):
+            mask, preferred_brands = self.candidates(user_pref)
+            idx = np.flatnonzero(mask)
+        count("rows_scanned", self.size)
+        if len(idx) == 0:
+            return []
+        with stage("recommend.score"):
+            return self._score(data, user_pref, idx, preferred_brands, top_n)
+
+    def _score(self, data, user_pref, idx, preferred_brands, top_n):
+
+        # Features are normalized over the filtered group, as build_feature_matrix does
+        ram = self.ram[idx]
+        ram_min, ram_max = ram.min(), ram.max()
+        ram_norm = self._normalize(ram, ram_min, ram_max)
+        price = self.price[idx]
+        price_norm = self._normalize(price, price.min(), price.max())
+        has_brand = self.has_brand[idx].astype(np.float64)
+
+        # Every branded product left after the strict filter matches a preferred brand,
+        # so its one-hot brand block contributes exactly 1 to the dot product
+        brand_weight = 0.0
+        brands_in_group = 0
+        if preferred_brands is not None:
+            codes = self.brand_codes[idx]
+            brand_weight = 1.0
+            brands_in_group = len(np.unique(codes[codes >= 0]))
+        user_ram = (int(user_pref['RAM']) - ram_min) / (ram_max - ram_min) if 'RAM' in user_pref and ram_max > ram_min else 0
+        user_norm = np.sqrt(brands_in_group * brand_weight + user_ram ** 2)
+        if user_norm == 0:
+            return [data[i] for i in idx[:top_n].tolist()]
+
+        X = np.column_stack((has_brand, ram_norm, price_norm))
+        dots = X @ np.array([brand_weight, user_ram, 0.0])
+        norms = np.linalg.norm(X, axis=1) * user_norm
+        sims = np.divide(dots, norms, out=np.zeros_like(dots), where=norms > 0)
+        return [data[i] for i in idx[top_k(sims, top_n)].tolist()]
+
+    def user_vector(self, user_pref):
+        # Preference vector in the catalog-wide feature space: [brand one-hot..., ram, price]
+        vec = np.zeros(len(self.brand_names) + 2, dtype=np.float32)
+        if 'brand' in user_pref:
+            brands = user_pref['brand'] if isinstance(user_pref['brand'], list) else [user_pref['brand']]
+            preferred = {b.lower() for b in brands}
+            for i, b in enumerate(self.brand_names):
+                if b.lower() in preferred:
+                    vec[i] = 1
+        if 'RAM' in user_pref and self.ram_max > self.ram_min:
+            vec[-2] = (int(user_pref['RAM']) - self.ram_min) / (self.ram_max - self.ram_min)
+        if 'price_range' in user_pref and self.price_max > self.price_min:
+            min_p, max_p = user_pref['price_range']
+            vec[-1] = ((min_p + max_p) / 2 - self.price_min) / (self.price_max - self.price_min)
+        return vec
+
+    def score_batch(self, user_vectors):
+        # Cosine similarity of many preference vectors against the whole catalog:
+        # one gather for the brand block plus one matrix multiply for the dense block
+        U = np.atleast_2d(np.asarray(user_vectors, dtype=np.float32))
+        n_brands = len(self.brand_names)
+        brand_block = np.zeros((len(U), self.size), dtype=np.float32)
+        branded = self.brand_codes >= 0
+        brand_block[:, branded] = U[:, self.brand_codes[branded]]
+        dots = brand_block + U[:, n_brands:] @ self.features.T
+
+        item_norms = np.sqrt(self.has_brand + np.einsum('ij,ij->i', self.features, self.features))
+        user_norms = np.linalg.norm(U, axis=1)
+        norms = np.outer(user_norms, item_norms)
+        return np.divide(dots, norms, out=np.zeros_like(dots), where=norms > 0)
+
+    def item_vectors(self):
+        # Unit-length catalog-wide rows [brand one-hot..., ram, price]: the space
+        # score_batch() ranks in, materialized on first use for the ANN index
+        if self._item_vectors is None:
+            self._item_vectors = self._vectors(np.arange(self.size))
+        return self._item_vectors
+
+    def _vectors(self, rows):
+        n_brands = len(self.brand_names)
+        vectors = np.zeros((len(rows), n_brands + 2), dtype=np.float32)
+        codes = self.brand_codes[rows]
+        branded = np.flatnonzero(codes >= 0)
+        vectors[branded, codes[branded]] = 1
+        vectors[:, n_brands:] = self.features[rows]
+        return normalize_rows(vectors)
+
+    def recommend_nearest(self, data, user_pref, top_n=5, ann=None, nprobe=None):
+        """
+        Catalog-wide cosine ranking of one preference dict, as recommend_batch
+        does, within the same strict brand / RAM filter. With an IVFIndex built
+        from item_vectors() only its probed lists are scored (nprobe trades
+        recall for latency); without one every candidate is scored exactly.
+        """
+        mask, _ = self.candidates(user_pref)
+        query = self.user_vector(user_pref)
+        if ann is None:
+            ids, _ = exact_search(self.item_vectors(), query, top_n, mask)
+        else:
+            ids, _ = ann.search(query, top_n, nprobe=nprobe, mask=mask)
+        return [data[i] for i in ids.tolist()]
+
+    def recommend_batch(self, data, user_prefs, top_n=5):
+        """
+        Recommends for many preference dicts at once. Candidates use the same
+        strict brand / RAM filter as recommend_products, but all preferences are
+        scored in one matrix multiply against the catalog-wide normalization.
+        """
+        if not user_prefs:
+            return []
+        sims = self.score_batch([self.user_vector(pref) for pref in user_prefs])
+        results = []
+        for row, pref in zip(sims, user_prefs):
+            mask, _ = self.candidates(pref)
+            scores = np.where(mask, row, -np.inf)
+            best = top_k(scores, min(top_n, int(mask.sum())))
+            results.append([data[i] for i in best.tolist()])
+        return results
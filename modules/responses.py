@@ -0,0 +1,212 @@
+import base64
+import binascii
+import gzip
+import hashlib
+import json
+import zlib
+
+from flask import Response, current_app
+
+from modules.metrics import count
+
+try:
+    import brotli  # optional: pip install brotli
+except ImportError:
+    brotli = None
+
+# Responses smaller than this are sent uncompressed
+COMPRESS_MIN_BYTES = 1024
+GZIP_LEVEL = 6
+
+# Products serialized per chunk of a streamed JSON Lines response
+STREAM_CHUNK_ROWS = 500
+
+# Accept types answered with JSON Lines (one product per line) instead of a JSON array
+JSON_LINES_TYPES = ("application/x-ndjson", "application/jsonl")
+
+# Request fields that select the page or the shape of a response rather than the results
+PAGING_FIELDS = ("cursor", "limit", "fields")
+
+
+class StaleCursor(Exception):
+    # The cursor was issued for an older catalog version, whose pages no longer line up
+    pass
+
+
+def encodings():
+    # Content codings this server can produce, preferred first
+    return ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def negotiate(request):
+    """
+    (content coding or None, JSON Lines?) for a request, from its
+    Accept-Encoding and Accept headers.
+    """
+    encoding = request.accept_encodings.best_match(encodings())
+    # Only an explicit JSON Lines type counts, not */*
+    json_lines = any(value in JSON_LINES_TYPES and quality > 0 for value, quality in request.accept_mimetypes)
+    return encoding, json_lines
+
+
+def _digest(*parts):
+    text = json.dumps(parts, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def query_key(route, query):
+    # Identifies a query independent of the page asked for, so a cursor is only used with its own query
+    return _digest(route, {k: v for k, v in query.items() if k not in PAGING_FIELDS})[:16]
+
+
+def etag(route, version, query, encoding=None, json_lines=False):
+    # Strong validator of a response: same catalog version, same query, same representation
+    return _digest(route, version, query, encoding, json_lines)
+
+
+def not_modified(request, tag):
+    """
+    Response for a request whose If-None-Match holds `tag`, else None:
+    304 Not Modified for GET and HEAD. RFC 9110 allows 304 only for those,
+    so any other method (POST /filter, /search) gets 412 Precondition Failed.
+    """
+    # If-None-Match uses the weak comparison (RFC 9110 13.1.2); contains_weak also covers "*"
+    if not request.if_none_match.contains_weak(tag):
+        return None
+    if request.method in ("GET", "HEAD"):
+        count("responses_not_modified")
+        response = Response(status=304)
+    else:
+        count("responses_precondition_failed")
+        response = Response(status=412)
+    response.set_etag(tag)
+    response.vary.update(("Accept", "Accept-Encoding"))
+    return response
+
+
+def encode_cursor(key, offset, version):
+    payload = json.dumps({"q": key, "o": offset, "v": version}, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(payload).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor, key, version):
+    """
+    Offset a cursor points at. ValueError when it is malformed or belongs to
+    another query, StaleCursor when the catalog changed since it was issued:
+    offsets into the new results would skip or repeat products.
+    """
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        offset = int(payload["o"])
+        owner = payload["q"]
+        issued = payload["v"]
+    except (TypeError, ValueError, KeyError, binascii.Error):
+        raise ValueError("Invalid cursor")
+    if owner != key or offset < 0:
+        raise ValueError("Cursor does not belong to this query")
+    if issued != version:
+        raise StaleCursor("The catalog changed since this cursor was issued; start again from the first page")
+    return offset
+
+
+def page_bounds(query, key, version, default_limit=None):
+    """
+    (offset, limit) of the page a request asks for through 'cursor' and
+    'limit', against catalog `version`. Without either, the whole result
+    (offset 0, no limit).
+    """
+    offset = decode_cursor(query["cursor"], key, version) if query.get("cursor") else 0
+    limit = query.get("limit", default_limit)
+    if limit is not None:
+        try:
+            limit = int(limit)
+        except (TypeError, ValueError):
+            raise ValueError("'limit' must be an integer")
+        if limit < 1:
+            raise ValueError("'limit' must be at least 1")
+    return offset, limit
+
+
+def projection(fields):
+    """
+    Function trimming a product dict to `fields` (a list of field names),
+    or None when every field is wanted.
+    """
+    if fields is None:
+        return None
+    if not isinstance(fields, list) or not all(isinstance(f, str) for f in fields):
+        raise ValueError("'fields' must be a list of field names")
+    wanted = tuple(fields)
+    return lambda product: {f: product[f] for f in wanted if f in product}
+
+
+def compress(data, encoding):
+    if encoding == "br":
+        return brotli.compress(data)
+    return gzip.compress(data, compresslevel=GZIP_LEVEL)
+
+
+class _BrotliStream:
+    # brotli.Compressor with the compress() / flush() interface of zlib's compressobj
+    def __init__(self):
+        self._compressor = brotli.Compressor()
+
+    def compress(self, data):
+        return self._compressor.process(data)
+
+    def flush(self):
+        return self._compressor.finish()
+
+
+def _compressor(encoding):
+    if encoding == "br":
+        return _BrotliStream()
+    return zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)  # wbits 31: gzip container
+
+
+def json_lines(items, dumps=json.dumps, encoding=None, chunk_rows=STREAM_CHUNK_ROWS):
+    # Generator of the (optionally compressed) JSON Lines body of `items`, chunk_rows lines at a time
+    compressor = _compressor(encoding) if encoding else None
+    chunk = []
+    for item in items:
+        chunk.append(dumps(item))
+        if len(chunk) == chunk_rows:
+            data = ("\n".join(chunk) + "\n").encode("utf-8")
+            chunk = []
+            data = compressor.compress(data) if compressor else data
+            if data:
+                yield data
+    data = ("\n".join(chunk) + "\n").encode("utf-8") if chunk else b""
+    if compressor:
+        data = compressor.compress(data) + compressor.flush()
+    if data:
+        yield data
+
+
+def stream_response(items, encoding=None):
+    # Chunked JSON Lines response; nothing is materialized beyond one chunk. Lines
+    # are serialized like jsonify() output, by the app's JSON provider, which is
+    # looked up now since the body is generated after the request context ends.
+    response = Response(json_lines(items, current_app.json.dumps, encoding), mimetype="application/x-ndjson")
+    if encoding:
+        response.headers["Content-Encoding"] = encoding
+    response.vary.update(("Accept", "Accept-Encoding"))
+    return response
+
+
+def compress_response(response, encoding):
+    """
+    Compresses a buffered response body in place when it is large enough
+    and the client accepts `encoding`. Streamed responses, already encoded
+    ones and 304s are left alone.
+    """
+    response.vary.add("Accept-Encoding")
+    if (encoding is None or response.direct_passthrough or response.is_streamed
+            or "Content-Encoding" in response.headers or response.status_code in (204, 304)):
+        return response
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_BYTES:
+        return response
+    response.set_data(compress(data, encoding))
+    response.headers["Content-Encoding"] = encoding
+    return response
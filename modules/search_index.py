@@ -0,0 +1,242 @@
+import math
+import re
+from bisect import bisect_left, insort
+
+from modules.metrics import count, timed
+
+# Fields the /search route has always matched as substrings
+SUBSTRING_FIELDS = ("product_name", "brand", "category")
+
+# String fields that are not useful as search text
+EXCLUDED_FIELDS = {"node_id", "product_url", "delivery_time"}
+
+# Decimal numbers stay whole, so "13.3 inch" does not index the tokens "13" and "3"
+TOKEN_RE = re.compile(r"\d+(?:\.\d+)+|[a-z0-9]+")
+GRAM_SIZE = 3
+MIN_PREFIX_LENGTH = 2
+# Posting lists are stored in chunks of 2**CHUNK_BITS consecutive doc ids
+CHUNK_BITS = 10
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(text.lower())
+
+
+def char_grams(text):
+    # Character trigrams of a lowercased value; short values are kept whole
+    if len(text) < GRAM_SIZE:
+        return {text} if text else set()
+    return {text[i:i + GRAM_SIZE] for i in range(len(text) - GRAM_SIZE + 1)}
+
+
+class SearchIndex:
+    """
+    Inverted index behind /search.
+    - Token postings over every text field of a product, ranked with BM25;
+      the last query token is prefix-matched so partial words still hit.
+    - Character trigram postings over product_name, brand and category, so a
+      query that is a substring of those fields matches exactly as before.
+      These substring hits rank ahead of every token-only hit.
+    Products are addressed by their position in the catalog and can be added,
+    updated or removed without rebuilding the index. Posting lists are split
+    into chunks of 2**CHUNK_BITS doc ids, so patched() can build the next
+    version on a copy that shares every chunk it does not change while readers
+    of the previous catalog version keep a consistent index.
+    """
+
+    def __init__(self, data=(), k1=1.2, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings = {}       # token -> {chunk: {doc_id: term frequency}}
+        self.vocabulary = []     # sorted tokens, for prefix expansion
+        self.gram_postings = {}  # trigram -> {chunk: set(doc_id)}
+        self.doc_lengths = {}
+        self.doc_tokens = {}
+        self.doc_texts = {}      # doc_id -> lowercased SUBSTRING_FIELDS values
+        self.total_length = 0
+        # Chunks this index may change in place, per token / trigram;
+        # None when it owns all of them
+        self._owned_tokens = None
+        self._owned_grams = None
+        for doc_id, product in enumerate(data):
+            self.add(doc_id, product)
+
+    def fork(self):
+        # Copy sharing the posting chunks, which are copied on first change
+        index = SearchIndex.__new__(SearchIndex)
+        index.k1 = self.k1
+        index.b = self.b
+        index.postings = dict(self.postings)
+        index.vocabulary = list(self.vocabulary)
+        index.gram_postings = dict(self.gram_postings)
+        index.doc_lengths = dict(self.doc_lengths)
+        index.doc_tokens = dict(self.doc_tokens)
+        index.doc_texts = dict(self.doc_texts)
+        index.total_length = self.total_length
+        index._owned_tokens = {}
+        index._owned_grams = {}
+        return index
+
+    def patched(self, data, delta):
+        # Index of the catalog after `delta`, re-indexing only the changed rows
+        index = self.fork()
+        for doc_id in range(delta.size, delta.old_size):
+            index.remove(doc_id)
+        for doc_id in delta.rows.tolist():
+            index.add(doc_id, data[doc_id])
+        return index
+
+    @staticmethod
+    def _chunk(table, owned, key, doc_id, empty):
+        # (chunks of `key`, the chunk holding doc_id), both safe to change in place
+        chunks = table[key]
+        c = doc_id >> CHUNK_BITS
+        if owned is not None:
+            if key not in owned:
+                chunks = table[key] = dict(chunks)
+                owned[key] = set()
+            if c not in owned[key]:
+                chunks[c] = chunks[c].copy() if c in chunks else empty()
+                owned[key].add(c)
+        if c not in chunks:
+            chunks[c] = empty()
+        return chunks, chunks[c]
+
+    def __len__(self):
+        return len(self.doc_lengths)
+
+    @staticmethod
+    def _text_fields(product):
+        return [value for key, value in product.items()
+                if isinstance(value, str) and key not in EXCLUDED_FIELDS]
+
+    def add(self, doc_id, product):
+        if doc_id in self.doc_lengths:
+            self.remove(doc_id)
+
+        counts = {}
+        for value in self._text_fields(product):
+            for token in tokenize(value):
+                counts[token] = counts.get(token, 0) + 1
+        for token, tf in counts.items():
+            if token not in self.postings:
+                self.postings[token] = {}
+                insort(self.vocabulary, token)
+            self._chunk(self.postings, self._owned_tokens, token, doc_id, dict)[1][doc_id] = tf
+        self.doc_tokens[doc_id] = tuple(counts)
+        self.doc_lengths[doc_id] = sum(counts.values())
+        self.total_length += self.doc_lengths[doc_id]
+
+        texts = tuple(product.get(field, "").lower() for field in SUBSTRING_FIELDS)
+        self.doc_texts[doc_id] = texts
+        for text in texts:
+            for gram in char_grams(text):
+                if gram not in self.gram_postings:
+                    self.gram_postings[gram] = {}
+                self._chunk(self.gram_postings, self._owned_grams, gram, doc_id, set)[1].add(doc_id)
+
+    def remove(self, doc_id):
+        if doc_id not in self.doc_lengths:
+            return
+        c = doc_id >> CHUNK_BITS
+        for token in self.doc_tokens.pop(doc_id):
+            chunks, posting = self._chunk(self.postings, self._owned_tokens, token, doc_id, dict)
+            del posting[doc_id]
+            if not posting:
+                del chunks[c]
+                if not chunks:
+                    del self.postings[token]
+                    del self.vocabulary[bisect_left(self.vocabulary, token)]
+        self.total_length -= self.doc_lengths.pop(doc_id)
+
+        for text in self.doc_texts.pop(doc_id):
+            for gram in char_grams(text):
+                if gram in self.gram_postings:
+                    chunks, docs = self._chunk(self.gram_postings, self._owned_grams, gram, doc_id, set)
+                    docs.discard(doc_id)
+                    if not docs:
+                        del chunks[c]
+                        if not chunks:
+                            del self.gram_postings[gram]
+
+    def update(self, doc_id, product):
+        self.add(doc_id, product)
+
+    def _prefix_tokens(self, prefix):
+        start = bisect_left(self.vocabulary, prefix)
+        tokens = []
+        for token in self.vocabulary[start:]:
+            if not token.startswith(prefix):
+                break
+            tokens.append(token)
+        return tokens
+
+    def _gram_count(self, gram):
+        return sum(len(docs) for docs in self.gram_postings.get(gram, {}).values())
+
+    def _substring_matches(self, query):
+        if len(query) >= GRAM_SIZE:
+            grams = sorted(char_grams(query), key=self._gram_count)
+            candidates = set().union(*self.gram_postings.get(grams[0], {}).values())
+            for gram in grams[1:]:
+                if not candidates:
+                    break
+                chunks = self.gram_postings.get(gram, {})
+                candidates = {doc_id for doc_id in candidates if doc_id in chunks.get(doc_id >> CHUNK_BITS, ())}
+        else:
+            candidates = set()
+            for gram, chunks in self.gram_postings.items():
+                if query in gram:
+                    for docs in chunks.values():
+                        candidates |= docs
+        return {doc_id for doc_id in candidates
+                if any(query in text for text in self.doc_texts[doc_id])}
+
+    def _token_matches(self, tokens):
+        # Documents containing every query token (the last one as a prefix
+        # when it is at least MIN_PREFIX_LENGTH characters long),
+        # with the BM25 contribution of each matched term
+        n = len(self.doc_lengths)
+        avg_length = self.total_length / n if n else 0
+        scores = None
+        for position, token in enumerate(tokens):
+            if position == len(tokens) - 1 and len(token) >= MIN_PREFIX_LENGTH:
+                expansions = self._prefix_tokens(token)
+            else:
+                expansions = [token] if token in self.postings else []
+            term_scores = {}
+            for term in expansions:
+                chunks = self.postings[term].values()
+                df = sum(len(posting) for posting in chunks)
+                idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+                for posting in chunks:
+                    for doc_id, tf in posting.items():
+                        norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[doc_id] / avg_length)
+                        term_scores[doc_id] = term_scores.get(doc_id, 0) + idf * tf * (self.k1 + 1) / (tf + norm)
+            if scores is None:
+                scores = term_scores
+            else:
+                scores = {doc_id: score + term_scores[doc_id]
+                          for doc_id, score in scores.items() if doc_id in term_scores}
+            if not scores:
+                return {}
+        return scores or {}
+
+    @timed("search")
+    def search(self, query, offset=0, limit=None):
+        # Returns (ranked doc ids for the requested page, total number of matches)
+        query = query.lower()
+        if not query:
+            doc_ids = sorted(self.doc_lengths)
+            end = None if limit is None else offset + limit
+            return doc_ids[offset:end], len(doc_ids)
+
+        scores = self._token_matches(tokenize(query))
+        substring_hits = self._substring_matches(query)
+        ranked = set(scores) | substring_hits
+
+        count("rows_scanned", len(ranked))
+        # Exact substring hits in the classic fields first, each tier by BM25 score
+        doc_ids = sorted(ranked, key=lambda doc_id: (doc_id not in substring_hits, -scores.get(doc_id, 0), doc_id))
+        end = None if limit is None else offset + limit
+        return doc_ids[offset:end], len(doc_ids)
@@ -0,0 +1,123 @@
+import types
+from multiprocessing import shared_memory
+
+import numpy as np
+
+ALIGN = 64
+
+# Arrays smaller than this stay where they are
+MIN_SHARED_BYTES = 1024
+
+# Attributes of these are never searched
+_OPAQUE = (type, types.ModuleType, types.FunctionType, types.MethodType, types.BuiltinFunctionType)
+
+# Containers with more entries than this hold per-product or per-token Python
+# data (postings, id maps) rather than arrays, and are not searched
+MAX_WALK_ITEMS = 10_000
+
+
+def _align(n):
+    return (n + ALIGN - 1) // ALIGN * ALIGN
+
+
+def _shareable(value):
+    # Owning numeric arrays only: views and memory-mapped arrays are left alone
+    return (isinstance(value, np.ndarray) and value.base is None and value.dtype != object
+            and value.nbytes >= MIN_SHARED_BYTES)
+
+
+def _walk(value, visit, seen):
+    """
+    Calls visit(array) for every shareable array reachable from `value`
+    through object attributes, dicts, lists and tuples, and returns `value`
+    with each array replaced by what visit() returned. Objects, dicts and
+    lists are updated in place; tuples are rebuilt.
+    """
+    if _shareable(value):
+        return visit(value)
+    if id(value) in seen:
+        return value
+    seen.add(id(value))
+    if isinstance(value, dict):
+        if len(value) <= MAX_WALK_ITEMS:
+            for key, item in list(value.items()):
+                replaced = _walk(item, visit, seen)
+                if replaced is not item:
+                    value[key] = replaced
+    elif isinstance(value, list):
+        if len(value) <= MAX_WALK_ITEMS:
+            for i, item in enumerate(value):
+                replaced = _walk(item, visit, seen)
+                if replaced is not item:
+                    value[i] = replaced
+    elif isinstance(value, tuple):
+        if len(value) <= MAX_WALK_ITEMS:
+            items = [_walk(item, visit, seen) for item in value]
+            if any(new is not old for new, old in zip(items, value)):
+                return type(value)(items) if type(value) is tuple else type(value)(*items)
+    elif hasattr(value, "__dict__") and not isinstance(value, _OPAQUE):
+        for name, item in list(vars(value).items()):
+            replaced = _walk(item, visit, seen)
+            if replaced is not item:
+                setattr(value, name, replaced)
+    return value
+
+
+class SharedArrays:
+    """
+    One multiprocessing.shared_memory segment holding the NumPy arrays of a
+    set of indexes. share() moves every array reachable from the given
+    objects into the segment and points the objects at read-only views of
+    it, so worker processes forked afterwards all read the same physical
+    pages instead of each getting its own copy as they touch them.
+
+    The process that created the segment must call close() when it is done
+    with it (workers never do); close() also unlinks the segment.
+    """
+
+    def __init__(self):
+        self.segment = None
+        self.arrays = 0
+
+    def share(self, *objects):
+        # First pass: find the arrays; second: copy them into one segment and swap in the views
+        found = {}
+        for obj in objects:
+            _walk(obj, lambda array: found.setdefault(id(array), array), set())
+        if not found:
+            return self
+        offsets, size = {}, 0
+        for key, array in found.items():
+            offsets[key] = size
+            size = _align(size + array.nbytes)
+        self.segment = shared_memory.SharedMemory(create=True, size=size)
+        self.arrays = len(found)
+
+        views = {}
+        for key, array in found.items():
+            view = np.ndarray(array.shape, dtype=array.dtype, buffer=self.segment.buf, offset=offsets[key])
+            view[...] = array
+            view.flags.writeable = False
+            views[key] = view
+        for obj in objects:
+            _walk(obj, lambda array: views.get(id(array), array), set())
+        return self
+
+    @property
+    def nbytes(self):
+        return self.segment.size if self.segment is not None else 0
+
+    def close(self):
+        if self.segment is None:
+            return
+        self.segment.unlink()
+        try:
+            self.segment.close()
+        except BufferError:
+            # Views are still referenced; the mapping goes away with the process
+            pass
+        self.segment = None
+
+    def __repr__(self):
+        name = self.segment.name if self.segment is not None else None
+        return f"SharedArrays(segment={name!r}, arrays={self.arrays}, bytes={self.nbytes})"
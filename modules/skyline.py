@@ -0,0 +1,253 @@
+import threading
+from bisect import bisect_right
+from collections import OrderedDict
+
+import numpy as np
+
+from modules.catalog_delta import resized
+from modules.features import feature_column
+from modules.metrics import count, stage, timed
+
+# Objectives a ranking can weight; price and delivery are minimized, rating maximized
+OBJECTIVES = ("price", "seller_rating", "delivery")
+DEFAULT_WEIGHTS = {"price": 1.0, "seller_rating": 1.0, "delivery": 1.0}
+DEFAULT_TOP_K = 5
+
+# Filter arguments (as accepted by FilterIndex.select) a frontier can be restricted by
+FILTERS = ("min_price", "max_price", "min_rating", "min_reviews", "max_delivery_days")
+
+# Filter signatures whose frontiers are kept per catalog version, least recently used dropped first
+MAX_CACHED_FRONTIERS = 256
+
+
+def _dominates(price, rating, delivery, p, r, d):
+    # Which of the points (price, rating, delivery) dominate the point (p, r, d)
+    return ((price <= p) & (rating >= r) & (delivery <= d)
+            & ((price < p) | (rating > r) | (delivery < d)))
+
+
+def pareto_frontier(price, rating, delivery, rows):
+    """
+    The rows (sorted) no other row dominates, i.e. no other product is at most
+    as expensive, at least as well rated and at most as slow to deliver while
+    being strictly better on one of the three. Products equal on all three are
+    kept together.
+
+    One sort by (rating desc, delivery, price) leaves only the cheapest
+    products of each (rating, delivery) cell as candidates, which a sweep in
+    that order checks against a staircase of the lowest price seen per
+    delivery time. The sort is O(n log n). Each check is a bisection, but
+    adding a frontier product splices the staircase list in O(s), where s is
+    at most the number of distinct delivery times: O(n log n + f * s) for f
+    frontier products, O(n^2) only when delivery times are all distinct.
+    """
+    rows = np.asarray(rows, dtype=np.int64)
+    if len(rows) == 0:
+        return rows
+    p, r, d = price[rows], rating[rows], delivery[rows]
+    order = np.lexsort((p, d, -r))
+    r_sorted, d_sorted, p_sorted = r[order], d[order], p[order]
+    new_cell = np.ones(len(order), dtype=bool)
+    new_cell[1:] = (r_sorted[1:] != r_sorted[:-1]) | (d_sorted[1:] != d_sorted[:-1])
+    cell_start = np.maximum.accumulate(np.where(new_cell, np.arange(len(order)), 0))
+    candidates = np.flatnonzero(p_sorted == p_sorted[cell_start])
+
+    # Staircase of processed candidates: delivery times ascending, each with
+    # the lowest price among candidates delivering at least that fast
+    stair_delivery, stair_price = [], []
+    frontier = []
+    cell, cell_dominated = -1, False
+    for k in candidates.tolist():
+        price_k, delivery_k = float(p_sorted[k]), float(d_sorted[k])
+        if cell_start[k] != cell:
+            # Candidates of one cell are equal, so the cell is checked once,
+            # before any of them is added to the staircase
+            cell = cell_start[k]
+            at = bisect_right(stair_delivery, delivery_k)
+            cell_dominated = at > 0 and stair_price[at - 1] <= price_k
+        if cell_dominated:
+            continue
+        frontier.append(order[k])
+        at = bisect_right(stair_delivery, delivery_k)
+        if at > 0 and stair_delivery[at - 1] == delivery_k:
+            at -= 1
+        end = at
+        while end < len(stair_price) and stair_price[end] >= price_k:
+            end += 1
+        stair_delivery[at:end] = [delivery_k]
+        stair_price[at:end] = [price_k]
+    count("rows_scanned", len(rows))
+    return np.sort(rows[np.asarray(frontier, dtype=np.int64)])
+
+
+def _signature(filters):
+    return tuple((name, filters[name]) for name in FILTERS if filters.get(name) is not None)
+
+
+class SkylineIndex:
+    """
+    Per-snapshot Pareto frontiers of price, seller_rating and delivery days,
+    per category. Frontiers are computed over a FilterIndex selection and
+    cached by filter signature (up to MAX_CACHED_FRONTIERS). rank() scores
+    only a frontier, with user weights, so repeated "best deal" queries cost
+    a cache lookup plus a few dozen rows of arithmetic.
+
+    Price and rating come from the FilterIndex's parsed columns; products
+    without a category or with a missing price or rating are not ranked.
+    """
+
+    def __init__(self, data, filter_index):
+        self.size = len(data)
+        self.filter_index = filter_index
+        self.delivery = feature_column(data, "delivery_days")
+        self.category_names = []
+        self.category_codes = self._codes([p.get("category") for p in data])
+        self._frontiers = OrderedDict()  # signature -> {category code: rows}
+        self._lock = threading.Lock()
+
+    def _codes(self, values):
+        # Category codes, adding new categories to category_names; -1 when absent
+        code = {name: i for i, name in enumerate(self.category_names)}
+        codes = np.empty(len(values), dtype=np.int32)
+        for i, value in enumerate(values):
+            if value is None:
+                codes[i] = -1
+                continue
+            if value not in code:
+                code[value] = len(self.category_names)
+                self.category_names.append(value)
+            codes[i] = code[value]
+        return codes
+
+    @property
+    def price(self):
+        return self.filter_index.price
+
+    @property
+    def rating(self):
+        return self.filter_index.seller_rating
+
+    def _rankable(self, rows):
+        return rows[(self.category_codes[rows] >= 0) & ~np.isnan(self.price[rows]) & ~np.isnan(self.rating[rows])]
+
+    def _compute(self, rows):
+        # {category code: frontier rows} of the given rows
+        rows = self._rankable(rows)
+        codes = self.category_codes[rows]
+        order = np.argsort(codes, kind="stable")
+        groups = np.split(rows[order], np.flatnonzero(np.diff(codes[order])) + 1)
+        return {int(self.category_codes[group[0]]): pareto_frontier(self.price, self.rating, self.delivery, group)
+                for group in groups if len(group)}
+
+    def frontiers(self, **filters):
+        # {category code: frontier rows} of the products passing `filters`, cached by signature
+        key = _signature(filters)
+        with self._lock:
+            cached = self._frontiers.get(key)
+            if cached is not None:
+                self._frontiers.move_to_end(key)
+                count("skyline_cache_hits")
+                return cached
+        count("skyline_cache_misses")
+        with stage("skyline.compute"):
+            computed = self._compute(self.filter_index.select(**dict(key)))
+        with self._lock:
+            self._frontiers[key] = computed
+            while len(self._frontiers) > MAX_CACHED_FRONTIERS:
+                self._frontiers.popitem(last=False)
+        return computed
+
+    @timed("skyline.rank")
+    def rank(self, filters=None, weights=None, top_k=DEFAULT_TOP_K, category=None):
+        """
+        {category: (frontier size, [(row, score), ...])} with the top_k frontier
+        products of each category (or only `category`), best first.
+        Each objective is scaled to [0, 1] over the category's frontier (1 is
+        best) and the score is their weighted mean; ties go to the cheaper,
+        then the earlier product.
+        """
+        weights = dict(DEFAULT_WEIGHTS if weights is None else weights)
+        unknown = set(weights) - set(OBJECTIVES)
+        if unknown:
+            raise ValueError(f"Unknown objectives: {', '.join(sorted(unknown))}")
+        if any(w < 0 for w in weights.values()) or not any(weights.values()):
+            raise ValueError("Weights must be non-negative and not all zero")
+        total = sum(weights.values())
+
+        results = {}
+        for code, rows in self.frontiers(**(filters or {})).items():
+            name = self.category_names[code]
+            if category is not None and name != category:
+                continue
+            objectives = {
+                "price": -self.price[rows],
+                "seller_rating": self.rating[rows],
+                "delivery": -self.delivery[rows],
+            }
+            score = np.zeros(len(rows))
+            for objective, weight in weights.items():
+                values = objectives[objective]
+                low, high = values.min(), values.max()
+                scaled = (values - low) / (high - low) if high > low else np.ones(len(rows))
+                score += weight * scaled
+            score /= total
+            best = np.lexsort((rows, self.price[rows], -score))[:top_k]
+            results[name] = (len(rows), [(int(rows[i]), float(score[i])) for i in best.tolist()])
+        return results
+
+    def patched(self, data, delta, filter_index):
+        """
+        Index of the catalog after `delta`, over the patched `filter_index`.
+        Cached frontiers are maintained rather than dropped: a changed product
+        that passes a signature's filters joins its category's frontier unless
+        a frontier product dominates it, and evicts the ones it dominates. Only
+        when a product on a frontier was itself changed or removed is that
+        category's frontier recomputed.
+        """
+        index = SkylineIndex.__new__(SkylineIndex)
+        index.size = delta.size
+        index.filter_index = filter_index
+        index.category_names = list(self.category_names)
+        changed = [data[i] for i in delta.rows.tolist()]
+        index.delivery = resized(self.delivery, delta.size)
+        index.delivery[delta.rows] = feature_column(changed, "delivery_days")
+        index.category_codes = resized(self.category_codes, delta.size)
+        index.category_codes[delta.rows] = index._codes([p.get("category") for p in changed])
+        index._lock = threading.Lock()
+
+        remap = delta.remap()
+        inserted = index._rankable(delta.inserted_rows)
+        with self._lock:
+            cached = list(self._frontiers.items())
+        index._frontiers = OrderedDict()
+        for key, frontiers in cached:
+            index._frontiers[key] = index._maintain(frontiers, dict(key), remap, delta.inserted_rows, inserted)
+        return index
+
+    def _maintain(self, frontiers, filters, remap, inserted_rows, inserted):
+        updated, stale = {}, set()
+        for code, rows in frontiers.items():
+            rows = remap[rows]
+            if (rows < 0).any() or np.isin(rows, inserted_rows).any():
+                stale.add(code)
+            else:
+                # A moved product may now come earlier in the catalog
+                updated[code] = np.sort(rows)
+
+        joining = inserted[self.filter_index.matches(inserted, **filters)]
+        for row in joining.tolist():
+            code = int(self.category_codes[row])
+            if code in stale:
+                continue
+            rows = updated.get(code, np.zeros(0, dtype=np.int64))
+            p, r, d = self.price[row], self.rating[row], self.delivery[row]
+            if _dominates(self.price[rows], self.rating[rows], self.delivery[rows], p, r, d).any():
+                continue
+            beaten = _dominates(p, r, d, self.price[rows], self.rating[rows], self.delivery[rows])
+            updated[code] = np.sort(np.append(rows[~beaten], row))
+
+        if stale:
+            selected = self.filter_index.select(**filters)
+            selected = selected[np.isin(self.category_codes[selected], list(stale))]
+            updated.update(self._compute(selected))
+        return updated
@@ -0,0 +1,159 @@
+import numpy as np
+
+from modules.catalog_delta import resized
+from modules.features import category_codes, feature_column
+
+# Coefficients of calculate_weight: price, seller_rating and delivery_days
+PRICE_WEIGHT = 1
+RATING_WEIGHT = 10
+DELIVERY_WEIGHT = 2
+
+NORMS = ("l1", "l2", "linf")
+
+# Upper bound on the float64 scratch memory of one weight block
+BLOCK_BYTES = 32 * 1024 * 1024
+
+
+class WeightSpec:
+    """
+    Declarative edge weight between two products:
+
+        norm( coefficient * |feature_i - feature_j| for each feature )
+        + sum( penalty for each categorical field whose values differ )
+
+    features: {feature name: coefficient}. Names are numeric fields ("price",
+    "review_count", ...) or parsed ones ("delivery_days", "ram_gb",
+    "storage_gb", "screen_inches").
+    norm: "l1" (weighted sum), "l2" (euclidean) or "linf" (largest term).
+    penalties: {field: penalty}, e.g. {"platform": 50} for cross-platform edges.
+
+    WeightSpec({"price": 1, "seller_rating": 10, "delivery_days": 2}) is
+    calculate_weight. compile(data) parses the feature columns once and returns
+    a WeightKernel that computes whole blocks of weights with NumPy.
+    """
+
+    def __init__(self, features, norm="l1", penalties=None):
+        if norm not in NORMS:
+            raise ValueError(f"Unknown norm: {norm}")
+        if not features and not penalties:
+            raise ValueError("A weight spec needs at least one feature or penalty")
+        self.features = dict(features)
+        self.norm = norm
+        self.penalties = dict(penalties or {})
+
+    @classmethod
+    def from_dict(cls, spec):
+        # {"features": {...}, "norm": "l1", "penalties": {...}}, e.g. parsed from a tenant's JSON config
+        return cls(spec.get("features", {}), norm=spec.get("norm", "l1"), penalties=spec.get("penalties"))
+
+    def to_dict(self):
+        return {"features": dict(self.features), "norm": self.norm, "penalties": dict(self.penalties)}
+
+    @property
+    def key(self):
+        # Hashable identity, for caches of path results
+        return (tuple(self.features.items()), self.norm, tuple(self.penalties.items()))
+
+    @property
+    def is_metric(self):
+        # Every norm of non-negative per-feature distances, plus non-negative
+        # "values differ" penalties, obeys the triangle inequality
+        return all(c >= 0 for c in self.features.values()) and all(c >= 0 for c in self.penalties.values())
+
+    def compile(self, data, block_bytes=BLOCK_BYTES):
+        columns = [(feature_column(data, name), coefficient) for name, coefficient in self.features.items()]
+        categories = [(category_codes(data, field), penalty) for field, penalty in self.penalties.items()]
+        return WeightKernel(self, columns, categories, len(data), block_bytes)
+
+    def __eq__(self, other):
+        return isinstance(other, WeightSpec) and self.key == other.key
+
+    def __hash__(self):
+        return hash(self.key)
+
+    def __repr__(self):
+        return f"WeightSpec({self.features!r}, norm={self.norm!r}, penalties={self.penalties!r})"
+
+
+DEFAULT_WEIGHT_SPEC = WeightSpec({
+    "price": PRICE_WEIGHT,
+    "seller_rating": RATING_WEIGHT,
+    "delivery_days": DELIVERY_WEIGHT,
+})
+
+
+class WeightKernel:
+    """
+    A WeightSpec bound to the parsed feature arrays of one catalog.
+    block(start, stop) returns the (stop - start) x n weight matrix of a row
+    range, computed by broadcasting the rows' features against every product.
+    iter_blocks() walks all rows in blocks sized to stay under block_bytes.
+    """
+
+    def __init__(self, spec, columns, categories, n, block_bytes=BLOCK_BYTES):
+        self.spec = spec
+        self.columns = columns
+        self.categories = categories
+        self.n = n
+        self.block_bytes = block_bytes
+        # Result plus one scratch array, per row
+        self.block_rows = max(1, block_bytes // (2 * 8 * max(n, 1)))
+
+    def __len__(self):
+        return self.n
+
+    def patched(self, data, delta):
+        # Kernel for the catalog after `delta`; feature columns are patched row by row.
+        # Category codes are numbered per catalog, so those are recomputed (linear in n).
+        changed = [data[i] for i in delta.rows.tolist()]
+        columns = []
+        for name, (values, coefficient) in zip(self.spec.features, self.columns):
+            values = resized(values, delta.size)
+            values[delta.rows] = feature_column(changed, name)
+            columns.append((values, coefficient))
+        categories = [(category_codes(data, field), penalty) for field, penalty in self.spec.penalties.items()]
+        return WeightKernel(self.spec, columns, categories, delta.size, self.block_bytes)
+
+    @property
+    def key(self):
+        return self.spec.key
+
+    @property
+    def is_metric(self):
+        return self.spec.is_metric
+
+    def block(self, start, stop, cols=slice(None)):
+        # Terms are accumulated one feature at a time, so scratch memory is one block
+        # and the l1 sum adds terms in the same order as calculate_weight
+        norm = self.spec.norm
+        weights = None
+        for values, coefficient in self.columns:
+            term = np.abs(values[start:stop, None] - values[None, cols])
+            term *= coefficient
+            if norm == "l2":
+                term *= term
+            if weights is None:
+                weights = term
+            elif norm == "linf":
+                np.maximum(weights, term, out=weights)
+            else:
+                weights += term
+        if weights is None:
+            width = len(range(self.n)[cols])
+            weights = np.zeros((stop - start, width), dtype=np.float64)
+        elif norm == "l2":
+            np.sqrt(weights, out=weights)
+        for codes, penalty in self.categories:
+            weights += (codes[start:stop, None] != codes[None, cols]) * penalty
+        return weights
+
+    def iter_blocks(self):
+        # Yields (start, weight block) covering every row, block_rows rows at a time
+        for start in range(0, self.n, self.block_rows):
+            yield start, self.block(start, min(start + self.block_rows, self.n))
+
+    def weights_from(self, i):
+        return self.block(i, i + 1)[0]
+
+    def weight(self, i, j):
+        return float(self.block(i, i + 1, slice(j, j + 1))[0, 0])
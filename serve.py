@@ -0,0 +1,233 @@
+import argparse
+import gc
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+
+from werkzeug.serving import make_server
+
+from app import DATASET_PATH, app, catalog, warm_up
+from modules.shared_arrays import SharedArrays
+
+# Seconds between checks of the dataset file for changes
+RELOAD_CHECK_SECONDS = 1.0
+# Seconds workers get to finish their requests before they are killed
+STOP_TIMEOUT = 10.0
+LISTEN_BACKLOG = 128
+
+
+def memory_usage(pid):
+    # {"rss", "pss", "private"} in bytes from /proc/<pid>/smaps_rollup (Linux); {} elsewhere
+    usage = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                name, _, value = line.partition(":")
+                if name in ("Rss", "Pss", "Private_Clean", "Private_Dirty"):
+                    usage[name] = int(value.split()[0]) * 1024
+    except OSError:
+        return {}
+    return {"rss": usage["Rss"], "pss": usage["Pss"], "private": usage["Private_Clean"] + usage["Private_Dirty"]}
+
+
+class Generation:
+    # One catalog version's shared indexes and the workers forked from them
+    def __init__(self, snapshot, structures, arrays):
+        self.snapshot = snapshot
+        self.structures = structures
+        self.arrays = arrays
+        self.workers = set()
+
+
+class PreforkServer:
+    """
+    Multi-process deployment: the master loads the catalog, builds and warms
+    every index once, moves their NumPy arrays into one shared memory
+    segment and only then opens the listening socket and forks the workers.
+    Workers inherit the indexes and read the shared arrays in place, so a
+    worker costs little more than its own interpreter state. The master
+    replaces workers that die and, when the dataset file changes (or on
+    SIGHUP), builds the next generation and then retires the old workers.
+    SIGUSR1 prints the memory use of every process.
+
+    Workers do not reload the catalog themselves, and the product mutation
+    routes are disabled, since each worker would change only its own copy.
+    """
+
+    def __init__(self, host, port, workers):
+        self.host = host
+        self.port = port
+        self.worker_count = workers
+        self.generation = None
+        self.retiring = set()
+        self.listener = None
+        self.stopping = False
+        self.reload_requested = False
+
+    def _log(self, message):
+        print(f"[master {os.getpid()}] {message}", flush=True)
+
+    def _prepare(self, reload=False):
+        started = time.perf_counter()
+        snapshot = catalog.reload() if reload else catalog.snapshot()
+        structures = warm_up(snapshot)
+        arrays = SharedArrays().share(*structures)
+        self._log(f"catalog v{snapshot.version}: {len(snapshot.products)} products, indexes built in "
+                  f"{time.perf_counter() - started:.1f}s, {arrays.arrays} arrays "
+                  f"({arrays.nbytes / 2**20:.1f} MB) in shared memory")
+        return Generation(snapshot, structures, arrays)
+
+    def _listen(self):
+        family = socket.AF_INET6 if ":" in self.host else socket.AF_INET
+        listener = socket.socket(family, socket.SOCK_STREAM)
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        listener.bind((self.host, self.port))
+        listener.listen(LISTEN_BACKLOG)
+        listener.set_inheritable(True)
+        return listener
+
+    def _spawn(self, generation):
+        pid = os.fork()
+        if pid == 0:
+            self._serve()
+        generation.workers.add(pid)
+        return pid
+
+    def _serve(self):
+        # Worker process: serve until SIGTERM, letting running requests finish
+        try:
+            for sig in (signal.SIGINT, signal.SIGHUP, signal.SIGUSR1):
+                signal.signal(sig, signal.SIG_IGN)
+            server = make_server(self.host, self.port, app, threaded=True, fd=self.listener.fileno())
+            server.daemon_threads = False  # server_close() waits for running requests
+            signal.signal(signal.SIGTERM, lambda *_: threading.Thread(target=server.shutdown).start())
+            server.serve_forever()
+            server.server_close()
+        except BaseException as e:
+            print(f"[worker {os.getpid()}] {e!r}", file=sys.stderr, flush=True)
+            os._exit(1)
+        os._exit(0)
+
+    def _freeze(self):
+        # Objects the workers inherit go to the GC's permanent generation, so
+        # collections in the workers do not write to (and copy) their pages
+        gc.collect()
+        gc.freeze()
+
+    def _reap(self):
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            self.retiring.discard(pid)
+            if pid in self.generation.workers:
+                self.generation.workers.discard(pid)
+                if not self.stopping:
+                    self._log(f"worker {pid} exited with status {status}, starting a new one")
+                    self._log(f"started worker {self._spawn(self.generation)}")
+
+    def _dataset_changed(self):
+        try:
+            return os.path.getmtime(DATASET_PATH) != self.generation.snapshot.mtime
+        except OSError:
+            return False
+
+    def _reload(self):
+        self.reload_requested = False
+        old = self.generation
+        try:
+            self.generation = self._prepare(reload=True)
+        except Exception as e:
+            self._log(f"reload failed, keeping catalog v{old.snapshot.version}: {e}")
+            self.generation = old
+            return
+        # The old generation's objects are only needed by its workers, which have their own copies
+        old.snapshot = old.structures = None
+        gc.unfreeze()
+        gc.collect()
+        old.arrays.close()
+        self._freeze()
+        for _ in range(self.worker_count):
+            self._spawn(self.generation)
+        for pid in old.workers:
+            os.kill(pid, signal.SIGTERM)
+        self.retiring |= old.workers
+        self._log(f"serving catalog v{self.generation.snapshot.version}; "
+                  f"workers {sorted(self.generation.workers)}, retiring {sorted(old.workers)}")
+
+    def report(self):
+        for role, pids in (("master", [os.getpid()]), ("worker", sorted(self.generation.workers))):
+            for pid in pids:
+                usage = memory_usage(pid)
+                if usage:
+                    self._log(f"{role} {pid}: rss {usage['rss'] / 2**20:.1f} MB, pss {usage['pss'] / 2**20:.1f} MB, "
+                              f"private {usage['private'] / 2**20:.1f} MB")
+
+    def _stop(self):
+        pids = self.generation.workers | self.retiring
+        for pid in pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        deadline = time.monotonic() + STOP_TIMEOUT
+        while pids and time.monotonic() < deadline:
+            self._reap()
+            pids = self.generation.workers & pids | self.retiring
+            time.sleep(0.1)
+        for pid in pids:
+            os.kill(pid, signal.SIGKILL)
+        self.generation.arrays.close()
+
+    def run(self):
+        # Requests are only accepted once every index is built and shared
+        app.config["CATALOG_READ_ONLY"] = True
+        catalog.check_interval = float("inf")
+        self.generation = self._prepare()
+        self._freeze()
+        self.listener = self._listen()
+
+        def stop(*_):
+            self.stopping = True
+
+        def reload(*_):
+            self.reload_requested = True
+
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+        signal.signal(signal.SIGHUP, reload)
+        signal.signal(signal.SIGUSR1, lambda *_: self.report())
+
+        for _ in range(self.worker_count):
+            self._spawn(self.generation)
+        self._log(f"listening on http://{self.host}:{self.port} with workers {sorted(self.generation.workers)}")
+        last_check = time.monotonic()
+        while not self.stopping:
+            self._reap()
+            if time.monotonic() - last_check >= RELOAD_CHECK_SECONDS:
+                last_check = time.monotonic()
+                self.reload_requested = self.reload_requested or self._dataset_changed()
+            if self.reload_requested:
+                self._reload()
+            time.sleep(0.2)
+        self._log("shutting down")
+        self._stop()
+        self.listener.close()
+
+
+if __name__ == "__main__":
+    if not hasattr(os, "fork"):
+        print("The multi-process mode needs os.fork (Linux or macOS); use python app.py or asgi.py instead")
+        sys.exit(1)
+    parser = argparse.ArgumentParser(description="Serve CartIQ with pre-forked workers sharing one set of indexes")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+    PreforkServer(args.host, args.port, args.workers).run()
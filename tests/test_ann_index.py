@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+
+from benchmarks.generator import generate_products
+from modules.ann_index import IVFIndex, normalize_rows, random_preferences
+from modules.recommender_index import RecommenderIndex
+
+K = 10
+
+
+@pytest.fixture(scope="module")
+def catalog():
+    products = generate_products(3000, seed=11)
+    recommender = RecommenderIndex(products)
+    return products, recommender, IVFIndex.build(recommender.item_vectors())
+
+
+def _recall(catalog, nprobe, prefs):
+    # recall@K of recommend_nearest with the index against the exact ranking;
+    # an answer scoring at least the exact K-th score is a hit, so ties are not misses
+    products, recommender, ann = catalog
+    unit = normalize_rows(recommender.item_vectors())
+    row = {p["node_id"]: i for i, p in enumerate(products)}
+    hits = expected = 0
+    for pref in prefs:
+        query = normalize_rows(np.atleast_2d(recommender.user_vector(pref)))[0]
+        exact = [unit[row[p["node_id"]]] @ query for p in recommender.recommend_nearest(products, pref, top_n=K)]
+        approximate = [unit[row[p["node_id"]]] @ query
+                       for p in recommender.recommend_nearest(products, pref, top_n=K, ann=ann, nprobe=nprobe)]
+        assert len(approximate) == len(exact)
+        if exact:
+            hits += sum(score >= exact[-1] - 1e-6 for score in approximate)
+            expected += len(exact)
+    assert expected
+    return hits / expected
+
+
+def test_recall_against_exact_recommendations(catalog):
+    ann = catalog[2]
+    prefs = random_preferences(catalog[1], 150, seed=1)
+    recalls = [_recall(catalog, nprobe, prefs) for nprobe in (1, 2, ann.nprobe, ann.n_lists)]
+    assert recalls == sorted(recalls)
+    assert recalls[2] >= 0.95
+    # Probing every list is exact
+    assert recalls[-1] == 1.0
@@ -0,0 +1,38 @@
+import json
+
+import numpy as np
+
+from benchmarks.generator import generate_products
+from modules.binary_catalog import compile_catalog, load_catalog, mapped_column
+from modules.features import DERIVED_FEATURES, feature_column
+
+
+def _catalogs(tmp_path, products):
+    # (JSON catalog, compiled catalog) of the same products
+    source = tmp_path / "catalog.json"
+    source.write_text(json.dumps(products))
+    compiled = tmp_path / "catalog.bin"
+    compile_catalog(str(source), str(compiled))
+    return load_catalog(str(source)), load_catalog(str(compiled))
+
+
+def test_feature_columns_match_json(tmp_path):
+    products = generate_products(40, seed=3)
+    del products[0]["RAM"]
+    del products[1]["Screen Size"]
+    del products[2]["Storage"]
+    data, binary = _catalogs(tmp_path, products)
+    for name in list(DERIVED_FEATURES) + ["price", "seller_rating", "review_count"]:
+        np.testing.assert_array_equal(feature_column(binary, name), feature_column(data, name), err_msg=name)
+    assert feature_column(binary, "ram_gb")[0] == 0
+    assert feature_column(binary, "screen_inches")[1] == 0
+
+
+def test_mapped_column_missing_field(tmp_path):
+    products = generate_products(10, seed=4)
+    del products[0]["Processor"]
+    data, binary = _catalogs(tmp_path, products)
+    length = lambda value: -1 if value is None else len(value)
+    expected = mapped_column(data, "Processor", length)
+    np.testing.assert_array_equal(mapped_column(binary, "Processor", length), expected)
+    assert expected[0] == -1
@@ -0,0 +1,153 @@
+import json
+import random
+
+import numpy as np
+import pytest
+
+from app import (ann_index, facet_index, filter_index, match_index, product_graph, recommender_index,
+                 search_index, skyline_index)
+from benchmarks.generator import BRANDS, DELIVERY_TIMES, RAM_SIZES, SCREEN_SIZES, STORAGE_SIZES, generate_products
+from modules.catalog_store import CatalogSnapshot, CatalogStore
+from modules.graph_utils import dijkstra_implicit
+from modules.path_cache import ShortestPathCache
+from modules.product import load_product_records, product_record
+
+CATALOG_SIZE = 200
+BATCHES = 40
+
+FILTERS = [
+    {},
+    {"min_price": 800},
+    {"max_price": 1200, "min_rating": 3.5},
+    {"min_reviews": 500, "max_delivery_days": 5},
+]
+QUERIES = ["laptop", "model 3", "asus", "16gb", "apple mob", "ryzen 7", "13.3"]
+PREFERENCES = [
+    {"brand": "Asus"},
+    {"brand": ["HP", "Dell"], "RAM": 16},
+    {"RAM": 8, "price": 900},
+]
+SELECTIONS = [{}, {"brand": ["Apple", "HP"]}, {"RAM": ["16GB"], "price": ["500-1000", "2000+"]}]
+
+
+def _mutation(rng, snapshot, batch):
+    # One random mix of removals, updates and additions
+    node_ids = [p["node_id"] for p in snapshot.products]
+    chosen = rng.sample(node_ids, rng.randint(0, 6))
+    removed, touched = chosen[:rng.randint(0, 3)], chosen[3:]
+    updated = {}
+    for node in touched:
+        field = rng.choice(["price", "seller_rating", "brand", "RAM", "Storage", "delivery_time", "Screen Size"])
+        value = {
+            "price": round(rng.uniform(100, 2500), 2),
+            "seller_rating": round(rng.uniform(2.5, 5.0), 1),
+            "brand": rng.choice(BRANDS),
+            "RAM": rng.choice(RAM_SIZES),
+            "Storage": rng.choice(STORAGE_SIZES),
+            "delivery_time": rng.choice(DELIVERY_TIMES),
+            "Screen Size": rng.choice(SCREEN_SIZES + (None,)),
+        }[field]
+        updated[node] = {field: value}
+    added = []
+    for i, product in enumerate(generate_products(rng.randint(0, 3), seed=rng.randrange(1000))):
+        product["node_id"] = f"Added_{batch}_{i}"
+        product["product_name"] += f" Added {batch}"
+        added.append(product)
+    return added, updated, removed
+
+
+def _fresh(snapshot):
+    # A snapshot of the same products with nothing carried over
+    return CatalogSnapshot(list(snapshot.products), snapshot.version, snapshot.mtime, 0.0, 0)
+
+
+def _node_ids(products):
+    return [p["node_id"] for p in products]
+
+
+def _warm(snapshot):
+    # Builds every patched structure and fills the caches carried across versions
+    for build in (product_graph, filter_index, recommender_index, ann_index, search_index, skyline_index,
+                  facet_index, match_index):
+        build(snapshot)
+    snapshot.positions()
+    for filters in FILTERS:
+        skyline_index(snapshot).rank(filters, top_k=1000)
+    match_index(snapshot).groups()
+
+
+def _check(patched, fresh):
+    products = patched.products
+    assert patched.positions() == fresh.positions()
+
+    graph, fresh_graph = product_graph(patched), product_graph(fresh)
+    assert list(graph.node_ids) == list(fresh_graph.node_ids)
+    for i in range(len(products)):
+        np.testing.assert_array_equal(graph.weights_from(i), fresh_graph.weights_from(i))
+
+    for filters in FILTERS:
+        assert (_node_ids(filter_index(patched).filter(products, **filters))
+                == _node_ids(filter_index(fresh).filter(products, **filters))), filters
+        assert skyline_index(patched).rank(filters, top_k=1000) == skyline_index(fresh).rank(filters, top_k=1000)
+
+    recommender, fresh_recommender = recommender_index(patched), recommender_index(fresh)
+    np.testing.assert_allclose(recommender.item_vectors(), fresh_recommender.item_vectors(), atol=1e-6)
+    for prefs in PREFERENCES:
+        assert (_node_ids(recommender.recommend(products, prefs))
+                == _node_ids(fresh_recommender.recommend(products, prefs))), prefs
+
+    # Probing every list makes the ANN search exact, whatever the clustering
+    ann = ann_index(patched)
+    np.testing.assert_array_equal(np.sort(ann.ids), np.arange(len(products)))
+    for prefs in PREFERENCES:
+        assert (_node_ids(recommender.recommend_nearest(products, prefs, ann=ann, nprobe=ann.n_lists))
+                == _node_ids(fresh_recommender.recommend_nearest(products, prefs))), prefs
+
+    for query in QUERIES:
+        assert search_index(patched).search(query) == search_index(fresh).search(query), query
+
+    for selected in SELECTIONS:
+        assert facet_index(patched).counts(selected) == facet_index(fresh).counts(selected), selected
+
+    matches, fresh_matches = match_index(patched), match_index(fresh)
+    np.testing.assert_array_equal(matches.labels, fresh_matches.labels)
+    total, page = matches.comparisons(limit=1000)
+    fresh_total, fresh_page = fresh_matches.comparisons(limit=1000)
+    assert total == fresh_total
+    assert [(rows.tolist(), low, high) for rows, low, high in page] == \
+        [(rows.tolist(), low, high) for rows, low, high in fresh_page]
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_patched_indexes_match_fresh_builds(tmp_path, seed):
+    path = tmp_path / "catalog.json"
+    path.write_text(json.dumps(generate_products(CATALOG_SIZE, seed=seed)))
+    store = CatalogStore(str(path), loader=load_product_records, record=product_record,
+                         check_interval=float("inf"))
+    cache = ShortestPathCache()
+
+    @store.on_update
+    def carry_over(old, new, delta):
+        cache.carry_over(old.cached("graph"), new.cached("graph"), delta, old.version, new.version)
+
+    rng = random.Random(seed)
+    snapshot = store.snapshot()
+    for batch in range(BATCHES):
+        _warm(snapshot)
+        graph = product_graph(snapshot)
+        starts = rng.sample(list(graph.node_ids), 3)
+        for start in starts:
+            cache.tree(graph, start, snapshot.version)
+
+        added, updated, removed = _mutation(rng, snapshot, batch)
+        snapshot = store.apply(added=added, updated=updated, removed=removed)
+        _check(snapshot, _fresh(snapshot))
+
+        # Carried-over shortest-path trees are the trees of the new catalog
+        graph = product_graph(snapshot)
+        for start in starts:
+            if start in graph.index:
+                dist = cache.tree(graph, start, snapshot.version)[0]
+                np.testing.assert_allclose(dist, dijkstra_implicit(graph, graph.index[start])[0])
+    # Some trees survived a mutation rather than being recomputed
+    assert cache.hits > 0
@@ -0,0 +1,94 @@
+import json
+import random
+from bisect import bisect_right
+from collections import Counter
+
+import pytest
+
+from app import facet_index
+from benchmarks.generator import BRANDS, RAM_SIZES, generate_products
+from modules.catalog_store import CatalogStore
+from modules.facets import BUCKET_FACETS, VALUE_FACETS, _bucket_labels
+from modules.product import load_product_records, product_record
+
+FILTERS = [{}, {"min_price": 800}, {"max_price": 1500, "min_rating": 4.0}]
+SELECTIONS = [
+    {},
+    {"brand": ["Apple", "Nokia"]},
+    {"RAM": ["16GB", "64GB"], "price": ["500-1000", "2000+"]},
+    {"platform": ["Amazon"], "seller_rating": ["4-4.5", "4.5+"], "brand": ["HP", "Dell"]},
+]
+
+
+def _value(product, name):
+    if name in VALUE_FACETS:
+        value = product.get(name)
+        return value if isinstance(value, str) else None
+    column, bounds = BUCKET_FACETS[name]
+    bucket = bisect_right(bounds, product[column]) - 1
+    return _bucket_labels(bounds)[bucket] if bucket >= 0 else None
+
+
+def _naive(products, selected, filters):
+    # (total, {facet: Counter}) by looking at every product
+    def passes(product, exclude=None):
+        if product["price"] < filters.get("min_price", float("-inf")):
+            return False
+        if product["price"] > filters.get("max_price", float("inf")):
+            return False
+        if product["seller_rating"] < filters.get("min_rating", float("-inf")):
+            return False
+        return all(_value(product, name) in values for name, values in selected.items() if name != exclude)
+
+    total = sum(passes(p) for p in products)
+    counts = {}
+    for name in list(VALUE_FACETS) + list(BUCKET_FACETS):
+        exclude = name if name in selected else None
+        counts[name] = Counter(_value(p, name) for p in products if passes(p, exclude))
+        counts[name].pop(None, None)
+    return total, counts
+
+
+def _check(snapshot):
+    index = facet_index(snapshot)
+    products = snapshot.products
+    for filters in FILTERS:
+        for selected in SELECTIONS:
+            total, results = index.counts(selected, **filters)
+            naive_total, naive = _naive(products, selected, filters)
+            assert total == naive_total, (filters, selected)
+            for name, pairs in results.items():
+                assert {value: n for value, n in pairs if n} == naive[name], (name, filters, selected)
+                if name in VALUE_FACETS:
+                    # Values no product has any more are not listed
+                    assert {value for value, _ in pairs} == {_value(p, name) for p in products} - {None}
+
+
+@pytest.mark.parametrize("seed", [0, 1])
+def test_patched_counts_match_naive_counts(tmp_path, seed):
+    path = tmp_path / "catalog.json"
+    path.write_text(json.dumps(generate_products(150, seed=seed)))
+    store = CatalogStore(str(path), loader=load_product_records, record=product_record,
+                         check_interval=float("inf"))
+    rng = random.Random(seed)
+    snapshot = store.snapshot()
+    _check(snapshot)
+    for batch in range(15):
+        node_ids = [p["node_id"] for p in snapshot.products]
+        chosen = rng.sample(node_ids, 8)
+        removed, touched = chosen[:rng.randint(0, 3)], chosen[3:]
+        # New values ("Nokia", "64GB") and removed fields (None) as well as existing values
+        updated = {node: {"brand": rng.choice(BRANDS + ("Nokia",)),
+                          "RAM": rng.choice(RAM_SIZES + ("64GB", None)),
+                          "price": round(rng.uniform(100, 2500), 2)} for node in touched}
+        added = generate_products(rng.randint(0, 3), seed=100 + batch)
+        for i, product in enumerate(added):
+            product["node_id"] = f"Added_{batch}_{i}"
+        snapshot = store.apply(added=added, updated=updated, removed=removed)
+        _check(snapshot)
+
+    # Values the last products having them lose drop out of the counts
+    gone = {p["node_id"]: {"brand": "HP", "RAM": "8GB"} for p in snapshot.products
+            if p.get("brand") == "Nokia" or p.get("RAM") in ("64GB", None)}
+    assert gone
+    _check(store.apply(updated=gone))
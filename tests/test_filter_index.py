@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+
+from app import app
+from benchmarks.generator import generate_products
+from modules.filter_index import FilterIndex
+
+
+@pytest.fixture(scope="module")
+def index():
+    return FilterIndex(generate_products(300, seed=6))
+
+
+def test_string_bounds_match_numeric_bounds(index):
+    numeric = {"min_price": 500, "max_price": 1500.5, "min_rating": 3.5, "min_reviews": 100, "max_delivery_days": 4}
+    for name, value in numeric.items():
+        np.testing.assert_array_equal(index.select(**{name: str(value)}), index.select(**{name: value}), err_msg=name)
+        assert 0 < len(index.select(**{name: value})) < index.size, name
+    strings = {name: str(value) for name, value in numeric.items()}
+    np.testing.assert_array_equal(index.select(**strings), index.select(**numeric))
+
+
+@pytest.mark.parametrize("value", ["abc", "", True, [1], "nan"])
+def test_invalid_bounds_raise(index, value):
+    with pytest.raises(ValueError):
+        index.select(min_price=value)
+
+
+def test_filter_route_rejects_invalid_bounds():
+    client = app.test_client()
+    assert client.post("/filter", json={"min_price": "abc"}).status_code == 400
+    as_string = client.post("/filter", json={"max_delivery_days": "4"})
+    as_number = client.post("/filter", json={"max_delivery_days": 4})
+    assert as_string.status_code == as_number.status_code == 200
+    assert as_string.json == as_number.json
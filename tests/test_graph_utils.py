@@ -0,0 +1,50 @@
+import gc
+import weakref
+
+import numpy as np
+import pytest
+
+from benchmarks.generator import generate_products
+from modules import graph_utils
+from modules.dataset_to_graph_from_json import build_graph_from_data
+from modules.graph_utils import CompactGraph, all_pairs_matrix, batch_shortest_paths
+
+
+@pytest.fixture(scope="module")
+def knn_graph():
+    return build_graph_from_data(generate_products(60, seed=5), mode="knn", k=3)
+
+
+def test_direct_needs_metric_implicit_graph(knn_graph):
+    with pytest.raises(ValueError):
+        all_pairs_matrix(knn_graph, method="direct")
+
+
+def test_pool_matches_serial(knn_graph):
+    node_ids, serial = all_pairs_matrix(knn_graph, method="dijkstra", workers=1)
+    assert all_pairs_matrix(knn_graph, method="dijkstra", workers=2)[0] == node_ids
+    np.testing.assert_array_equal(all_pairs_matrix(knn_graph, method="dijkstra", workers=2)[1], serial)
+
+    compact = CompactGraph.from_product_graph(knn_graph)
+    pairs = [(node_ids[i], node_ids[(i * 7) % len(node_ids)]) for i in range(len(node_ids))]
+    assert batch_shortest_paths(compact, pairs, workers=2) == batch_shortest_paths(compact, pairs, workers=1)
+
+
+
+def _check_pool(graph):
+    node_ids = graph.node_ids
+    pairs = [(node_ids[i], node_ids[-1 - i]) for i in range(len(node_ids))]
+    assert batch_shortest_paths(graph, pairs, workers=2) == batch_shortest_paths(graph, pairs, workers=1)
+
+
+def test_pool_keeps_no_graph(knn_graph):
+    compact = CompactGraph.from_product_graph(knn_graph)
+    _check_pool(compact)
+    ref = weakref.ref(compact)
+    del compact
+    gc.collect()
+    assert ref() is None
+
+    # A later graph reuses the same pool
+    _check_pool(CompactGraph.from_product_graph(build_graph_from_data(generate_products(40, seed=6), mode="knn", k=3)))
+    assert list(graph_utils._pools) == [2]
@@ -0,0 +1,96 @@
+import random
+from itertools import combinations
+
+import numpy as np
+import pytest
+
+from benchmarks.generator import generate_products
+from modules.matching import BLOCK_FIELDS, MATCH_THRESHOLD, MATCH_WINDOW, MIN_COMPARED_FIELDS, SPEC_FIELDS, MatchIndex
+
+SPECS = {
+    "RAM": ("8GB", "16GB"),
+    "Storage": ("512GB",),
+    "Processor": ("Intel i7", "intel  I7"),
+    "Screen Size": ("15.6 inch", "16 inch", "14 inch"),
+}
+
+
+def _products(seed):
+    # Blocks of at most MATCH_WINDOW listings, from few spec values so that
+    # matches, near-matches and listings missing a spec are all common
+    rng = random.Random(seed)
+    products = []
+    for category in ("Laptop", "Mobile"):
+        for brand in ("HP", "Dell", "Asus"):
+            for i in range(rng.randint(1, MATCH_WINDOW)):
+                product = {"platform": rng.choice(["Amazon", "Flipkart"]), "category": category,
+                           "brand": rng.choice([brand, brand.lower(), f" {brand.upper()} "]),
+                           "price": round(rng.uniform(300, 2000), 2)}
+                for field, values in SPECS.items():
+                    if rng.random() > 0.2:
+                        product[field] = rng.choice(values)
+                products.append(product)
+    rng.shuffle(products)
+    return products
+
+
+def _block(product):
+    return tuple(" ".join(product[field].casefold().split()) for field in BLOCK_FIELDS)
+
+
+def _clusters(labels):
+    clusters = {}
+    for row, label in enumerate(labels.tolist()):
+        clusters.setdefault(label, set()).add(row)
+    return sorted(sorted(rows) for rows in clusters.values())
+
+
+def _brute_force(index, products):
+    # Scores every pair of a block. Complete listings are merged with all
+    # their matches; an incomplete one joins the cluster of its best complete match.
+    parent = list(range(len(products)))
+
+    def find(row):
+        while parent[row] != row:
+            row = parent[row]
+        return row
+
+    pairs = [(a, b) for a, b in combinations(range(len(products)), 2) if _block(products[a]) == _block(products[b])]
+    a, b = (np.array(side, dtype=np.int64) for side in zip(*pairs))
+    score, compared = index.similarity(a, b)
+    matched = (score >= MATCH_THRESHOLD) & (compared >= MIN_COMPARED_FIELDS)
+    complete = [all(field in p for field in SPEC_FIELDS) for p in products]
+
+    best = {}
+    for x, y, s, m in zip(a.tolist(), b.tolist(), score.tolist(), matched.tolist()):
+        if not m:
+            continue
+        if complete[x] and complete[y]:
+            parent[max(find(x), find(y))] = min(find(x), find(y))
+        elif complete[x] != complete[y]:
+            listing, match = (y, x) if complete[x] else (x, y)
+            if listing not in best or (-s, match) < (-best[listing][0], best[listing][1]):
+                best[listing] = (s, match)
+    labels = [find(row) for row in range(len(products))]
+    for listing, (_, match) in best.items():
+        labels[listing] = find(match)
+    return _clusters(np.array(labels))
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_clusters_match_brute_force_within_small_blocks(seed):
+    # A block no larger than the window is compared pair by pair, so blocking must lose nothing
+    products = _products(seed)
+    index = MatchIndex(products)
+    assert _clusters(index.labels) == _brute_force(index, products)
+
+
+def test_clusters_stay_within_matching_components():
+    # In larger blocks only sorted neighbours are compared: every cluster must
+    # still be connected by matches, and every listing labelled by its first member
+    products = generate_products(600, seed=3)
+    index = MatchIndex(products)
+    components = {row: i for i, rows in enumerate(_brute_force(index, products)) for row in rows}
+    for rows in _clusters(index.labels):
+        assert len({components[row] for row in rows}) == 1
+        assert (index.labels[rows] == rows[0]).all()
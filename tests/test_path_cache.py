@@ -0,0 +1,98 @@
+import json
+
+import numpy as np
+import pytest
+
+from app import product_graph
+from benchmarks.generator import generate_products
+from modules.catalog_store import CatalogStore
+from modules.dataset_to_graph_from_json import build_graph_from_data
+from modules.graph_utils import CompactGraph, dijkstra_compact
+from modules.path_cache import ShortestPathCache
+from modules.product import load_product_records, product_record
+
+
+@pytest.fixture(scope="module")
+def graph():
+    return CompactGraph.from_product_graph(build_graph_from_data(generate_products(60, seed=8), mode="knn", k=3))
+
+
+def _tree_bytes(graph, start):
+    # Size one cached tree is accounted at
+    probe = ShortestPathCache()
+    probe.tree(graph, start, 1)
+    return probe.bytes
+
+
+def test_hits_and_misses(graph):
+    cache = ShortestPathCache()
+    a, b = graph.node_ids[:2]
+    dist = cache.tree(graph, a, 1)[0]
+    np.testing.assert_allclose(dist, dijkstra_compact(graph, graph.index[a])[0])
+    cache.tree(graph, a, 1)
+    path, cost, hit = cache.shortest_path(graph, a, b, 1)
+    assert hit and path[0] == a and path[-1] == b and cost == dist[graph.index[b]]
+    cache.tree(graph, b, 1)
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (2, 2, 2)
+
+
+def test_lru_byte_eviction(graph):
+    a, b, c = graph.node_ids[:3]
+    size = _tree_bytes(graph, a)
+    cache = ShortestPathCache(max_bytes=2 * size + size // 2)
+    cache.tree(graph, a, 1)
+    cache.tree(graph, b, 1)
+    cache.tree(graph, a, 1)  # a is now the most recently used
+    cache.tree(graph, c, 1)  # evicts b
+    assert cache.evictions == 1 and cache.bytes <= cache.max_bytes
+    hits = cache.hits
+    cache.tree(graph, a, 1)
+    assert cache.hits == hits + 1
+    cache.tree(graph, b, 1)
+    assert cache.hits == hits + 1
+
+
+def test_versions(graph):
+    cache = ShortestPathCache()
+    a, b = graph.node_ids[:2]
+    cache.tree(graph, a, 1)
+    cache.tree(graph, a, 2)  # a newer version drops version 1's trees
+    assert cache.stats()["entries"] == 1 and cache.misses == 2
+
+    # A request on an older snapshot is computed without caching or evicting anything
+    cache.tree(graph, a, 1)
+    cache.tree(graph, b, 1)
+    assert cache.stats()["entries"] == 1 and cache.hits == 0
+    cache.tree(graph, a, 2)
+    assert cache.hits == 1
+
+
+def test_carry_over(tmp_path):
+    path = tmp_path / "catalog.json"
+    path.write_text(json.dumps(generate_products(40, seed=9)))
+    store = CatalogStore(str(path), loader=load_product_records, record=product_record, check_interval=float("inf"))
+    cache = ShortestPathCache()
+    kept = []
+
+    @store.on_update
+    def carry_over(old, new, delta):
+        kept.append(cache.carry_over(product_graph(old), product_graph(new), delta, old.version, new.version))
+
+    snapshot = store.snapshot()
+    graph = product_graph(snapshot)
+    start, leaf = graph.node_ids[0], graph.node_ids[5]
+    cache.tree(graph, start, snapshot.version)
+
+    # Updating a leaf of the tree keeps it, re-attached in the new catalog
+    snapshot = store.apply(updated={leaf: {"price": 999.0}})
+    graph = product_graph(snapshot)
+    assert kept[-1] == 1
+    dist = cache.tree(graph, start, snapshot.version)[0]
+    assert cache.hits == 1
+    np.testing.assert_allclose(dist, graph.weights_from(graph.index[start]))
+
+    # Updating the start node drops it
+    snapshot = store.apply(updated={start: {"price": 10.0}})
+    assert kept[-1] == 0
+    assert cache.stats()["entries"] == 0
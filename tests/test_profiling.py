@@ -0,0 +1,37 @@
+import threading
+
+import pytest
+
+import app as app_module
+from app import app
+
+
+def _profiler_threads():
+    return [t for t in threading.enumerate() if t.name == "cartiq-profiler"]
+
+
+@pytest.fixture
+def profiling(monkeypatch, tmp_path):
+    monkeypatch.setattr(app_module, "PROFILING_ENABLED", True)
+    monkeypatch.setattr(app_module, "PROFILE_DIR", str(tmp_path))
+    return tmp_path
+
+
+def test_profile_written_for_request(profiling):
+    response = app.test_client().get("/catalog", headers={"X-Profile": "1"})
+    assert response.status_code == 200
+    assert response.headers["X-Profile-File"].startswith(str(profiling))
+    assert not _profiler_threads()
+
+
+def test_profiler_stopped_on_unhandled_exception(profiling, monkeypatch):
+    def fail():
+        raise RuntimeError("boom")
+
+    # after_request is skipped when the exception propagates; teardown_request is not
+    monkeypatch.setitem(app.view_functions, "catalog_stats", fail)
+    monkeypatch.setitem(app.config, "PROPAGATE_EXCEPTIONS", True)
+    with pytest.raises(RuntimeError):
+        app.test_client().get("/catalog", headers={"X-Profile": "1"})
+    assert not _profiler_threads()
+    assert len(list(profiling.glob("*catalog*.folded"))) == 1
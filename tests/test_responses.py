@@ -0,0 +1,40 @@
+import pytest
+
+from app import app
+from modules.responses import StaleCursor, decode_cursor, encode_cursor
+
+QUERY = "/filter?min_price=800&limit=5&fields=node_id,price"
+
+
+def test_conditional_get_filter():
+    client = app.test_client()
+    first = client.get(QUERY)
+    assert first.status_code == 200
+    assert [sorted(p) for p in first.json] == [["node_id", "price"]] * 5
+    tag = first.headers["ETag"]
+    assert client.get(QUERY, headers={"If-None-Match": tag}).status_code == 304
+    # If-None-Match compares weakly
+    assert client.get(QUERY, headers={"If-None-Match": f"W/{tag}"}).status_code == 304
+    assert client.get(QUERY, headers={"If-None-Match": '"other"'}).status_code == 200
+
+
+def test_conditional_post_is_precondition_failed():
+    client = app.test_client()
+    body = {"query": "laptop", "limit": 3}
+    tag = client.post("/search", json=body).headers["ETag"]
+    assert client.post("/search", json=body, headers={"If-None-Match": tag}).status_code == 412
+
+
+def test_cursor_pages_and_catalog_version():
+    client = app.test_client()
+    first = client.get("/search?query=laptop&limit=3")
+    second = client.get(f"/search?query=laptop&limit=3&cursor={first.headers['X-Next-Cursor']}")
+    assert second.status_code == 200
+    assert not {p["node_id"] for p in first.json} & {p["node_id"] for p in second.json}
+
+    cursor = encode_cursor("key", 20, version=4)
+    assert decode_cursor(cursor, "key", 4) == 20
+    with pytest.raises(StaleCursor):
+        decode_cursor(cursor, "key", 5)
+    with pytest.raises(ValueError):
+        decode_cursor(cursor, "other", 4)
@@ -0,0 +1,66 @@
+import json
+
+import pytest
+
+from app import MAX_PER_PAGE, app, search_index
+from benchmarks.generator import generate_products
+from modules.catalog_store import CatalogStore
+from modules.product import load_product_records, product_record
+from modules.search_index import SearchIndex
+
+QUERIES = ["laptop", "model 1", "asus", "16gb", "apple mob", "ryzen"]
+
+
+@pytest.mark.parametrize("page, per_page", [("x", 10), (1, 0), (1, -5), (0, 10), (2.5, 3), (1, MAX_PER_PAGE + 1)])
+def test_search_rejects_invalid_pages(page, per_page):
+    response = app.test_client().post("/search", json={"query": "laptop", "page": page, "per_page": per_page})
+    assert response.status_code == 400
+
+
+def test_search_pages():
+    client = app.test_client()
+    first = client.post("/search", json={"query": "laptop", "page": 1, "per_page": 4})
+    second = client.post("/search", json={"query": "laptop", "page": "2", "per_page": "4"})
+    both = client.post("/search", json={"query": "laptop", "page": 1, "per_page": 8})
+    assert first.json + second.json == both.json
+
+
+def _postings(index):
+    # Plain copy of every posting list, to compare an index before and after
+    return ({token: {c: dict(posting) for c, posting in chunks.items()} for token, chunks in index.postings.items()},
+            {gram: {c: set(docs) for c, docs in chunks.items()} for gram, chunks in index.gram_postings.items()})
+
+
+def test_patched_leaves_the_old_version_unchanged(tmp_path):
+    # Every product id is below 2**CHUNK_BITS, so all of them share posting chunks
+    path = tmp_path / "catalog.json"
+    path.write_text(json.dumps(generate_products(50, seed=7)))
+    store = CatalogStore(str(path), loader=load_product_records, record=product_record, check_interval=float("inf"))
+    old = store.snapshot()
+    old_index = search_index(old)
+    before = _postings(old_index)
+    results = {query: old_index.search(query) for query in QUERIES}
+
+    removed = [old.products[3]["node_id"], old.products[10]["node_id"]]
+    updated = {old.products[5]["node_id"]: {"brand": "Zenith", "product_name": "Zenith Tablet"}}
+    new = store.apply(removed=removed, updated=updated)
+    new_index = search_index(new)
+    assert new_index is not old_index
+
+    assert _postings(old_index) == before
+    assert {query: old_index.search(query) for query in QUERIES} == results
+    assert new_index.search("zenith")[1] == 1
+    assert old_index.search("zenith")[1] == 0
+    assert _postings(new_index) == _postings(SearchIndex(new.products))
+
+
+def test_substring_hits_rank_ahead_of_token_hits():
+    products = [
+        # Matches "pro max" only by tokens, many times over
+        {"node_id": "a", "product_name": "Max", "brand": "Pro", "category": "Phone", "Processor": "Pro Max Pro Max"},
+        {"node_id": "b", "product_name": "Phone Pro Maxima Edition Large", "brand": "Acme", "category": "Phone"},
+        {"node_id": "c", "product_name": "Tablet", "brand": "Acme", "category": "Tablet"},
+    ]
+    index = SearchIndex(products)
+    assert index._token_matches(["pro", "max"])[0] > index._token_matches(["pro", "max"])[1]
+    assert index.search("pro max") == ([1, 0], 2)
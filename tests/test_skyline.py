@@ -0,0 +1,31 @@
+import numpy as np
+import pytest
+
+from modules.skyline import _dominates, pareto_frontier
+
+
+def _brute_force(price, rating, delivery, rows):
+    return np.array([row for row in rows
+                     if not _dominates(price[rows], rating[rows], delivery[rows],
+                                       price[row], rating[row], delivery[row]).any()], dtype=np.int64)
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_frontier_matches_brute_force(seed):
+    rng = np.random.default_rng(seed)
+    n = int(rng.integers(1, 300))
+    # Few distinct values on every axis, so ties and duplicate products are common
+    price = rng.integers(1, 12, n).astype(np.float64) * 100
+    rating = rng.integers(30, 50, n) / 10
+    delivery = rng.integers(1, 8, n).astype(np.float64)
+    rows = np.sort(rng.choice(n, size=int(rng.integers(1, n + 1)), replace=False))
+    np.testing.assert_array_equal(pareto_frontier(price, rating, delivery, rows),
+                                  _brute_force(price, rating, delivery, rows))
+
+
+def test_equal_products_are_kept_together():
+    price = np.array([100.0, 100.0, 200.0, 100.0])
+    rating = np.array([4.5, 4.5, 4.5, 4.0])
+    delivery = np.array([3.0, 3.0, 3.0, 3.0])
+    np.testing.assert_array_equal(pareto_frontier(price, rating, delivery, np.arange(4)), [0, 1])
+    assert len(pareto_frontier(price, rating, delivery, [])) == 0